@@ -0,0 +1,298 @@
+"""
+    Backtesting trading rules over a stock's whole history at once.
+
+    A rule is expressed as signals: one target position for each day of a
+    stock's TradingColumns (for example 1 to hold one unit, 0 to hold none
+    and -1 to be short one unit), decided with the data up to that day's
+    close. A signal is filled either at the next day's open or at the same
+    day's close. Positions, trades, cash and equity are then found for the
+    whole history with built-in functions over the columns, rather than by
+    stepping through the days.
+"""
+from array import array
+from itertools import accumulate, chain, compress, repeat
+from operator import add, gt, mul, neg, sub, truediv
+
+from stocks import decode_date, encode_date
+
+NEXT_OPEN = "next open"
+CLOSE = "close"
+FILLS = (NEXT_OPEN, CLOSE)
+
+
+class Trade(object):
+    """A change in position in one stock."""
+
+    __slots__ = ("_code", "_date", "_quantity", "_price", "_fee")
+
+    def __init__(self, code, date, quantity, price, fee):
+        """
+        Parameters:
+            code (str): Stock market code.
+            date (str): Date in yyyymmdd format of the fill.
+            quantity (float): Units bought, or sold if negative.
+            price (float): Price of each unit.
+            fee (float): Fee paid for the trade.
+        """
+        self._code = code
+        self._date = date
+        self._quantity = quantity
+        self._price = price
+        self._fee = fee
+
+    def get_code(self):
+        """(str) Stock market code of the stock traded."""
+        return self._code
+
+    def get_date(self):
+        """(str) Date of the fill."""
+        return self._date
+
+    def get_quantity(self):
+        """(float) Units bought, or sold if negative."""
+        return self._quantity
+
+    def get_price(self):
+        """(float) Price of each unit."""
+        return self._price
+
+    def get_fee(self):
+        """(float) Fee paid for the trade."""
+        return self._fee
+
+    def __repr__(self):
+        return "Trade({0!r}, {1!r}, {2!r}, {3!r}, {4!r})".format(
+            self._code, self._date, self._quantity, self._price, self._fee)
+
+
+class BacktestResult(object):
+    """Positions, equity and trades of a rule applied to one stock."""
+
+    def __init__(self, code, dates, positions, equity, trades):
+        """
+        Parameters:
+            code (str): Stock market code.
+            dates (array<int>): Encoded date of each day.
+            positions (array<float>): Units held at each day's close.
+            equity (array<float>): Cash plus the value of the position at
+                                   each day's close, starting from no cash.
+            trades (list<Trade>): Every trade, in date order.
+        """
+        self._code = code
+        self._dates = dates
+        self._positions = positions
+        self._equity = equity
+        self._trades = trades
+
+    def get_code(self):
+        """(str) Stock market code of the stock tested."""
+        return self._code
+
+    def get_dates(self):
+        """(array<int>) Encoded date of each day."""
+        return self._dates
+
+    def get_positions(self):
+        """(array<float>) Units held at each day's close."""
+        return self._positions
+
+    def get_equity(self):
+        """(array<float>) Profit or loss so far at each day's close."""
+        return self._equity
+
+    def get_trades(self):
+        """(list<Trade>) Every trade, in date order."""
+        return self._trades
+
+    def get_profit(self):
+        """(float) Profit or loss at the last day's close."""
+        return self._equity[-1] if len(self._equity) else 0.0
+
+
+def _check_signals(columns, signals):
+    """Raise ValueError unless there is one signal for each day."""
+    if len(signals) != len(columns):
+        raise ValueError("Expected {0} signals, got {1}"
+                         .format(len(columns), len(signals)))
+
+
+def gap_up_signals(columns, delta):
+    """Hold one unit on each day that opened more than 'delta' above the
+    previous day's close, as GapUp finds.
+
+    Parameters:
+        columns (TradingColumns): Trading data in date order.
+        delta (float): Smallest price difference considered significant.
+
+    Return:
+        array<float>: 1.0 on gap up days, otherwise 0.0.
+    """
+    opens = columns.get_column("open")
+    closes = columns.get_column("close")
+    gaps = map(sub, opens[1:], closes[:-1])
+    return array("d", chain([0.0] if len(opens) else [],
+                            map(float, map(gt, gaps, repeat(delta)))))
+
+
+def moving_averages(closes, num_days):
+    """Average closing price over the last 'num_days' days at each day.
+
+    Parameters:
+        closes (array<float>): Closing prices in date order.
+        num_days (int): The number of days over which to average.
+
+    Return:
+        array<float>: One average for each day from day 'num_days' - 1 on.
+    """
+    totals = array("d", accumulate(closes, initial=0.0))
+    return array("d", map(truediv, map(sub, totals[num_days:], totals),
+                          repeat(num_days)))
+
+
+def crossover_signals(columns, fast, slow):
+    """Hold one unit while the fast moving average of the closing price is
+    above the slow moving average.
+
+    Parameters:
+        columns (TradingColumns): Trading data in date order.
+        fast (int): Number of days in the fast average.
+        slow (int): Number of days in the slow average.
+
+    Return:
+        array<float>: 1.0 on days the fast average is higher, otherwise 0.0
+                      (including days before there are 'slow' days).
+    """
+    closes = columns.get_column("close")
+    longest = max(fast, slow)
+    if len(closes) < longest:
+        return array("d", repeat(0.0, len(closes)))
+    # Both averages start from the first day with 'longest' days.
+    fast_averages = moving_averages(closes, fast)[longest - fast:]
+    slow_averages = moving_averages(closes, slow)[longest - slow:]
+    return array("d", chain(repeat(0.0, longest - 1),
+                            map(float, map(gt, fast_averages,
+                                           slow_averages))))
+
+
+def analyser_signals(columns, make_analyser, signal):
+    """Derive signals from an Analyser's result after each day.
+
+    This steps through the days, so it is slower than the column based
+    signal functions, but works with any analyser.
+
+    Parameters:
+        columns (TradingColumns): Trading data in date order.
+        make_analyser (callable): Creates the Analyser.
+        signal (callable): Given the analyser's result and the day, returns
+                           the target position.
+
+    Return:
+        array<float>: The signal for each day.
+    """
+    analyser = make_analyser()
+    signals = array("d")
+    for day in columns:
+        analyser.process(day)
+        signals.append(signal(analyser.result(), day))
+    return signals
+
+
+def backtest(columns, signals, code="", fill=NEXT_OPEN, fee=0.0,
+             quantity=1.0):
+    """Simulate trading one stock by its signals.
+
+    Parameters:
+        columns (TradingColumns): Trading data in date order.
+        signals (array<float>): Target position for each day.
+        code (str): Stock market code, recorded in the trades.
+        fill (str): NEXT_OPEN to fill each signal at the next day's open (a
+                    signal on the last day is not filled), or CLOSE to fill
+                    it at the same day's close.
+        fee (float): Fee as a fraction of the value of each trade.
+        quantity (float): Units traded for a signal of 1.
+
+    Return:
+        BacktestResult: The positions, equity and trades.
+    """
+    if fill not in FILLS:
+        raise ValueError("fill must be one of {0}".format(", ".join(FILLS)))
+    _check_signals(columns, signals)
+    dates = columns.get_column("date")
+    closes = columns.get_column("close")
+    if fill == NEXT_OPEN:
+        prices = columns.get_column("open")
+        targets = chain([0.0], signals[:-1]) if len(signals) else []
+    else:
+        prices = closes
+        targets = signals
+    positions = array("d", map(mul, targets, repeat(quantity)))
+    trades = array("d", map(sub, positions, chain([0.0], positions)))
+    values = array("d", map(mul, trades, prices))
+    fees = array("d", map(mul, map(abs, values), repeat(fee)))
+    cash = accumulate(map(neg, map(add, values, fees)))
+    equity = array("d", map(add, cash, map(mul, positions, closes)))
+    trade_log = [Trade(code, decode_date(dates[index]), trades[index],
+                       prices[index], fees[index])
+                 for index in compress(range(len(trades)), trades)]
+    return BacktestResult(code, dates, positions, equity, trade_log)
+
+
+def backtest_collection(stocks, make_signals, fill=NEXT_OPEN, fee=0.0,
+                        quantity=1.0, codes=None, start=None, end=None):
+    """Simulate trading every stock in a collection by the same rule.
+
+    Parameters:
+        stocks (StockCollection): The stocks to trade.
+        make_signals (callable): Given a stock's TradingColumns, returns its
+                                 signals, e.g. functools.partial(
+                                 gap_up_signals, delta=0.01).
+        fill (str): NEXT_OPEN or CLOSE (see 'backtest').
+        fee (float): Fee as a fraction of the value of each trade.
+        quantity (float): Units traded for a signal of 1.
+        codes (list<str>): Codes of the stocks to trade. Defaults to every
+                           stock in the collection.
+        start (str): If given, only days on or after this date are used.
+        end (str): If given, only days on or before this date are used.
+
+    Return:
+        dict<str, BacktestResult>: Result for each stock code.
+    """
+    if codes is None:
+        codes = stocks.get_stock_codes()
+    first = None if start is None else encode_date(start)
+    last = None if end is None else encode_date(end)
+    results = {}
+    for code in codes:
+        columns = stocks.get_stock(code).get_columns()
+        low, high = columns.find_range(first, last)
+        if low != 0 or high != len(columns):
+            columns = columns.get_slice(low, high)
+        results[code] = backtest(columns, make_signals(columns), code, fill,
+                                 fee, quantity)
+    return results
+
+
+def portfolio_equity(results):
+    """Combine the equity of several backtests on the dates of any of them.
+
+    A stock's equity on a date it did not trade is its equity at its
+    previous trading day (0 before its first day).
+
+    Parameters:
+        results (iterable<BacktestResult>): The backtests to combine.
+
+    Return:
+        tuple: The dates, in yyyymmdd format, and the total equity on each.
+    """
+    results = list(results)
+    dates = sorted(set().union(*(result.get_dates() for result in results)))
+    position = {date: index for index, date in enumerate(dates)}
+    # Changes in equity on each date, accumulated into the total.
+    changes = [0.0] * len(dates)
+    for result in results:
+        previous = 0.0
+        for date, equity in zip(result.get_dates(), result.get_equity()):
+            changes[position[date]] += equity - previous
+            previous = equity
+    return ([decode_date(date) for date in dates],
+            array("d", accumulate(changes)))
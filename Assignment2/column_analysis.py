@@ -0,0 +1,158 @@
+"""
+    Analysis of a stock's whole trading history at once.
+
+    A ColumnAnalyser works on TradingColumns rather than one TradingData at
+    a time, using built-in functions that loop over a whole column in C.
+    Stock.analyse_columns passes a stock's columns directly. Column
+    analysers are also ordinary Analysers, collecting days into columns as
+    they are processed, so they can be used anywhere an Analyser can.
+
+    ColumnAverageVolume, ColumnHighLow, ColumnMovingAverage and ColumnGapUp
+    give the same results as AverageVolume, HighLow, MovingAverage and GapUp.
+"""
+from itertools import chain, repeat
+
+from stocks import Analyser, TradingColumns, TradingDataView
+
+
+class ColumnAnalyser(Analyser):
+    """Abstract class for analysis of a stock's trading data as columns."""
+
+    def __init__(self):
+        self._columns = TradingColumns()
+        # True while '_columns' belongs to a stock and must not be changed.
+        self._shared = False
+
+    def process(self, day):
+        """Collect one day of trading data into the columns.
+
+        Parameters:
+            day (TradingData): Trading data for one stock on one day.
+        """
+        if self._shared:
+            self._columns = self._columns.copy()
+            self._shared = False
+        self._columns.append_day(day)
+
+    def process_columns(self, columns):
+        """Collect many days of trading data at once.
+
+        Parameters:
+            columns (TradingColumns): Trading data in date order. It is not
+                                      modified by the analyser.
+        """
+        if len(self._columns):
+            if self._shared:
+                self._columns = self._columns.copy()
+                self._shared = False
+            self._columns.extend(columns)
+        else:
+            self._columns = columns
+            self._shared = True
+
+    def reset(self):
+        """Reset the analysis process in order to perform a new analysis."""
+        self._columns = TradingColumns()
+        self._shared = False
+
+    def result(self):
+        """Return the result of analysing all of the collected days."""
+        return self.analyse_columns(self._columns)
+
+    def analyse_columns(self, columns):
+        """Abstract method analysing a stock's trading data.
+
+        Parameters:
+            columns (TradingColumns): Trading data in date order.
+
+        Return:
+            None: Subclasses will return result of the analysis.
+        """
+        raise NotImplementedError()
+
+
+class ColumnAverageVolume(ColumnAnalyser):
+    """Determine the average trading volume for a single stock."""
+
+    def analyse_columns(self, columns):
+        """Return the average trading volume.
+
+        Return:
+            int: Average volume of trades across all days.
+        """
+        volumes = columns.get_column("volume")
+        return sum(volumes) // len(volumes)
+
+
+class ColumnHighLow(ColumnAnalyser):
+    """Determines the highest and lowest prices paid for a stock."""
+
+    def analyse_columns(self, columns):
+        """Return the highest and lowest prices paid for a stock.
+
+        Return:
+            tuple: the high value and then the low value.
+        """
+        if not len(columns):
+            return None, None
+        return max(columns.get_column("high")), min(columns.get_column("low"))
+
+
+class ColumnMovingAverage(ColumnAnalyser):
+    """Calculates the average closing price of a stock over the last days."""
+
+    def __init__(self, num_days):
+        """
+        Parameters:
+            num_days (int): The number of days over which to calculate the
+                            average.
+        """
+        super().__init__()
+        self._num_days = num_days
+
+    def analyse_columns(self, columns):
+        """Return the average closing price over the last num_days.
+
+        As with MovingAverage, if there are fewer than num_days days the
+        missing days are treated as having the first day's closing price.
+
+        Return:
+            float: Average closing price over the last num_days.
+        """
+        closes = columns.get_column("close")
+        if not len(closes):
+            return 0.0
+        missing = self._num_days - len(closes)
+        if missing > 0:
+            return sum(chain(repeat(closes[0], missing), closes)) \
+                / self._num_days
+        return sum(closes[-self._num_days:]) / self._num_days
+
+
+class ColumnGapUp(ColumnAnalyser):
+    """Finds the most recent day where the stock opened more than delta
+       above the previous day's closing price."""
+
+    def __init__(self, delta):
+        """
+        Parameters:
+            delta (float): Smallest price difference considered significant.
+        """
+        super().__init__()
+        self._delta = delta
+
+    def analyse_columns(self, columns):
+        """Return the most recent gap up day.
+
+        Searches backwards from the last day, so stops at the first match.
+
+        Return:
+            TradingDataView: The day found, or None.
+        """
+        opens = columns.get_column("open")
+        closes = columns.get_column("close")
+        delta = self._delta
+        for index in range(len(opens) - 1, 0, -1):
+            if opens[index] - closes[index - 1] > delta:
+                return TradingDataView(columns, index)
+        return None
@@ -0,0 +1,259 @@
+"""
+    Covariance and correlation of daily returns across many stocks.
+
+    Each stock's closing prices are aligned on a common axis of every date
+    any of the stocks traded, with NaN for days a stock did not trade. Daily
+    returns are then found, and missing days handled, in one of three ways:
+
+        FILL      A missing close is taken to be the previous close (a
+                  return of 0). Before a stock first trades, its pairs
+                  use the dates on which both stocks have a return.
+        DROP      Only dates on which every stock has a return are used.
+        PAIRWISE  Each pair of stocks uses the dates on which both have a
+                  return.
+
+    Statistics for each pair are dot products over whole return series
+    using built-in functions; series without gaps are centred only once.
+    Matrices are computed a block of rows and columns at a time, and
+    'ReturnMatrix.iter_blocks' yields the blocks one by one for universes
+    whose full matrix does not fit in memory.
+"""
+from array import array
+from itertools import compress, repeat
+from math import isnan, nan, sqrt
+from operator import and_, eq, mul, sub, truediv
+
+from stocks import decode_date, encode_date
+
+FILL = "fill"
+DROP = "drop"
+PAIRWISE = "pairwise"
+MISSING_POLICIES = (FILL, DROP, PAIRWISE)
+
+COVARIANCE = "covariance"
+CORRELATION = "correlation"
+
+# Number of stocks in each block of rows and columns of a matrix.
+BLOCK_SIZE = 256
+
+
+def align_closes(stocks, codes=None, start=None, end=None):
+    """Align stocks' closing prices on the dates that any of them traded.
+
+    Parameters:
+        stocks (StockCollection): The stocks.
+        codes (list<str>): Codes of the stocks to align. Defaults to every
+                           stock in the collection.
+        start (str): If given, only days on or after this date are used.
+        end (str): If given, only days on or before this date are used.
+
+    Return:
+        tuple: The encoded dates (array), the stock codes (list) and each
+               stock's closing prices on those dates (list of arrays), with
+               NaN where a stock did not trade or closed at zero.
+    """
+    if codes is None:
+        codes = stocks.get_stock_codes()
+    first = None if start is None else encode_date(start)
+    last = None if end is None else encode_date(end)
+    all_columns = []
+    for code in codes:
+        columns = stocks.get_stock(code).get_columns()
+        low, high = columns.find_range(first, last)
+        all_columns.append((columns.get_column("date")[low:high],
+                            columns.get_column("close")[low:high]))
+    dates = array("i", sorted(set().union(
+        *(stock_dates for stock_dates, _ in all_columns))))
+    position = {date: index for index, date in enumerate(dates)}
+    all_closes = []
+    for stock_dates, stock_closes in all_columns:
+        closes = array("d", repeat(nan, len(dates)))
+        for date, close in zip(stock_dates, stock_closes):
+            if close > 0:
+                closes[position[date]] = close
+        all_closes.append(closes)
+    return dates, list(codes), all_closes
+
+
+def _fill_forward(closes):
+    """Return a copy of 'closes' with each NaN replaced by the last close."""
+    filled = array("d", closes)
+    previous = nan
+    for index, close in enumerate(filled):
+        if isnan(close):
+            filled[index] = previous
+        else:
+            previous = close
+    return filled
+
+
+def _returns(closes):
+    """Daily returns of a close series; NaN where either close is NaN."""
+    returns = array("d", map(truediv, closes[1:], closes[:-1]))
+    return array("d", map(sub, returns, repeat(1.0)))
+
+
+class ReturnMatrix(object):
+    """Daily returns of many stocks, for finding covariance and correlation."""
+
+    def __init__(self, stocks, codes=None, start=None, end=None,
+                 missing=FILL):
+        """
+        Parameters:
+            stocks (StockCollection): The stocks.
+            codes (list<str>): Codes of the stocks to use, in matrix order.
+                               Defaults to every stock in the collection.
+            start (str): If given, only days on or after this date are used.
+            end (str): If given, only days on or before this date are used.
+            missing (str): One of MISSING_POLICIES.
+        """
+        if missing not in MISSING_POLICIES:
+            raise ValueError("missing must be one of {0}"
+                             .format(", ".join(MISSING_POLICIES)))
+        dates, self._codes, all_closes = align_closes(stocks, codes,
+                                                      start, end)
+        if missing == FILL:
+            all_closes = [_fill_forward(closes) for closes in all_closes]
+        self._dates = dates[1:]
+        self._returns = [_returns(closes) for closes in all_closes]
+        if missing == DROP:
+            # Keep only the dates on which every stock has a return.
+            keep = [True] * len(self._dates)
+            for returns in self._returns:
+                keep = list(map(and_, keep, map(eq, returns, returns)))
+            self._dates = array("i", compress(self._dates, keep))
+            self._returns = [array("d", compress(returns, keep))
+                             for returns in self._returns]
+        self._valid = []
+        # Deviations from the mean and their norm, for complete series.
+        self._deviations = []
+        self._norms = []
+        for returns in self._returns:
+            valid = list(map(eq, returns, returns))
+            if all(valid):
+                mean = sum(returns) / len(returns) if returns else nan
+                deviations = array("d", map(sub, returns, repeat(mean)))
+                self._valid.append(None)
+                self._deviations.append(deviations)
+                self._norms.append(sqrt(sum(map(mul, deviations,
+                                                deviations))))
+            else:
+                self._valid.append(valid)
+                self._deviations.append(None)
+                self._norms.append(None)
+
+    def get_codes(self):
+        """(list<str>) Stock codes, in matrix order."""
+        return self._codes
+
+    def get_dates(self):
+        """(list<str>) Dates of the returns used, in yyyymmdd format."""
+        return [decode_date(date) for date in self._dates]
+
+    def _pair(self, row, column):
+        """Return the covariance and correlation of two stocks' returns."""
+        if self._deviations[row] is not None and \
+                self._deviations[column] is not None:
+            # Both series are complete, so their deviations can be reused.
+            xs = self._deviations[row]
+            ys = self._deviations[column]
+            if len(xs) < 2:
+                return nan, nan
+            norms = self._norms[row] * self._norms[column]
+        else:
+            valid = [flags for flags in (self._valid[row],
+                                         self._valid[column])
+                     if flags is not None]
+            both = (valid[0] if len(valid) == 1
+                    else list(map(and_, valid[0], valid[1])))
+            xs = array("d", compress(self._returns[row], both))
+            ys = array("d", compress(self._returns[column], both))
+            if len(xs) < 2:
+                return nan, nan
+            xs = array("d", map(sub, xs, repeat(sum(xs) / len(xs))))
+            ys = array("d", map(sub, ys, repeat(sum(ys) / len(ys))))
+            norms = sqrt(sum(map(mul, xs, xs)) * sum(map(mul, ys, ys)))
+        product = sum(map(mul, xs, ys))
+        return (product / (len(xs) - 1),
+                product / norms if norms else nan)
+
+    def covariance(self, row, column):
+        """(float) Sample covariance of the returns of two stocks, by index."""
+        return self._pair(row, column)[0]
+
+    def correlation(self, row, column):
+        """(float) Correlation of the returns of two stocks, by index."""
+        return self._pair(row, column)[1]
+
+    def iter_blocks(self, statistic=CORRELATION, block_size=BLOCK_SIZE):
+        """Compute a matrix one block at a time.
+
+        Only blocks on or above the diagonal are computed, as the matrix is
+        symmetric: the block at (column, row) is the transpose of the block
+        at (row, column).
+
+        Parameters:
+            statistic (str): COVARIANCE or CORRELATION.
+            block_size (int): Maximum number of rows and columns per block.
+
+        Yield:
+            tuple: The index of the block's first row and first column and
+                   its rows, each an array of values.
+        """
+        if statistic not in (COVARIANCE, CORRELATION):
+            raise ValueError("statistic must be {0!r} or {1!r}"
+                             .format(COVARIANCE, CORRELATION))
+        which = 0 if statistic == COVARIANCE else 1
+        size = len(self._codes)
+        for first_row in range(0, size, block_size):
+            rows = range(first_row, min(first_row + block_size, size))
+            for first_column in range(first_row, size, block_size):
+                columns = range(first_column,
+                                min(first_column + block_size, size))
+                yield first_row, first_column, [
+                    array("d", (self._pair(row, column)[which]
+                                if column >= row else nan
+                                for column in columns))
+                    for row in rows]
+
+    def matrix(self, statistic=CORRELATION, block_size=BLOCK_SIZE):
+        """Compute a whole matrix.
+
+        Parameters:
+            statistic (str): COVARIANCE or CORRELATION.
+            block_size (int): Maximum number of rows and columns per block.
+
+        Return:
+            list<array>: One row of values for each stock, in 'get_codes'
+                         order.
+        """
+        size = len(self._codes)
+        matrix = [array("d", repeat(nan, size)) for _ in range(size)]
+        for first_row, first_column, block in self.iter_blocks(statistic,
+                                                               block_size):
+            for row, values in enumerate(block, start=first_row):
+                for column, value in enumerate(values, start=first_column):
+                    if column >= row:
+                        matrix[row][column] = value
+                        matrix[column][row] = value
+        return matrix
+
+
+def covariance_matrix(stocks, codes=None, start=None, end=None,
+                      missing=FILL):
+    """Return the stock codes and covariance matrix of their daily returns.
+
+    Takes the same parameters as ReturnMatrix.
+    """
+    returns = ReturnMatrix(stocks, codes, start, end, missing)
+    return returns.get_codes(), returns.matrix(COVARIANCE)
+
+
+def correlation_matrix(stocks, codes=None, start=None, end=None,
+                       missing=FILL):
+    """Return the stock codes and correlation matrix of their daily returns.
+
+    Takes the same parameters as ReturnMatrix.
+    """
+    returns = ReturnMatrix(stocks, codes, start, end, missing)
+    return returns.get_codes(), returns.matrix(CORRELATION)
@@ -0,0 +1,152 @@
+"""
+    Market-wide scanning for gaps between one day's close and the next open.
+
+    GapScanner computes the gap (opening price minus the previous day's
+    closing price) for every day of every stock in a StockCollection, and
+    indexes the gaps by date, sorted by size, so that queries for the gaps
+    on a date or the largest gaps over a period do not rescan the data.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import islice
+from operator import sub, truediv
+
+from stocks import encode_date, decode_date
+
+
+class Gap(object):
+    """A gap between a stock's closing price and its next opening price."""
+
+    __slots__ = ("_code", "_date", "_delta")
+
+    def __init__(self, code, date, delta):
+        """
+        Parameters:
+            code (str): Stock market code.
+            date (str): Date in yyyymmdd format of the day that opened.
+            delta (float): Opening price minus the previous closing price
+                           (as a fraction of the closing price if the scanner
+                           is relative).
+        """
+        self._code = code
+        self._date = date
+        self._delta = delta
+
+    def get_code(self):
+        """(str) Stock market code of the stock that gapped."""
+        return self._code
+
+    def get_date(self):
+        """(str) Date of the day that opened with the gap."""
+        return self._date
+
+    def get_delta(self):
+        """(float) Size of the gap; negative for a gap down."""
+        return self._delta
+
+    def __repr__(self):
+        return "Gap({0!r}, {1!r}, {2!r})".format(self._code, self._date,
+                                                 self._delta)
+
+
+class GapScanner(object):
+    """Index of the gaps of every stock in a collection, by date."""
+
+    def __init__(self, stocks, relative=False):
+        """
+        Parameters:
+            stocks (StockCollection): The stocks to scan.
+            relative (bool): If True, gaps are measured as a fraction of the
+                             previous closing price rather than in dollars.
+        """
+        self._relative = relative
+        by_date = {}
+        for code in stocks.get_stock_codes():
+            columns = stocks.get_stock(code).get_columns()
+            closes = columns.get_column("close")
+            # Gap of each day after the first, in one pass over the columns.
+            deltas = map(sub, islice(columns.get_column("open"), 1, None),
+                         closes)
+            if relative:
+                deltas = map(truediv, deltas, closes)
+            for date, delta in zip(islice(columns.get_column("date"), 1, None),
+                                   deltas):
+                by_date.setdefault(date, []).append((delta, code))
+        # For each date, the gap sizes in increasing order and the matching
+        # stock codes.
+        self._dates = sorted(by_date)
+        self._deltas = {}
+        self._codes = {}
+        for date, gaps in by_date.items():
+            gaps.sort()
+            self._deltas[date] = array("d", [delta for delta, _ in gaps])
+            self._codes[date] = [code for _, code in gaps]
+
+    def get_dates(self):
+        """(list<str>) Dates with at least one gap, in date order."""
+        return [decode_date(date) for date in self._dates]
+
+    def gaps_on(self, date, delta=0.0, down=False):
+        """Return the gaps on a date larger than 'delta', largest first.
+
+        Parameters:
+            date (str): Date in yyyymmdd format.
+            delta (float): Gaps up must be more than 'delta' (as in GapUp);
+                           gaps down must be less than -'delta'.
+            down (bool): If True, return gaps down instead of gaps up.
+
+        Return:
+            list<Gap>: The gaps found.
+        """
+        key = encode_date(date)
+        deltas = self._deltas.get(key)
+        if deltas is None:
+            return []
+        codes = self._codes[key]
+        if down:
+            indices = range(bisect_left(deltas, -delta))
+        else:
+            indices = range(len(deltas) - 1,
+                            bisect_right(deltas, delta) - 1, -1)
+        return [Gap(codes[index], date, deltas[index]) for index in indices]
+
+    def top_gaps(self, count, start=None, end=None, down=False, delta=0.0):
+        """Return the largest gaps over a range of dates.
+
+        Parameters:
+            count (int): Maximum number of gaps to return.
+            start (str): First date of the range, or None for no limit.
+            end (str): Last date of the range, or None for no limit.
+            down (bool): If True, return the largest gaps down instead.
+            delta (float): Gaps up must be more than 'delta'; gaps down must
+                           be less than -'delta' (as in 'gaps_on').
+
+        Return:
+            list<Gap>: Up to 'count' gaps, largest first.
+        """
+        first = 0 if start is None else bisect_left(self._dates,
+                                                    encode_date(start))
+        last = (len(self._dates) if end is None
+                else bisect_right(self._dates, encode_date(end)))
+        # Each date's gaps are already sorted, so merging them yields the
+        # gaps in overall order without sorting the whole range.
+        runs = [self._ranked(date, down, delta)
+                for date in self._dates[first:last]]
+        gaps = []
+        for _, date, index in islice(merge(*runs), count):
+            gaps.append(Gap(self._codes[date][index], decode_date(date),
+                            self._deltas[date][index]))
+        return gaps
+
+    def _ranked(self, date, down, delta):
+        """Yield (rank key, date, index) for a date's gaps beyond 'delta' in
+        the direction asked for, largest first."""
+        deltas = self._deltas[date]
+        if down:
+            for index in range(bisect_left(deltas, -delta)):
+                yield deltas[index], date, index
+        else:
+            for index in range(len(deltas) - 1,
+                               bisect_right(deltas, delta) - 1, -1):
+                yield -deltas[index], date, index
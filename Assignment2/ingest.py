@@ -0,0 +1,173 @@
+"""
+    Loading many stock market data files into one StockCollection.
+
+    Each file's format is detected from its first line, files are parsed into
+    TradingColumns in a pool of worker processes, and the results are merged
+    in the order the files were given before being added to the collection.
+    Files may be compressed with gzip, bz2 or xz.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from stocks import StockCollection, TradingColumns, decode_date
+from stocks import open_data_file
+from stock_analysis import CSV_FIELDS, parse_csv, parse_triplet
+
+# Policies for a (stock code, date) that appears more than once in the input.
+KEEP_LAST = "last"     # The row from the latest file wins, as with Loaders.
+KEEP_FIRST = "first"   # The row from the earliest file wins.
+RAISE = "error"        # Loading fails with a RuntimeError.
+CONFLICT_POLICIES = (KEEP_LAST, KEEP_FIRST, RAISE)
+
+
+def detect_format(filename):
+    """Determine the format of a data file from its first line.
+
+    Parameters:
+        filename (str): Name of the data file.
+
+    Return:
+        str: "csv" for comma-separated files or "triplet" for key-coded files.
+
+    Raises:
+        RuntimeError: If the file is in neither format.
+    """
+    with open_data_file(filename) as file:
+        line = file.readline().strip()
+    if line.count(",") == CSV_FIELDS - 1:
+        return "csv"
+    if line.count(":") == 2:
+        return "triplet"
+    raise RuntimeError("{0}: unrecognised data file format".format(filename))
+
+
+def parse_file(filename):
+    """Parse a data file of either format into columns grouped by stock code.
+
+    Parameters:
+        filename (str): Name of the data file.
+
+    Return:
+        dict<str, TradingColumns>: Trading data for each stock code.
+
+    Raises:
+        RuntimeError: If the file cannot be parsed.
+    """
+    file_format = detect_format(filename)
+    try:
+        with open_data_file(filename) as file:
+            if file_format == "csv":
+                return parse_csv(file.read())
+            return parse_triplet(file)
+    except ValueError as error:
+        raise RuntimeError("{0}: {1}".format(filename, error))
+
+
+def list_data_files(paths):
+    """Expand 'paths' into a list of data file names.
+
+    Parameters:
+        paths (str | list<str>): A directory, whose files are used in name
+                                 order, or a list of file names.
+
+    Return:
+        list<str>: The data file names.
+    """
+    if isinstance(paths, str):
+        if not os.path.isdir(paths):
+            return [paths]
+        return [os.path.join(paths, name)
+                for name in sorted(os.listdir(paths))
+                if not name.startswith(".")
+                and os.path.isfile(os.path.join(paths, name))]
+    return list(paths)
+
+
+def load_files(paths, stocks=None, processes=None, on_conflict=KEEP_LAST):
+    """Load many data files, in parallel, into one StockCollection.
+
+    Parameters:
+        paths (str | list<str>): A directory of data files, or a list of file
+                                 names. Files may be in either format.
+        stocks (StockCollection): Collection to add the data to. A new
+                                  columnar collection is used if None.
+        processes (int): Number of worker processes. Defaults to the number
+                         of CPUs; 1 parses the files in this process.
+        on_conflict (str): One of CONFLICT_POLICIES, deciding which row is
+                           kept when a stock has the same date in more than
+                           one row of the input. Rows already in 'stocks'
+                           are replaced, as they are by Loaders.
+
+    Return:
+        StockCollection: The collection the data was added to.
+
+    Raises:
+        RuntimeError: If a file cannot be parsed, or a conflict is found with
+                      the RAISE policy.
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError("on_conflict must be one of {0}"
+                         .format(", ".join(CONFLICT_POLICIES)))
+    if stocks is None:
+        stocks = StockCollection(columnar=True)
+    filenames = list_data_files(paths)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(filenames))
+    if processes <= 1:
+        batches = [parse_file(filename) for filename in filenames]
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            batches = list(executor.map(parse_file, filenames))
+    stocks.add_columns(merge_batches(batches, on_conflict))
+    return stocks
+
+
+def merge_batches(batches, on_conflict=KEEP_LAST):
+    """Combine parsed files into one batch, with each stock's rows in order.
+
+    Parameters:
+        batches (list<dict<str, TradingColumns>>): Parsed files, in order.
+        on_conflict (str): One of CONFLICT_POLICIES.
+
+    Return:
+        dict<str, TradingColumns>: Trading data for each stock code, sorted
+                                   by date with one row per date.
+    """
+    parts_by_code = {}
+    for batch in batches:
+        for code, columns in batch.items():
+            parts_by_code.setdefault(code, []).append(columns)
+    return {code: _merge_parts(code, parts, on_conflict)
+            for code, parts in parts_by_code.items()}
+
+
+def _merge_parts(code, parts, on_conflict):
+    """Merge one stock's columns from several files into sorted columns."""
+    # Fast path: each part is sorted and starts after the previous one ends.
+    in_order = all(part.is_sorted() for part in parts) and all(
+        earlier.get_column("date")[-1] < later.get_column("date")[0]
+        for earlier, later in zip(parts, parts[1:]))
+    if in_order:
+        if len(parts) == 1:
+            return parts[0]
+        merged = TradingColumns()
+        for part in parts:
+            merged.extend(part)
+        return merged
+    rows = {}
+    for part in parts:
+        for index in range(len(part)):
+            row = part.get_row(index)
+            date = row[0]
+            if date in rows:
+                if on_conflict == RAISE:
+                    raise RuntimeError("{0} has more than one row for {1}"
+                                       .format(code, decode_date(date)))
+                if on_conflict == KEEP_FIRST:
+                    continue
+            rows[date] = row
+    merged = TradingColumns()
+    for date in sorted(rows):
+        merged.append(*rows[date])
+    return merged
@@ -0,0 +1,287 @@
+"""
+    Loading stocks from data files only when they are first used.
+
+    Adding a file to a LazyStockCollection makes one indexing pass over it,
+    recording which lines of the file belong to each stock code. A stock's
+    rows are read and parsed the first time 'get_stock' is called for its
+    code, and only a bounded number of loaded stocks are kept, least recently
+    used stocks being dropped first. A loaded stock that is changed, e.g. by
+    a Loader, is kept permanently so that the change is not lost.
+"""
+from array import array
+from collections import OrderedDict, defaultdict
+from itertools import accumulate, repeat
+from operator import itemgetter
+
+import ingest
+from stocks import ColumnarStock, Stock, StockCollection, detect_compression
+from stock_analysis import parse_csv, parse_triplet
+
+# Number of loaded stocks a LazyStockCollection keeps by default.
+MAX_RESIDENT = 64
+
+
+def index_file(filename, file_format=None):
+    """Find the lines that hold each stock code's data in a data file.
+
+    Parameters:
+        filename (str): Name of the data file.
+        file_format (str): "csv" or "triplet". Detected if None.
+
+    Return:
+        tuple: An array of the byte offset at which each line starts, with
+               the file size appended, and a dictionary mapping each stock
+               code to an array of the numbers (from 0) of its lines, in
+               file order.
+
+    Raises:
+        RuntimeError: If the file is in neither format.
+    """
+    if file_format is None:
+        file_format = ingest.detect_format(filename)
+    separator = b"," if file_format == "csv" else b":"
+    with open(filename, "rb") as file:
+        lines = file.read().split(b"\n")
+    # Each line but the last is followed by the newline it was split on.
+    line_starts = array("q", accumulate(map((1).__add__, map(len, lines)),
+                                        initial=0))
+    line_starts[-1] -= 1
+    codes = map(itemgetter(0), map(bytes.partition, lines, repeat(separator)))
+    rows_by_code = defaultdict(list)
+    for row, code in enumerate(codes):
+        rows_by_code[code].append(row)
+    return line_starts, {code.decode("ascii", "replace"): array("l", rows)
+                         for code, rows in rows_by_code.items()
+                         if code.strip()}
+
+
+def read_rows(filename, line_starts, rows, file_format):
+    """Parse some of the lines of a data file.
+
+    Parameters:
+        filename (str): Name of the data file.
+        line_starts (array<int>): Line offsets from 'index_file'.
+        rows (array<int>): Numbers of the lines to parse, in file order.
+        file_format (str): "csv" or "triplet".
+
+    Return:
+        dict<str, TradingColumns>: Trading data for each stock code in the
+                                   selected lines.
+
+    Raises:
+        RuntimeError: If the lines cannot be parsed.
+    """
+    # Runs of consecutive lines are read in one go.
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row:
+            runs[-1][1] = row + 1
+        else:
+            runs.append([row, row + 1])
+    parts = []
+    with open(filename, "rb") as file:
+        for first, last in runs:
+            file.seek(line_starts[first])
+            parts.append(file.read(line_starts[last] - line_starts[first]))
+    try:
+        # The last line of the file may not end with a newline.
+        text = b"\n".join(part.rstrip(b"\n") for part in parts)
+        text = text.decode("ascii")
+        if file_format == "csv":
+            return parse_csv(text)
+        return parse_triplet(text.splitlines())
+    except (UnicodeDecodeError, ValueError) as error:
+        raise RuntimeError("{0}: {1}".format(filename, error))
+
+
+class _KeptWhenChanged(object):
+    """Mixin for stocks loaded from the index, which ask the collection to
+    keep them the first time they are changed."""
+
+    # LazyStockCollection the stock was loaded by, until it is kept.
+    _collection = None
+
+    def _changed(self):
+        """Keep the stock in its collection, so that it is not dropped."""
+        collection, self._collection = self._collection, None
+        if collection is not None:
+            collection.add_stock(self)
+
+    def add_day_data(self, day):
+        super().add_day_data(day)
+        self._changed()
+
+    def add_columns(self, columns):
+        super().add_columns(columns)
+        self._changed()
+
+
+class _LoadedStock(_KeptWhenChanged, Stock):
+    """A Stock loaded from the index."""
+
+
+class _LoadedColumnarStock(_KeptWhenChanged, ColumnarStock):
+    """A ColumnarStock loaded from the index."""
+
+
+class LazyStockCollection(StockCollection):
+    """A StockCollection that loads each stock from its files on first use.
+
+    Stocks loaded from indexed files are kept in least recently used order
+    and may be dropped, and later reloaded, once more than 'max_resident'
+    are loaded. A loaded stock is kept permanently as soon as days are added
+    to it, e.g. by a Loader or 'add_columns', as are stocks passed to
+    'add_stock' and stocks created for codes that are not in any indexed
+    file. So 'max_resident' only bounds the stocks that are read: loading a
+    file through a Loader or 'add_columns' keeps every stock in it, and a
+    large file should be indexed with 'add_file' instead.
+    """
+
+    def __init__(self, paths=(), max_resident=MAX_RESIDENT, columnar=True):
+        """
+        Parameters:
+            paths (str | list<str>): A directory of data files, or a list of
+                                     file names, to index. Files may be in
+                                     either format.
+            max_resident (int): Number of loaded stocks to keep.
+            columnar (bool): If True, stocks store their trading data in
+                             typed arrays (ColumnarStock).
+        """
+        super().__init__(columnar)
+        if max_resident < 1:
+            raise ValueError("max_resident must be at least 1")
+        self._max_resident = max_resident
+        # (filename, format, line offsets, line numbers by code) for each
+        # indexed file, in order.
+        self._files = []
+        # Stocks loaded from the index, least recently used first.
+        self._resident = OrderedDict()
+        for filename in ingest.list_data_files(paths):
+            self.add_file(filename)
+
+    def add_file(self, filename):
+        """Index a data file so its stocks can be loaded on demand.
+
+        As with Loaders, rows in later files replace rows for the same date
+        in earlier files. A loaded stock that appears in 'filename' is
+        dropped, so it is reloaded with the new rows when next used; the new
+        rows are added straight away to stocks that are kept.
+
+        Parameters:
+            filename (str): Name of the data file.
+
+        Raises:
+            RuntimeError: If the file is compressed, is in neither format or
+                          a kept stock's rows cannot be parsed.
+        """
+        if detect_compression(filename) is not None:
+            # Lines are read by byte offset, which needs an uncompressed file.
+            raise RuntimeError("{0}: compressed files cannot be indexed"
+                               .format(filename))
+        file_format = ingest.detect_format(filename)
+        line_starts, rows_by_code = index_file(filename, file_format)
+        self._files.append((filename, file_format, line_starts, rows_by_code))
+        for stock_code, rows in rows_by_code.items():
+            self._resident.pop(stock_code, None)
+            stock = self._all_stocks.get(stock_code)
+            if stock is not None:
+                batch = read_rows(filename, line_starts, rows, file_format)
+                stock.add_columns(batch[stock_code])
+
+    def _load_stock(self, stock_code):
+        """Read and parse every indexed line for 'stock_code'.
+
+        Return:
+            Stock: The stock, or None if 'stock_code' is not indexed.
+        """
+        batches = [read_rows(filename, line_starts, rows_by_code[stock_code],
+                             file_format)
+                   for filename, file_format, line_starts, rows_by_code
+                   in self._files if stock_code in rows_by_code]
+        if not batches:
+            return None
+        columns = ingest.merge_batches(batches)[stock_code]
+        if self._columnar:
+            stock = _LoadedColumnarStock(stock_code, columns)
+        else:
+            stock = _LoadedStock(stock_code)
+            stock.add_columns(columns)
+        stock._collection = self
+        return stock
+
+    def is_resident(self, stock_code):
+        """(bool) Whether 'stock_code' is in memory, i.e. loaded or kept."""
+        return stock_code in self._all_stocks or stock_code in self._resident
+
+    def get_stock(self, stock_code):
+        """Look up a stock object based on its stock market code.
+
+        The stock is loaded from the indexed files if it is not in memory.
+        A new, empty stock is created and kept if 'stock_code' is not in any
+        indexed file.
+
+        Parameters:
+            stock_code (str): Stock market code used to look up a stock.
+
+        Return:
+            Stock: The stock market object represented by this 'stock_code'.
+        """
+        stock = self._all_stocks.get(stock_code)
+        if stock is not None:
+            return stock
+        stock = self._resident.get(stock_code)
+        if stock is not None:
+            self._resident.move_to_end(stock_code)
+            return stock
+        stock = self._load_stock(stock_code)
+        if stock is None:
+            return super().get_stock(stock_code)
+        self._resident[stock_code] = stock
+        if len(self._resident) > self._max_resident:
+            self._resident.popitem(last=False)
+        return stock
+
+    def analyse(self, make_analyser, start=None, end=None):
+        """Run a fresh analyser over every stock in the collection.
+
+        Stocks are loaded one at a time, so at most 'max_resident' loaded
+        stocks are in memory at once.
+
+        Parameters:
+            make_analyser (callable): Called with no arguments to create the
+                                      Analyser for each stock.
+            start (str): If given, only days on or after this date are used.
+            end (str): If given, only days on or before this date are used.
+
+        Return:
+            dict<str, *>: Result of the analysis, keyed by stock code.
+        """
+        results = {}
+        for stock_code in self.get_stock_codes():
+            analyser = make_analyser()
+            self.get_stock(stock_code).analyse(analyser, start, end)
+            results[stock_code] = analyser.result()
+        return results
+
+    def add_stock(self, stock):
+        """Add a Stock object, replacing any stock with the same code.
+
+        The stock is kept in memory rather than loaded from the index.
+
+        Parameters:
+            stock (Stock): The stock to add.
+        """
+        self._resident.pop(str(stock), None)
+        super().add_stock(stock)
+
+    def get_stock_codes(self):
+        """(list<str>) Codes of all stocks in the collection, in sorted order."""
+        codes = set(self._all_stocks)
+        for _, _, _, rows_by_code in self._files:
+            codes.update(rows_by_code)
+        return sorted(codes)
+
+    def list_stocks(self):
+        """Simple output of all stocks in the collection."""
+        for stock_code in self.get_stock_codes():
+            print("{0}".format(stock_code))
@@ -0,0 +1,138 @@
+"""
+    Loading large data files through a read-only memory map.
+
+    The file is never read into memory as a whole. Instead the mapped bytes
+    are scanned for line boundaries and handed to the parsers a chunk at a
+    time, so peak memory is the parsed columns plus one chunk rather than
+    several copies of the file's text.
+"""
+import mmap
+from contextlib import contextmanager
+from itertools import chain
+
+from ingest import merge_batches
+from stock_analysis import LoadCSV, LoadTriplet, parse_csv, parse_triplet
+
+# Approximate number of bytes decoded and parsed at a time.
+CHUNK_SIZE = 1 << 22
+
+
+@contextmanager
+def map_file(filename):
+    """Map a file read-only, as a context manager.
+
+    Parameters:
+        filename (str): Name of the file to map.
+
+    Yield:
+        mmap | bytes: The mapping (an empty file gives b"", as it cannot be
+                      mapped).
+    """
+    with open(filename, "rb") as file:
+        try:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b""
+            return
+        with mapping:
+            yield mapping
+
+
+def iter_chunks(mapping, chunk_size=CHUNK_SIZE):
+    """Yield the text of 'mapping' in chunks that end at line boundaries.
+
+    Parameters:
+        mapping (mmap | bytes): ASCII text data.
+        chunk_size (int): Approximate number of bytes in each chunk.
+
+    Yield:
+        str: The next chunk of whole lines.
+    """
+    start = 0
+    size = len(mapping)
+    while start < size:
+        end = mapping.find(b"\n", min(start + chunk_size, size) - 1)
+        end = size if end < 0 else end + 1
+        yield mapping[start:end].decode("ascii")
+        start = end
+
+
+def parse_mapped_csv(mapping, chunk_size=CHUNK_SIZE):
+    """Parse comma-separated trading data a chunk at a time.
+
+    Parameters:
+        mapping (mmap | bytes): Contents of a comma-separated data file.
+        chunk_size (int): Approximate number of bytes parsed at a time.
+
+    Return:
+        dict<str, TradingColumns>: Trading data for each stock code, sorted
+                                   by date; a later line for the same day
+                                   replaces an earlier one.
+
+    Raises:
+        ValueError: If the data is invalid.
+    """
+    return merge_batches(parse_csv(chunk)
+                         for chunk in iter_chunks(mapping, chunk_size))
+
+
+def parse_mapped_triplet(mapping, chunk_size=CHUNK_SIZE):
+    """Parse triplet key-coded trading data a chunk at a time.
+
+    Records may span chunks, as the parser reads the chunks' lines as one
+    stream.
+
+    Parameters:
+        mapping (mmap | bytes): Contents of a triplet data file.
+        chunk_size (int): Approximate number of bytes decoded at a time.
+
+    Return:
+        dict<str, TradingColumns>: Trading data for each stock code.
+
+    Raises:
+        ValueError: If a record is malformed (see 'read_triplets').
+    """
+    lines = chain.from_iterable(chunk.splitlines(True)
+                                for chunk in iter_chunks(mapping, chunk_size))
+    return parse_triplet(lines)
+
+
+class MappedLoadCSV(LoadCSV):
+    """Loads comma-separated data through a memory map of the file"""
+
+    def __init__(self, filename, stocks):
+        """
+        Parameters:
+            filename(str): Name of the file from which to load data.
+            stocks (StockCollection): Collection of existing stock market data
+                                      to which the new data will be added.
+        """
+        super().__init__(filename, stocks)
+
+    def _open(self, filename):
+        """Map the file instead of opening it in text mode"""
+        return map_file(filename)
+
+    def _process(self, mapping):
+        """Parse the mapped file and add its data in one batch"""
+        try:
+            batch = parse_mapped_csv(mapping)
+        except ValueError:
+            raise RuntimeError
+        self._stocks.add_columns(batch)
+
+
+class MappedLoadTriplet(LoadTriplet):
+    """Loads triplet key-coded data through a memory map of the file"""
+
+    def _open(self, filename):
+        """Map the file instead of opening it in text mode"""
+        return map_file(filename)
+
+    def _process(self, mapping):
+        """Parse the mapped file and add its data in one batch"""
+        try:
+            batch = parse_mapped_triplet(mapping)
+        except (UnicodeDecodeError, ValueError) as error:
+            raise RuntimeError(str(error))
+        self._stocks.add_columns(batch)
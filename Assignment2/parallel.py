@@ -0,0 +1,112 @@
+"""
+    Running an analysis over every stock in a StockCollection in parallel.
+
+    Stocks are split into chunks which are analysed by a pool of worker
+    processes. Each worker receives its stocks' data as TradingColumns and
+    creates a fresh analyser for every stock, so the analyser factory must
+    be picklable: a class, a module level function or a functools.partial.
+    Column analysers are given each stock's data as whole columns.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from column_analysis import ColumnAnalyser
+from stocks import ColumnarStock
+
+# Chunks handed out per worker process, so that slow chunks can be balanced
+# by the other workers.
+CHUNKS_PER_PROCESS = 4
+
+
+def _analyse_stock(stock, make_analyser, start, end):
+    """Return the result of analysing one stock with a new analyser."""
+    analyser = make_analyser()
+    if isinstance(analyser, ColumnAnalyser):
+        stock.analyse_columns(analyser, start, end)
+    else:
+        stock.analyse(analyser, start, end)
+    return analyser.result()
+
+
+def _analyse_chunk(make_analyser, chunk, start, end):
+    """Analyse a chunk of stocks in a worker process.
+
+    Parameters:
+        make_analyser (callable): Creates the Analyser for each stock.
+        chunk (list<tuple<str, TradingColumns>>): Code and data of each stock.
+        start (str): First date analysed, or None.
+        end (str): Last date analysed, or None.
+
+    Return:
+        dict<str, *>: Result of the analysis, keyed by stock code.
+    """
+    results = {}
+    for code, columns in chunk:
+        results[code] = _analyse_stock(ColumnarStock(code, columns),
+                                       make_analyser, start, end)
+    return results
+
+
+def _make_chunks(stocks, codes, num_chunks):
+    """Split the stocks into chunks with similar numbers of days."""
+    chunks = [[] for _ in range(num_chunks)]
+    sizes = [0] * num_chunks
+    # Columns are pickled to the workers by value, including views of mapped
+    # or shared data (see MappedColumns), so they are not copied here.
+    data = [(code, stocks.get_stock(code).get_columns()) for code in codes]
+    # Largest first, each to the chunk with the fewest days so far.
+    data.sort(key=lambda item: len(item[1]), reverse=True)
+    for code, columns in data:
+        smallest = sizes.index(min(sizes))
+        chunks[smallest].append((code, columns))
+        sizes[smallest] += len(columns)
+    return [chunk for chunk in chunks if chunk]
+
+
+def iter_analyse(stocks, make_analyser, processes=None, codes=None,
+                 start=None, end=None):
+    """Analyse stocks in parallel, yielding results as they are finished.
+
+    Parameters:
+        stocks (StockCollection): The stocks to analyse.
+        make_analyser (callable): Called with no arguments to create the
+                                  Analyser for each stock.
+        processes (int): Number of worker processes. Defaults to the number
+                         of CPUs; 1 analyses the stocks in this process.
+        codes (list<str>): Codes of the stocks to analyse. Defaults to
+                           every stock in the collection.
+        start (str): If given, only days on or after this date are used.
+        end (str): If given, only days on or before this date are used.
+
+    Yield:
+        tuple: (stock code, result) for each stock, in completion order.
+    """
+    if codes is None:
+        codes = stocks.get_stock_codes()
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1 or len(codes) <= 1:
+        for code in codes:
+            yield code, _analyse_stock(stocks.get_stock(code), make_analyser,
+                                       start, end)
+        return
+    chunks = _make_chunks(stocks, codes, processes * CHUNKS_PER_PROCESS)
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(_analyse_chunk, make_analyser, chunk,
+                                   start, end)
+                   for chunk in chunks]
+        for future in as_completed(futures):
+            yield from future.result().items()
+
+
+def analyse(stocks, make_analyser, processes=None, codes=None,
+            start=None, end=None):
+    """Analyse stocks in parallel.
+
+    Takes the same parameters as 'iter_analyse'.
+
+    Return:
+        dict<str, *>: Result of the analysis, keyed by stock code.
+    """
+    return dict(iter_analyse(stocks, make_analyser, processes, codes,
+                             start, end))
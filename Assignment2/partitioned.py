@@ -0,0 +1,220 @@
+"""
+    Analysing stock market data too large to be held in memory at once.
+
+    Data files are split by stock code into bucket files in a directory,
+    each holding every row of its stocks in comma-separated format. Buckets
+    are then loaded, a few at a time, into a StockCollection no larger than
+    a memory limit, analysed and released, and the results of all of the
+    partitions merged. All of a stock's days are in the same bucket, so any
+    analysis of a single stock sees its whole history.
+
+    Input files are read one at a time, so partitioning only needs memory
+    for the largest input file, and bucket files are parsed a block at a
+    time, so the memory limit only has to allow for the parsed data.
+"""
+import os
+import zlib
+
+from ingest import CONFLICT_POLICIES, KEEP_LAST, list_data_files
+from ingest import merge_batches, parse_file
+from stocks import StockCollection, decode_date
+from stock_analysis import parse_csv
+
+# Number of bucket files stock codes are spread across.
+NUM_BUCKETS = 64
+# Default memory limit, in bytes, for the stocks loaded at once.
+MEMORY_LIMIT = 256 << 20
+# Approximate peak memory used to load each byte of a bucket file, while
+# its parsed blocks are merged into each stock's columns.
+MEMORY_PER_BYTE = 6
+# Approximate number of bytes of a bucket file parsed at a time.
+BLOCK_SIZE = 1 << 20
+
+_INFO_FILE = "buckets.txt"
+_ROW_FORMAT = "{0},{1},{2!r},{3!r},{4!r},{5!r},{6}\n"
+
+
+def bucket_of(code, num_buckets=NUM_BUCKETS):
+    """Return the number of the bucket holding a stock code.
+
+    The bucket only depends on the code, so is the same in every process.
+    """
+    return zlib.crc32(code.encode()) % num_buckets
+
+
+class PartitionedStocks(object):
+    """Stock market data partitioned by stock code into files on disk."""
+
+    def __init__(self, directory, num_buckets=NUM_BUCKETS,
+                 on_conflict=KEEP_LAST):
+        """
+        Parameters:
+            directory (str): Directory of the bucket files. It is created if
+                             needed; existing buckets are used as they are.
+            num_buckets (int): Number of bucket files in a new directory.
+            on_conflict (str): One of ingest.CONFLICT_POLICIES, deciding which
+                               row is kept when a stock has a date more than
+                               once.
+
+        Raises:
+            RuntimeError: If the directory was partitioned into a different
+                          number of buckets.
+        """
+        if on_conflict not in CONFLICT_POLICIES:
+            raise ValueError("on_conflict must be one of {0}"
+                             .format(", ".join(CONFLICT_POLICIES)))
+        self._directory = directory
+        self._on_conflict = on_conflict
+        os.makedirs(directory, exist_ok=True)
+        info = os.path.join(directory, _INFO_FILE)
+        if os.path.exists(info):
+            with open(info) as file:
+                existing = int(file.read())
+            if existing != num_buckets:
+                raise RuntimeError("{0} has {1} buckets, not {2}"
+                                   .format(directory, existing, num_buckets))
+        else:
+            with open(info, "w") as file:
+                file.write(str(num_buckets))
+        self._num_buckets = num_buckets
+
+    def get_bucket_file(self, bucket):
+        """(str) Name of the file of a bucket, by number."""
+        return os.path.join(self._directory, "bucket-{0:04d}.csv"
+                            .format(bucket))
+
+    def add_files(self, paths):
+        """Add the rows of data files to the buckets of their stocks.
+
+        Parameters:
+            paths (str | list<str>): A directory of data files, or a list of
+                                     file names, in either format and
+                                     possibly compressed.
+
+        Raises:
+            RuntimeError: If a file cannot be parsed.
+        """
+        for filename in list_data_files(paths):
+            self.add_columns(parse_file(filename))
+
+    def add_columns(self, columns_by_code):
+        """Add many days of trading data to the buckets of their stocks.
+
+        Parameters:
+            columns_by_code (dict<str, TradingColumns>): Trading data for each
+                                                         stock code.
+        """
+        lines_by_bucket = {}
+        for code, columns in columns_by_code.items():
+            lines = lines_by_bucket.setdefault(
+                bucket_of(code, self._num_buckets), [])
+            for date, *values in zip(*columns.get_columns()):
+                lines.append(_ROW_FORMAT.format(code, decode_date(date),
+                                                *values))
+        for bucket, lines in lines_by_bucket.items():
+            with open(self.get_bucket_file(bucket), "a") as file:
+                file.writelines(lines)
+
+    def get_partitions(self, memory_limit=MEMORY_LIMIT):
+        """Group the buckets into partitions that fit in a memory limit.
+
+        A bucket larger than the limit on its own is a partition by itself;
+        use more buckets to avoid this.
+
+        Parameters:
+            memory_limit (int): Approximate most bytes of memory to use for
+                                the stocks of one partition.
+
+        Return:
+            list<list<int>>: The bucket numbers of each partition.
+        """
+        partitions = []
+        size = 0
+        for bucket in range(self._num_buckets):
+            filename = self.get_bucket_file(bucket)
+            if not os.path.exists(filename):
+                continue
+            bucket_size = os.path.getsize(filename) * MEMORY_PER_BYTE
+            if partitions and size + bucket_size <= memory_limit:
+                partitions[-1].append(bucket)
+                size += bucket_size
+            else:
+                partitions.append([bucket])
+                size = bucket_size
+        return partitions
+
+    def load_partition(self, buckets):
+        """Load the stocks of some buckets.
+
+        Parameters:
+            buckets (list<int>): The bucket numbers.
+
+        Return:
+            StockCollection: Columnar collection of the buckets' stocks.
+
+        Raises:
+            RuntimeError: If a bucket file cannot be parsed.
+        """
+        stocks = StockCollection(columnar=True)
+        for bucket in buckets:
+            filename = self.get_bucket_file(bucket)
+            batches = []
+            try:
+                with open(filename) as file:
+                    while True:
+                        lines = file.readlines(BLOCK_SIZE)
+                        if not lines:
+                            break
+                        batches.append(parse_csv("".join(lines)))
+            except ValueError as error:
+                raise RuntimeError("{0}: {1}".format(filename, error))
+            stocks.add_columns(merge_batches(batches, self._on_conflict))
+        return stocks
+
+    def iter_partitions(self, memory_limit=MEMORY_LIMIT):
+        """Load each partition's stocks in turn.
+
+        A loop variable still refers to the previous partition while the
+        next is loaded, so allow for two partitions in 'memory_limit'.
+
+        Parameters:
+            memory_limit (int): Approximate most bytes of memory to use for
+                                the stocks of one partition.
+
+        Yield:
+            StockCollection: The stocks of one partition.
+        """
+        for buckets in self.get_partitions(memory_limit):
+            yield self.load_partition(buckets)
+
+    def get_stock_codes(self):
+        """(list<str>) Codes of all stocks, in sorted order."""
+        codes = set()
+        for bucket in range(self._num_buckets):
+            filename = self.get_bucket_file(bucket)
+            if os.path.exists(filename):
+                with open(filename) as file:
+                    codes.update(line[:line.find(",")] for line in file)
+        return sorted(codes)
+
+    def analyse(self, make_analyser, memory_limit=MEMORY_LIMIT, start=None,
+                end=None):
+        """Analyse every stock, one partition at a time.
+
+        Parameters:
+            make_analyser (callable): Called with no arguments to create the
+                                      Analyser for each stock.
+            memory_limit (int): Approximate most bytes of memory to use for
+                                the stocks of one partition.
+            start (str): If given, only days on or after this date are used.
+            end (str): If given, only days on or before this date are used.
+
+        Return:
+            dict<str, *>: Result of the analysis, keyed by stock code.
+        """
+        results = {}
+        for buckets in self.get_partitions(memory_limit):
+            # Each partition is released before the next is loaded.
+            results.update(self.load_partition(buckets).analyse(
+                make_analyser, start, end))
+        return results
@@ -0,0 +1,160 @@
+"""
+    Ranking every stock in a collection by the results of analysers.
+
+    Each RankingKey names an analyser and how its result is scored. All
+    keys are analysed together in one pass over each stock's data, and
+    each key keeps only its best 'count' stocks so far in a heap, so
+    ranking thousands of stocks never sorts more than 'count' of them.
+"""
+from collections import deque
+from heapq import heappush, heappushpop
+
+from stocks import Analyser, AnalysisPipeline
+
+
+class RankingKey(object):
+    """A score by which stocks are ranked."""
+
+    def __init__(self, name, make_analyser, score=None, largest=True):
+        """
+        Parameters:
+            name (str): Name identifying the ranking.
+            make_analyser (callable): Called with no arguments to create the
+                                      Analyser for each stock.
+            score (callable): Converts the analyser's result to a number. The
+                              result is used as the score if None. Stocks
+                              scored None are left out of the ranking.
+            largest (bool): If True the highest scores rank first, otherwise
+                            the lowest scores do.
+        """
+        self._name = name
+        self._make_analyser = make_analyser
+        self._score = score
+        self._largest = largest
+
+    def get_name(self):
+        """(str) Name identifying the ranking."""
+        return self._name
+
+    def make_analyser(self):
+        """(Analyser) A new analyser for one stock."""
+        return self._make_analyser()
+
+    def score(self, result):
+        """Return the score of an analyser's result, or None."""
+        if self._score is None:
+            return result
+        return self._score(result)
+
+    def is_largest_first(self):
+        """(bool) True if the highest scores rank first."""
+        return self._largest
+
+
+class PriceChange(Analyser):
+    """Determines the relative change in a stock's closing price over its
+       latest days of trading."""
+
+    def __init__(self, num_days=None):
+        """
+        Parameters:
+            num_days (int): Number of days over which the change is found,
+                            from the close before the first day to the last
+                            close. All days processed are used if None.
+        """
+        self._num_days = num_days
+        self.reset()
+
+    def process(self, day):
+        """Collect the closing price of one day.
+
+        Parameters:
+            day (TradingData): Trading data for one stock on one day.
+        """
+        self._closes.append(day.get_close())
+
+    def reset(self):
+        """Reset the analysis process in order to perform a new analysis."""
+        self._closes = deque(maxlen=None if self._num_days is None
+                             else self._num_days + 1)
+
+    def result(self):
+        """Return the change as a fraction of the earlier close.
+
+        Return:
+            float: The change, or None if fewer than two days were processed
+                   or the earlier close is zero.
+        """
+        if len(self._closes) < 2 or not self._closes[0]:
+            return None
+        return (self._closes[-1] - self._closes[0]) / self._closes[0]
+
+
+class _DayCount(Analyser):
+    """Counts the days processed, so stocks without data can be skipped."""
+
+    def __init__(self):
+        self._days = 0
+
+    def process(self, day):
+        """Count one day of trading data."""
+        self._days += 1
+
+    def reset(self):
+        """Reset the analysis process in order to perform a new analysis."""
+        self._days = 0
+
+    def result(self):
+        """(int) Number of days processed."""
+        return self._days
+
+    def is_order_independent(self):
+        """(bool) The number of days does not depend on day order."""
+        return True
+
+
+def rank(stocks, keys, count, start=None, end=None):
+    """Find the best 'count' stocks for each ranking key.
+
+    Stocks with no trading data between 'start' and 'end' are not ranked.
+    Equal scores are ranked in stock code order.
+
+    Parameters:
+        stocks (StockCollection): The stocks to rank.
+        keys (list<RankingKey>): The rankings to find.
+        count (int): Number of stocks in each ranking.
+        start (str): If given, only days on or after this date are used.
+        end (str): If given, only days on or before this date are used.
+
+    Return:
+        dict<str, list<tuple<Stock, float>>>: For each key name, the ranked
+                                               stocks and their scores,
+                                               best first.
+    """
+    keys = list(keys)
+    heaps = [[] for _ in keys]
+    if count > 0:
+        for position, code in enumerate(stocks.get_stock_codes()):
+            stock = stocks.get_stock(code)
+            day_count = _DayCount()
+            analysers = [key.make_analyser() for key in keys]
+            stock.analyse(AnalysisPipeline([day_count] + analysers),
+                          start, end)
+            # Analysers may fail to give a result without any data.
+            if not day_count.result():
+                continue
+            for key, heap, analyser in zip(keys, heaps, analysers):
+                score = key.score(analyser.result())
+                if score is None:
+                    continue
+                # The heap's smallest entry is its worst stock; among equal
+                # scores, later codes are worse.
+                entry = (score if key.is_largest_first() else -score,
+                         -position, code, score)
+                if len(heap) < count:
+                    heappush(heap, entry)
+                elif entry > heap[0]:
+                    heappushpop(heap, entry)
+    return {key.get_name(): [(stocks.get_stock(code), score) for
+                             _, _, code, score in sorted(heap, reverse=True)]
+            for key, heap in zip(keys, heaps)}
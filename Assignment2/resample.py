@@ -0,0 +1,174 @@
+"""
+    Resampling daily trading data into weekly, monthly or N-day bars.
+
+    A bar covers the days of one period: its open is the first day's open,
+    its high and low the highest high and lowest low, its close the last
+    day's close and its volume the total volume. A bar is dated by the last
+    trading day it covers, so bars remain in date order and can be stored
+    and analysed like days.
+
+    Periods are WEEKLY (Monday to Sunday), MONTHLY, or a number of trading
+    days N, counted from the first day resampled.
+"""
+from datetime import date as calendar_date
+from itertools import groupby, repeat
+from operator import floordiv
+
+from stocks import Analyser, ColumnarStock, StockCollection, TradingColumns
+from stocks import encode_date
+
+WEEKLY = "week"
+MONTHLY = "month"
+
+
+def _check_period(period):
+    """Raise ValueError if 'period' is not WEEKLY, MONTHLY or a positive int."""
+    if period in (WEEKLY, MONTHLY):
+        return
+    if not isinstance(period, int) or period < 1:
+        raise ValueError("period must be {0!r}, {1!r} or a positive number "
+                         "of days".format(WEEKLY, MONTHLY))
+
+
+def _week(date):
+    """Return the ordinal of the Monday of the week of an encoded date."""
+    year, month_day = divmod(date, 10000)
+    day = calendar_date(year, *divmod(month_day, 100))
+    return day.toordinal() - day.weekday()
+
+
+def period_keys(dates, period):
+    """Find the period that each date belongs to.
+
+    Parameters:
+        dates (iterable<int>): Encoded dates, in date order.
+        period (str | int): WEEKLY, MONTHLY or a number of trading days.
+
+    Return:
+        iterable: A key for each date, equal for dates in the same period.
+    """
+    _check_period(period)
+    if period == WEEKLY:
+        return map(_week, dates)
+    if period == MONTHLY:
+        return map(floordiv, dates, repeat(100))
+    return map(floordiv, range(len(dates)), repeat(period))
+
+
+def resample_columns(columns, period):
+    """Resample trading data into bars.
+
+    Parameters:
+        columns (TradingColumns): Trading data in date order.
+        period (str | int): WEEKLY, MONTHLY or a number of trading days.
+
+    Return:
+        TradingColumns: One row for each bar, in date order.
+    """
+    dates, opens, highs, lows, closes, volumes = columns.get_columns()
+    bars = TradingColumns()
+    first = 0
+    for _, group in groupby(period_keys(dates, period)):
+        last = first + sum(1 for _ in group)
+        bars.append(dates[last - 1], opens[first], max(highs[first:last]),
+                    min(lows[first:last]), closes[last - 1],
+                    sum(volumes[first:last]))
+        first = last
+    return bars
+
+
+def resample_stock(stock, period):
+    """Resample a stock's trading data into bars.
+
+    Parameters:
+        stock (Stock): The stock to resample.
+        period (str | int): WEEKLY, MONTHLY or a number of trading days.
+
+    Return:
+        ColumnarStock: A stock with the same code whose days are the bars.
+    """
+    return ColumnarStock(str(stock),
+                         resample_columns(stock.get_columns(), period))
+
+
+def resample_collection(stocks, period):
+    """Resample every stock in a collection into bars.
+
+    Parameters:
+        stocks (StockCollection): The stocks to resample.
+        period (str | int): WEEKLY, MONTHLY or a number of trading days.
+
+    Return:
+        StockCollection: Columnar collection of the resampled stocks.
+    """
+    _check_period(period)
+    bars = StockCollection(columnar=True)
+    for code in stocks.get_stock_codes():
+        bars.add_stock(resample_stock(stocks.get_stock(code), period))
+    return bars
+
+
+class Resampler(Analyser):
+    """Builds bars incrementally from days processed in date order.
+
+    A Resampler can be attached to a Stock, so its bars are extended as new
+    days are added.
+    """
+
+    def __init__(self, period):
+        """
+        Parameters:
+            period (str | int): WEEKLY, MONTHLY or a number of trading days.
+        """
+        _check_period(period)
+        self._period = period
+        self.reset()
+
+    def _key(self, date):
+        """Return the period key of the next day, dated 'date'."""
+        if self._period == WEEKLY:
+            return _week(date)
+        if self._period == MONTHLY:
+            return date // 100
+        return self._num_days // self._period
+
+    def process(self, day):
+        """Add one day of trading data to the current bar.
+
+        Parameters:
+            day (TradingData): Trading data for one stock on one day.
+        """
+        date = encode_date(day.get_date())
+        key = self._key(date)
+        if self._bar is not None and key == self._bar_key:
+            bar = self._bar
+            bar[0] = date
+            bar[2] = max(bar[2], day.get_high())
+            bar[3] = min(bar[3], day.get_low())
+            bar[4] = day.get_close()
+            bar[5] += day.get_volume()
+        else:
+            if self._bar is not None:
+                self._bars.append(*self._bar)
+            self._bar = [date, day.get_open(), day.get_high(), day.get_low(),
+                         day.get_close(), day.get_volume()]
+            self._bar_key = key
+        self._num_days += 1
+
+    def reset(self):
+        """Reset the analysis process in order to perform a new analysis."""
+        self._bars = TradingColumns()
+        self._bar = None
+        self._bar_key = None
+        self._num_days = 0
+
+    def result(self):
+        """Return the bars, including the bar of the latest period so far.
+
+        Return:
+            TradingColumns: One row for each bar, in date order.
+        """
+        bars = self._bars.copy()
+        if self._bar is not None:
+            bars.append(*self._bar)
+        return bars
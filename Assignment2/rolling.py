@@ -0,0 +1,356 @@
+"""
+    Rolling-window analysis of stock market data in constant time per day.
+
+    RollingWindow: Ring buffer of the last N values with running aggregates.
+    RollingExtrema: Minimum and maximum of the last N values.
+    SimpleMovingAverage: Average closing price over the last N days.
+    ExponentialMovingAverage: Exponentially weighted average closing price.
+    RollingStdDev: Standard deviation of closing prices over the last N days.
+    RollingHighLow: Highest high and lowest low over the last N days.
+    BollingerBands: Moving average of closing prices with volatility bands.
+"""
+from collections import deque
+from math import fsum, sqrt
+
+from stocks import Analyser
+
+
+class RollingWindow(object):
+    """The most recent values of a series, up to a fixed number of values.
+
+    Values are stored in a ring buffer. The sum and sum of squares of the
+    values are updated as each value is added and the oldest dropped, so
+    the mean and variance are available in constant time. To stop rounding
+    errors accumulating, the aggregates are recalculated exactly each time
+    the buffer wraps around, which is amortised constant time per value.
+    """
+
+    def __init__(self, size):
+        """
+        Parameters:
+            size (int): Maximum number of values held in the window.
+        """
+        if size < 1:
+            raise ValueError("Window size must be at least 1")
+        self._size = size
+        self._values = []
+        # Index of the oldest value once the window is full.
+        self._oldest = 0
+        # Aggregates are of values minus '_shift', which is kept close to
+        # the mean so that the variance does not lose precision.
+        self._shift = 0.0
+        self._sum = 0.0
+        self._sum_squares = 0.0
+
+    def push(self, value):
+        """Add a value to the window, dropping the oldest value if it is full.
+
+        Parameters:
+            value (float): The newest value in the series.
+
+        Return:
+            float: The value dropped from the window, or None.
+        """
+        values = self._values
+        dropped = None
+        if len(values) < self._size:
+            if not values:
+                self._shift = value
+            values.append(value)
+        else:
+            dropped = values[self._oldest]
+            values[self._oldest] = value
+            self._oldest += 1
+        deviation = value - self._shift
+        self._sum += deviation
+        self._sum_squares += deviation * deviation
+        if dropped is not None:
+            deviation = dropped - self._shift
+            self._sum -= deviation
+            self._sum_squares -= deviation * deviation
+            if self._oldest == self._size:
+                self._oldest = 0
+                self._recalculate()
+        return dropped
+
+    def _recalculate(self):
+        """Recalculate the aggregates exactly from the stored values."""
+        values = self._values
+        self._shift = fsum(values) / len(values)
+        deviations = [value - self._shift for value in values]
+        self._sum = fsum(deviations)
+        self._sum_squares = fsum(deviation * deviation
+                                 for deviation in deviations)
+
+    def __len__(self):
+        return len(self._values)
+
+    def is_full(self):
+        """(bool) True if the window holds 'size' values."""
+        return len(self._values) == self._size
+
+    def get_values(self):
+        """(list<float>) The values in the window, oldest first."""
+        return self._values[self._oldest:] + self._values[:self._oldest]
+
+    def total(self):
+        """(float) Sum of the values in the window."""
+        return self._shift * len(self._values) + self._sum
+
+    def mean(self):
+        """(float) Mean of the values in the window, or None if empty."""
+        if not self._values:
+            return None
+        return self._shift + self._sum / len(self._values)
+
+    def variance(self):
+        """(float) Population variance of the window, or None if empty."""
+        count = len(self._values)
+        if not count:
+            return None
+        mean_deviation = self._sum / count
+        return max(0.0, self._sum_squares / count
+                   - mean_deviation * mean_deviation)
+
+    def std_dev(self):
+        """(float) Population standard deviation, or None if empty."""
+        variance = self.variance()
+        return None if variance is None else sqrt(variance)
+
+
+class RollingExtrema(object):
+    """Minimum and maximum of the last N values of a series.
+
+    Each extreme is tracked with a monotonic deque of (position, value)
+    pairs, so adding a value is amortised constant time.
+    """
+
+    def __init__(self, size):
+        """
+        Parameters:
+            size (int): Number of values the extremes are taken over.
+        """
+        if size < 1:
+            raise ValueError("Window size must be at least 1")
+        self._size = size
+        self._position = 0
+        # Values decrease along '_maxima' and increase along '_minima'.
+        self._maxima = deque()
+        self._minima = deque()
+
+    def push(self, value):
+        """Add the newest value of the series.
+
+        Parameters:
+            value (float): The newest value in the series.
+        """
+        position = self._position
+        self._position += 1
+        expired = position - self._size
+        maxima = self._maxima
+        while maxima and maxima[-1][1] <= value:
+            maxima.pop()
+        maxima.append((position, value))
+        if maxima[0][0] <= expired:
+            maxima.popleft()
+        minima = self._minima
+        while minima and minima[-1][1] >= value:
+            minima.pop()
+        minima.append((position, value))
+        if minima[0][0] <= expired:
+            minima.popleft()
+
+    def maximum(self):
+        """(float) Largest of the last N values, or None if there are none."""
+        return self._maxima[0][1] if self._maxima else None
+
+    def minimum(self):
+        """(float) Smallest of the last N values, or None if there are none."""
+        return self._minima[0][1] if self._minima else None
+
+
+class SimpleMovingAverage(Analyser):
+    """Average closing price over the most recent days.
+
+    Until 'num_days' days have been processed the average is over the days
+    processed so far.
+    """
+
+    def __init__(self, num_days):
+        """
+        Parameters:
+            num_days (int): The number of days to average over.
+        """
+        self._num_days = num_days
+        self._window = RollingWindow(num_days)
+
+    def process(self, day):
+        """Add one day's closing price to the window.
+
+        Parameters:
+            day (TradingData): Trading data for one stock on one day.
+        """
+        self._window.push(day.get_close())
+
+    def reset(self):
+        """Reset the analysis process in order to perform a new analysis."""
+        self._window = RollingWindow(self._num_days)
+
+    def result(self):
+        """Return the average closing price over the last num_days.
+
+        Return:
+            float: The average, or None if no days have been processed.
+        """
+        return self._window.mean()
+
+
+class ExponentialMovingAverage(Analyser):
+    """Exponentially weighted average of closing prices.
+
+    Uses the smoothing factor 2 / (num_days + 1), starting from the first
+    closing price processed.
+    """
+
+    def __init__(self, num_days):
+        """
+        Parameters:
+            num_days (int): The span of the average, in days.
+        """
+        if num_days < 1:
+            raise ValueError("num_days must be at least 1")
+        self._alpha = 2 / (num_days + 1)
+        self._average = None
+
+    def process(self, day):
+        """Update the average with one day's closing price.
+
+        Parameters:
+            day (TradingData): Trading data for one stock on one day.
+        """
+        close = day.get_close()
+        if self._average is None:
+            self._average = close
+        else:
+            self._average += self._alpha * (close - self._average)
+
+    def reset(self):
+        """Reset the analysis process in order to perform a new analysis."""
+        self._average = None
+
+    def result(self):
+        """Return the current exponential moving average.
+
+        Return:
+            float: The average, or None if no days have been processed.
+        """
+        return self._average
+
+
+class RollingStdDev(Analyser):
+    """Population standard deviation of closing prices over recent days."""
+
+    def __init__(self, num_days):
+        """
+        Parameters:
+            num_days (int): The number of days in the window.
+        """
+        self._num_days = num_days
+        self._window = RollingWindow(num_days)
+
+    def process(self, day):
+        """Add one day's closing price to the window.
+
+        Parameters:
+            day (TradingData): Trading data for one stock on one day.
+        """
+        self._window.push(day.get_close())
+
+    def reset(self):
+        """Reset the analysis process in order to perform a new analysis."""
+        self._window = RollingWindow(self._num_days)
+
+    def result(self):
+        """Return the standard deviation over the last num_days.
+
+        Return:
+            float: The standard deviation, or None if no days were processed.
+        """
+        return self._window.std_dev()
+
+
+class RollingHighLow(Analyser):
+    """Highest and lowest prices paid for a stock over recent days."""
+
+    def __init__(self, num_days):
+        """
+        Parameters:
+            num_days (int): The number of days in the window.
+        """
+        self._num_days = num_days
+        self._highs = RollingExtrema(num_days)
+        self._lows = RollingExtrema(num_days)
+
+    def process(self, day):
+        """Add one day's highest and lowest prices to the window.
+
+        Parameters:
+            day (TradingData): Trading data for one stock on one day.
+        """
+        self._highs.push(day.get_high())
+        self._lows.push(day.get_low())
+
+    def reset(self):
+        """Reset the analysis process in order to perform a new analysis."""
+        self._highs = RollingExtrema(self._num_days)
+        self._lows = RollingExtrema(self._num_days)
+
+    def result(self):
+        """Return the highest and lowest prices over the last num_days.
+
+        Return:
+            tuple: the high value and then the low value (None if no days
+                   have been processed).
+        """
+        return self._highs.maximum(), self._lows.minimum()
+
+
+class BollingerBands(Analyser):
+    """Moving average of closing prices with bands a number of standard
+       deviations above and below it."""
+
+    def __init__(self, num_days=20, width=2.0):
+        """
+        Parameters:
+            num_days (int): The number of days in the window.
+            width (float): Distance of the bands from the average, in
+                           standard deviations.
+        """
+        self._num_days = num_days
+        self._width = width
+        self._window = RollingWindow(num_days)
+
+    def process(self, day):
+        """Add one day's closing price to the window.
+
+        Parameters:
+            day (TradingData): Trading data for one stock on one day.
+        """
+        self._window.push(day.get_close())
+
+    def reset(self):
+        """Reset the analysis process in order to perform a new analysis."""
+        self._window = RollingWindow(self._num_days)
+
+    def result(self):
+        """Return the bands over the last num_days.
+
+        Return:
+            tuple: the lower band, the moving average and the upper band, or
+                   None if no days have been processed.
+        """
+        middle = self._window.mean()
+        if middle is None:
+            return None
+        offset = self._width * self._window.std_dev()
+        return middle - offset, middle, middle + offset
@@ -0,0 +1,281 @@
+"""
+    Stock market data in shared memory, for use by many worker processes.
+
+    'SharedStockCollection.share' copies a collection's trading data into a
+    single shared memory block once. Its handle is small enough to send to
+    any number of worker processes, which attach to the block and use the
+    data in place, read-only, through ordinary ColumnarStock objects.
+
+    Block layout: one block per column in TradingColumns.COLUMNS order, each
+    aligned to 8 bytes and holding the rows of every stock, stock after
+    stock in handle code order.
+"""
+import os
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+from parallel import CHUNKS_PER_PROCESS
+from snapshot import MappedColumns
+from stocks import ColumnarStock, StockCollection, TradingColumns
+
+_ALIGNMENT = 8
+
+
+def _block_offsets(total):
+    """Return the offset of each column block and the size of all blocks.
+
+    Parameters:
+        total (int): Number of rows of all stocks together.
+    """
+    offsets = []
+    offset = 0
+    for typecode in TradingColumns.TYPECODES:
+        offset += -offset % _ALIGNMENT
+        offsets.append(offset)
+        offset += array(typecode).itemsize * total
+    return offsets, offset
+
+
+def _is_shared(stock):
+    """(bool) True if a stock's columns are views of shared data."""
+    columns = stock.get_columns()
+    return isinstance(columns, MappedColumns) and columns.is_mapped()
+
+
+class SharedDataHandle(object):
+    """Identifies shared trading data; it can be pickled to other processes."""
+
+    def __init__(self, name, codes, counts):
+        """
+        Parameters:
+            name (str): Name of the shared memory block.
+            codes (list<str>): Stock codes, in the order stored.
+            counts (list<int>): Number of days stored for each code.
+        """
+        self._name = name
+        self._codes = codes
+        self._counts = counts
+
+    def get_name(self):
+        """(str) Name of the shared memory block."""
+        return self._name
+
+    def get_codes(self):
+        """(list<str>) Stock codes, in the order stored."""
+        return self._codes
+
+    def get_counts(self):
+        """(list<int>) Number of days stored for each code."""
+        return self._counts
+
+
+class SharedStockCollection(StockCollection):
+    """A columnar StockCollection whose data is in a shared memory block.
+
+    The trading data is read-only: changing a day's values raises TypeError.
+    Adding days to a stock copies that stock's data into private arrays
+    first, so other processes do not see the change.
+
+    Every stock obtained from the collection must be released before
+    'close' is called, as the block cannot be unmapped while in use.
+    """
+
+    def __init__(self, handle):
+        """Attach to shared data created by 'share'.
+
+        Parameters:
+            handle (SharedDataHandle): Handle of the shared data.
+        """
+        super().__init__(columnar=True)
+        self._handle = handle
+        self._owner = False
+        self._memory = shared_memory.SharedMemory(handle.get_name())
+        self._add_shared_stocks(handle.get_codes())
+
+    def _add_shared_stocks(self, codes):
+        """Add stocks whose columns are views of the shared data.
+
+        Parameters:
+            codes (collection<str>): Codes of the stocks to add.
+        """
+        handle = self._handle
+        total = sum(handle.get_counts())
+        offsets, _ = _block_offsets(total)
+        buffer = self._memory.buf.toreadonly()
+        blocks = []
+        for typecode, offset in zip(TradingColumns.TYPECODES, offsets):
+            size = array(typecode).itemsize * total
+            blocks.append(buffer[offset:offset + size].cast(typecode))
+        start = 0
+        for code, count in zip(handle.get_codes(), handle.get_counts()):
+            end = start + count
+            if code in codes:
+                columns = MappedColumns([block[start:end]
+                                         for block in blocks])
+                self.add_stock(ColumnarStock(code, columns))
+            start = end
+
+    @classmethod
+    def share(cls, stocks):
+        """Copy all trading data in 'stocks' into a new shared memory block.
+
+        The returned collection owns the block, which is freed when the
+        collection is closed.
+
+        Parameters:
+            stocks (StockCollection): The data to share.
+
+        Return:
+            SharedStockCollection: Collection attached to the new block.
+        """
+        codes = stocks.get_stock_codes()
+        all_columns = [stocks.get_stock(code).get_columns() for code in codes]
+        counts = [len(columns) for columns in all_columns]
+        offsets, size = _block_offsets(sum(counts))
+        # Shared memory blocks cannot be empty.
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            buffer = memory.buf
+            for index, offset in enumerate(offsets):
+                for columns in all_columns:
+                    data = columns.get_columns()[index]
+                    length = data.itemsize * len(data)
+                    buffer[offset:offset + length] = memoryview(data).cast("B")
+                    offset += length
+            del buffer
+            collection = cls(SharedDataHandle(memory.name, codes, counts))
+        except BaseException:
+            memory.close()
+            memory.unlink()
+            raise
+        memory.close()
+        collection._owner = True
+        return collection
+
+    def get_handle(self):
+        """(SharedDataHandle) Handle for attaching to the shared data."""
+        return self._handle
+
+    def close(self):
+        """Detach from the shared data, freeing it if this collection owns it.
+
+        Raises:
+            BufferError: If stocks from the collection are still in use. The
+                         collection is left attached, with the same data.
+        """
+        if self._memory is None:
+            return
+        # Shared stocks are only weakly referenced while closing, so that
+        # the collection does not keep the block in use itself. Stocks that
+        # have been copied out of the block do not use it.
+        stocks = {code: weakref.ref(stock) if _is_shared(stock) else stock
+                  for code, stock in self._all_stocks.items()}
+        self._all_stocks.clear()
+        try:
+            self._memory.close()
+        except BufferError:
+            # The failed close released the block's buffer but left the block
+            # mapped, so the buffer is taken from the same mapping again.
+            self._memory._buf = memoryview(self._memory._mmap)
+            for code, stock in stocks.items():
+                if isinstance(stock, weakref.ref):
+                    stocks[code] = stock()
+            # Shared stocks no longer in use are created again.
+            self._add_shared_stocks({code for code, stock in stocks.items()
+                                     if stock is None})
+            for code, stock in stocks.items():
+                if stock is not None:
+                    self.add_stock(stock)
+            raise
+        if self._owner:
+            self._memory.unlink()
+        self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Collection attached to by each worker process of 'iter_analyse'.
+_worker_stocks = None
+
+
+def _attach_worker(handle):
+    """Attach a worker process to the shared data."""
+    global _worker_stocks
+    _worker_stocks = SharedStockCollection(handle)
+
+
+def _analyse_codes(make_analyser, codes, start, end):
+    """Analyse some of the shared stocks in a worker process.
+
+    Return:
+        dict<str, *>: Result of the analysis, keyed by stock code.
+    """
+    results = {}
+    for code in codes:
+        analyser = make_analyser()
+        _worker_stocks.get_stock(code).analyse(analyser, start, end)
+        results[code] = analyser.result()
+    return results
+
+
+def iter_analyse(handle, make_analyser, processes=None, codes=None,
+                 start=None, end=None):
+    """Analyse shared stocks in parallel, yielding results as they finish.
+
+    Each worker process attaches to the shared data once, so only stock
+    codes and results are sent between processes.
+
+    Parameters:
+        handle (SharedDataHandle): Handle of the shared data.
+        make_analyser (callable): Called with no arguments to create the
+                                  Analyser for each stock. It must be
+                                  picklable.
+        processes (int): Number of worker processes. Defaults to the number
+                         of CPUs.
+        codes (list<str>): Codes of the stocks to analyse. Defaults to
+                           every shared stock.
+        start (str): If given, only days on or after this date are used.
+        end (str): If given, only days on or before this date are used.
+
+    Yield:
+        tuple: (stock code, result) for each stock, in completion order.
+    """
+    days = dict(zip(handle.get_codes(), handle.get_counts()))
+    if codes is None:
+        codes = handle.get_codes()
+    if processes is None:
+        processes = os.cpu_count() or 1
+    num_chunks = max(1, min(len(codes), processes * CHUNKS_PER_PROCESS))
+    chunks = [[] for _ in range(num_chunks)]
+    sizes = [0] * num_chunks
+    # Largest first, each to the chunk with the fewest days so far.
+    for code in sorted(codes, key=days.__getitem__, reverse=True):
+        smallest = sizes.index(min(sizes))
+        chunks[smallest].append(code)
+        sizes[smallest] += days[code]
+    with ProcessPoolExecutor(processes, initializer=_attach_worker,
+                             initargs=(handle,)) as executor:
+        futures = [executor.submit(_analyse_codes, make_analyser, chunk,
+                                   start, end)
+                   for chunk in chunks if chunk]
+        for future in as_completed(futures):
+            yield from future.result().items()
+
+
+def analyse(handle, make_analyser, processes=None, codes=None,
+            start=None, end=None):
+    """Analyse shared stocks in parallel.
+
+    Takes the same parameters as 'iter_analyse'.
+
+    Return:
+        dict<str, *>: Result of the analysis, keyed by stock code.
+    """
+    return dict(iter_analyse(handle, make_analyser, processes, codes,
+                             start, end))
@@ -0,0 +1,240 @@
+"""
+    Binary snapshots of parsed stock market data.
+
+    A snapshot stores every stock's TradingColumns in one file, along with
+    the size and modification time of each source data file. Reading a
+    snapshot memory-maps the file, so the columns are used in place rather
+    than parsed; the snapshot is ignored if any source file has changed.
+
+    File layout (native byte order, blocks aligned to 8 bytes):
+        MAGIC
+        header length (uint32) and JSON header (sources, codes, row counts)
+        one block per column in TradingColumns.COLUMNS order, holding the
+        rows of every stock, stock after stock
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import ingest
+from stocks import ColumnarStock, StockCollection, TradingColumns
+
+MAGIC = b"STKSNAP1"
+# Snapshots are kept next to the data files under this name.
+SNAPSHOT_NAME = ".stocks.snapshot"
+_ALIGNMENT = 8
+_LENGTH = struct.Struct("<I")
+
+
+class MappedColumns(TradingColumns):
+    """TradingColumns whose columns are views of a memory-mapped snapshot.
+
+    Values can be changed in place without affecting the snapshot file. The
+    first operation that adds or removes rows copies the columns into
+    arrays.
+    """
+
+    def __init__(self, columns):
+        """
+        Parameters:
+            columns (list<memoryview>): Six views in TradingColumns.COLUMNS
+                                        order.
+        """
+        super().__init__(columns)
+        self._mapped = True
+
+    def _detach(self):
+        """Copy the columns out of the snapshot into arrays."""
+        if not self._mapped:
+            return
+        copies = []
+        for typecode, column in zip(self.TYPECODES, self.get_columns()):
+            values = array(typecode)
+            values.frombytes(column.cast("B"))
+            copies.append(values)
+        (self._dates, self._opens, self._highs,
+         self._lows, self._closes, self._volumes) = copies
+        self._mapped = False
+
+    def is_mapped(self):
+        """(bool) True while the columns are views of the mapped data."""
+        return self._mapped
+
+    def append(self, *row):
+        self._detach()
+        super().append(*row)
+
+    def extend(self, other):
+        self._detach()
+        super().extend(other)
+
+    def insert(self, index, row):
+        self._detach()
+        super().insert(index, row)
+
+    def clear(self):
+        self._detach()
+        super().clear()
+
+    def __reduce__(self):
+        # Views of the mapped file cannot be pickled, so the rows are pickled
+        # (and copied) by value, as plain TradingColumns.
+        return (TradingColumns, (self.copy().get_columns(),))
+
+
+def snapshot_name(paths):
+    """Return the default snapshot file name for a set of data files.
+
+    Parameters:
+        paths (str | list<str>): A directory of data files or a list of files.
+
+    Return:
+        str: SNAPSHOT_NAME in the directory (or the first file's directory).
+    """
+    if isinstance(paths, str) and os.path.isdir(paths):
+        return os.path.join(paths, SNAPSHOT_NAME)
+    filenames = ingest.list_data_files(paths)
+    directory = os.path.dirname(filenames[0]) if filenames else ""
+    return os.path.join(directory, SNAPSHOT_NAME)
+
+
+def _source_stats(filenames):
+    """Return [name, size, mtime] for each file, used to detect changes."""
+    stats = []
+    for filename in filenames:
+        status = os.stat(filename)
+        stats.append([os.path.abspath(filename), status.st_size,
+                      status.st_mtime_ns])
+    return stats
+
+
+def _padding(offset):
+    """Number of bytes needed to align 'offset' to _ALIGNMENT."""
+    return -offset % _ALIGNMENT
+
+
+def write_snapshot(stocks, sources, filename, source_stats=None):
+    """Write a snapshot of all trading data in 'stocks'.
+
+    The snapshot is written to a temporary file and then renamed, so readers
+    never see a partly written snapshot.
+
+    Parameters:
+        stocks (StockCollection): The data to store.
+        sources (list<str>): Data files the collection was loaded from.
+        filename (str): Name of the snapshot file.
+        source_stats (list): Source details recorded before loading, if the
+                             files may have changed since. Taken now if None.
+    """
+    if source_stats is None:
+        source_stats = _source_stats(sources)
+    codes = stocks.get_stock_codes()
+    counts = []
+    blocks = [array(typecode) for typecode in TradingColumns.TYPECODES]
+    for code in codes:
+        columns = stocks.get_stock(code).get_columns()
+        counts.append(len(columns))
+        for block, column in zip(blocks, columns.get_columns()):
+            block.frombytes(bytes(column))
+    header = json.dumps({"byteorder": sys.byteorder,
+                         "sources": source_stats,
+                         "codes": codes,
+                         "counts": counts}).encode("utf-8")
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(MAGIC)
+        file.write(_LENGTH.pack(len(header)))
+        file.write(header)
+        offset = len(MAGIC) + _LENGTH.size + len(header)
+        for block in blocks:
+            file.write(bytes(_padding(offset)))
+            offset += _padding(offset)
+            file.write(block.tobytes())
+            offset += block.itemsize * len(block)
+    os.replace(temporary, filename)
+
+
+def read_snapshot(filename, sources):
+    """Read a snapshot, if it exists and its source files are unchanged.
+
+    Parameters:
+        filename (str): Name of the snapshot file.
+        sources (list<str>): Data files the snapshot should be built from.
+
+    Return:
+        StockCollection: Columnar collection using the mapped data, or None
+                         if the snapshot is missing, invalid or stale.
+    """
+    try:
+        with open(filename, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError):
+        return None
+    if data[:len(MAGIC)] != MAGIC:
+        return None
+    offset = len(MAGIC)
+    try:
+        length, = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        header = json.loads(data[offset:offset + length].decode("utf-8"))
+        current = _source_stats(sources)
+        if header["byteorder"] != sys.byteorder or \
+                header["sources"] != current:
+            return None
+        if len(header["codes"]) != len(header["counts"]):
+            return None
+        total = sum(header["counts"])
+    except (OSError, ValueError, struct.error, KeyError, TypeError):
+        return None
+    offset += length
+    # Start and size of each column's block, which must end the file.
+    layout = []
+    for typecode in TradingColumns.TYPECODES:
+        offset += _padding(offset)
+        size = array(typecode).itemsize * total
+        layout.append((typecode, offset, size))
+        offset += size
+    if offset != len(data):
+        return None
+    buffer = memoryview(data)
+    blocks = [buffer[start:start + size].cast(typecode)
+              for typecode, start, size in layout]
+    stocks = StockCollection(columnar=True)
+    start = 0
+    for code, count in zip(header["codes"], header["counts"]):
+        end = start + count
+        columns = MappedColumns([block[start:end] for block in blocks])
+        stocks.add_stock(ColumnarStock(code, columns))
+        start = end
+    return stocks
+
+
+def load_cached(paths, snapshot=None, processes=None,
+                on_conflict=ingest.KEEP_LAST):
+    """Load data files through a snapshot kept next to them.
+
+    The snapshot is used if it is up to date; otherwise the files are loaded
+    with 'ingest.load_files' and a new snapshot is written.
+
+    Parameters:
+        paths (str | list<str>): A directory of data files or a list of files.
+        snapshot (str): Snapshot file name. Defaults to 'snapshot_name'.
+        processes (int): Worker processes used if the files are loaded.
+        on_conflict (str): Conflict policy used if the files are loaded.
+
+    Return:
+        StockCollection: Columnar collection of the files' data.
+    """
+    filenames = ingest.list_data_files(paths)
+    if snapshot is None:
+        snapshot = snapshot_name(paths)
+    stocks = read_snapshot(snapshot, filenames)
+    if stocks is None:
+        source_stats = _source_stats(filenames)
+        stocks = ingest.load_files(filenames, processes=processes,
+                                   on_conflict=on_conflict)
+        write_snapshot(stocks, filenames, snapshot, source_stats)
+    return stocks
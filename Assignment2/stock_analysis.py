@@ -3,7 +3,208 @@
     student number = 44443115
     __email__ = yufeng.liu1@uqconnect.edu.au
 """
+from array import array
+from itertools import chain, zip_longest
+
 from stocks import Loader, Analyser, StockCollection, TradingData, AverageVolume
+from stocks import TradingColumns, encode_date, is_date
+from rolling import RollingWindow
+
+# Number of comma-separated fields on each line of a CSV data file.
+CSV_FIELDS = 7
+
+# Triplet file keys, mapped to the position of their value in a record.
+TRIPLET_KEYS = {"DA": 0, "OP": 1, "HI": 2, "LO": 3, "CL": 4, "VO": 5}
+
+
+def parse_csv(text):
+    """Parse comma-separated trading data into columns grouped by stock code.
+
+    The whole text is split into fields in a single pass, each column is
+    converted in a single pass, and the row numbers of each stock are
+    grouped in a dict so that its rows can be gathered straight out of the
+    converted columns.
+
+    Parameters:
+        text (str): Contents of a comma-separated data file.
+
+    Return:
+        dict<str, TradingColumns>: Trading data for each stock code, with rows
+                                   in the order they appear in 'text'.
+
+    Raises:
+        ValueError: If any line, including a blank line, is not a valid line
+                    of trading data.
+    """
+    if not text:
+        return {}
+    if text.endswith("\n"):
+        text = text[:-1]
+    num_rows = text.count("\n") + 1
+    fields = text.replace("\n", ",").split(",")
+    # A line with too few fields, or a blank line, misaligns every later
+    # field, so a miscount is the only check needed on the line structure.
+    if len(fields) != CSV_FIELDS * num_rows:
+        raise ValueError("Expected {0} fields on every line".format(CSV_FIELDS))
+    rows_by_code = {}
+    for row, code in enumerate(fields[0::CSV_FIELDS]):
+        rows = rows_by_code.get(code)
+        if rows is None:
+            rows_by_code[code] = [row]
+        else:
+            rows.append(row)
+    # Rows of the same stock next to each other, then each column converted.
+    order = list(chain.from_iterable(rows_by_code.values()))
+    columns = [array(typecode, map(convert, map(
+                   fields[offset::CSV_FIELDS].__getitem__, order)))
+               for offset, (typecode, convert) in enumerate(
+                   zip(TradingColumns.TYPECODES,
+                       (int, float, float, float, float, int)), start=1)]
+    batch = {}
+    start = 0
+    for code, rows in rows_by_code.items():
+        end = start + len(rows)
+        batch[code] = TradingColumns([column[start:end] for column in columns])
+        start = end
+    return batch
+
+
+def read_triplets(lines):
+    """Parse triplet key-coded trading data one record at a time.
+
+    Each record is six consecutive "code:key:value" lines, one for each key
+    in TRIPLET_KEYS, all for the same stock code. Lines are consumed six at
+    a time; records with their keys in TRIPLET_KEYS order are unpacked
+    straight into place, and any other order is mapped key by key.
+
+    Parameters:
+        lines (iterable<str>): Lines of a triplet file, e.g. an open file.
+
+    Yield:
+        tuple: (code, date, open, high, low, close, volume) for each record,
+               with the same types as the TradingData constructor.
+
+    Raises:
+        ValueError: If a record is malformed. The message starts with the
+                    number of the offending line.
+    """
+    num_keys = len(TRIPLET_KEYS)
+    ordered_keys = tuple(TRIPLET_KEYS)
+    groups = zip_longest(*[iter(lines)] * num_keys)
+    for first_line, group in enumerate(groups):
+        first_line = first_line * num_keys + 1
+        try:
+            ((code, key_0, date), (code_1, key_1, day_open),
+             (code_2, key_2, day_high), (code_3, key_3, day_low),
+             (code_4, key_4, day_close), (code_5, key_5, volume)) = \
+                [line.split(":") for line in group]
+        except (AttributeError, ValueError):
+            # Wrong number of fields or a truncated record.
+            values = None
+        else:
+            if ((key_0, key_1, key_2, key_3, key_4, key_5) == ordered_keys
+                    and code == code_1 == code_2 == code_3 == code_4 == code_5):
+                values = [date.strip(), day_open, day_high, day_low,
+                          day_close, volume]
+            else:
+                values = None
+        if values is None:
+            code, values = _read_triplet_record(group, first_line)
+        date, day_open, day_high, day_low, day_close, volume = values
+        if not is_date(date):
+            _raise_bad_triplet_value(group, first_line)
+        try:
+            yield (code, date, float(day_open), float(day_high),
+                   float(day_low), float(day_close), int(volume))
+        except ValueError:
+            _raise_bad_triplet_value(group, first_line)
+
+
+def parse_triplet(lines):
+    """Parse triplet key-coded trading data into columns grouped by stock code.
+
+    Parameters:
+        lines (iterable<str>): Lines of a triplet file, e.g. an open file.
+
+    Return:
+        dict<str, TradingColumns>: Trading data for each stock code, with rows
+                                   in the order they appear in 'lines'.
+
+    Raises:
+        ValueError: If a record is malformed (see 'read_triplets').
+    """
+    batch = {}
+    for code, date, *values in read_triplets(lines):
+        columns = batch.get(code)
+        if columns is None:
+            columns = batch[code] = TradingColumns()
+        columns.append(encode_date(date), *values)
+    return batch
+
+
+def _raise_bad_triplet_value(group, first_line):
+    """Raise a ValueError naming the line of a record whose value is invalid.
+
+    Parameters:
+        group (tuple<str>): The lines of a record that failed to convert.
+        first_line (int): Line number of the first line in 'group'.
+    """
+    for line_number, line in enumerate(group, start=first_line):
+        _, key, value = line.strip().split(":")
+        try:
+            if key == "VO":
+                int(value)
+            elif key == "DA":
+                if not is_date(value):
+                    raise ValueError(value)
+            else:
+                float(value)
+        except ValueError:
+            raise ValueError("line {0}: invalid {1} value {2!r}"
+                             .format(line_number, key, value))
+
+
+def _read_triplet_record(group, first_line):
+    """Map each line of a triplet record to its slot, validating as it goes.
+
+    Parameters:
+        group (tuple<str>): The record's lines, padded with None at the end
+                            of the file.
+        first_line (int): Line number of the first line in 'group'.
+
+    Return:
+        tuple: The stock code and a list of the record's values in
+               TRIPLET_KEYS order.
+
+    Raises:
+        ValueError: Describing the first malformed line in the record.
+    """
+    code = None
+    values = [None] * len(TRIPLET_KEYS)
+    for line_number, line in enumerate(group, start=first_line):
+        if line is None:
+            raise ValueError("line {0}: incomplete record for {1}"
+                             .format(line_number - 1, code))
+        parts = line.strip().split(":")
+        if len(parts) != 3:
+            raise ValueError("line {0}: expected code:key:value, got {1!r}"
+                             .format(line_number, line.strip()))
+        line_code, key, value = parts
+        slot = TRIPLET_KEYS.get(key)
+        if slot is None:
+            raise ValueError("line {0}: unknown key {1!r}"
+                             .format(line_number, key))
+        if code is None:
+            code = line_code
+        elif line_code != code:
+            raise ValueError("line {0}: stock code changed from {1} to {2} "
+                             "within a record"
+                             .format(line_number, code, line_code))
+        if values[slot] is not None:
+            raise ValueError("line {0}: repeated key {1} for {2}"
+                             .format(line_number, key, code))
+        values[slot] = value
+    return code, values
 
 
 class LoadCSV(Loader):
@@ -51,28 +252,13 @@ class LoadTriplet(Loader):
         super().__init__(filename, stocks)
 
     def _process(self, file):
-        """Iterate through the file, extracting the data from a line"""
-
+        """Stream through the file, extracting the data from each record"""
         try:
-            all_data = file.readlines()
-            for i in range(0, len(all_data), 6):
-                stock_data = all_data[i: i+6]
-                code = stock_data[0].split(":")[0]
-                key_dict = {}
-                for line in stock_data:
-                    _, key, data = line.strip().split(":")
-                    key_dict[key] = data
-
-                trading_data = TradingData(key_dict['DA'],
-                                           float(key_dict['OP']),
-                                           float(key_dict['HI']),
-                                           float(key_dict['LO']),
-                                           float(key_dict['CL']),
-                                           int(key_dict['VO']))
+            for code, *day in read_triplets(file):
                 stock = self._stocks.get_stock(code)
-                stock.add_day_data(trading_data)
-        except ValueError:
-            raise RuntimeError
+                stock.add_day_data(TradingData(*day))
+        except ValueError as error:
+            raise RuntimeError(str(error))
 
 
 class HighLow(Analyser):
@@ -112,6 +298,10 @@ class HighLow(Analyser):
         """
         return self._high, self._low
 
+    def is_order_independent(self):
+        """(bool) The highest and lowest prices do not depend on day order."""
+        return True
+
 
 class MovingAverage(Analyser):
     """Calculates the average closing price of a stock over a specified period
@@ -125,8 +315,7 @@ class MovingAverage(Analyser):
                            average.
         """
         self._num_days = num_days
-        self._close = []
-        self._sums = 0
+        self._close = RollingWindow(num_days)
 
     def process(self, day):
         """Collect the total trading closing price over a number of days.
@@ -134,18 +323,17 @@ class MovingAverage(Analyser):
         Parameters:
             day (TradingData): Trading data for one stock on one day.
         """
-        if len(self._close) < self._num_days:  # make amount of the list's element equal to the number of days
-            for i in range(self._num_days):
-                self._close.append(day.get_close())  # store the processed closing price into the list
-        del (self._close[0])
-        self._close.append(day.get_close())
-        self._sums = sum(self._close)
+        close = day.get_close()
+        if not len(self._close):
+            # Until num_days days are processed, the missing days are
+            # treated as having the first day's closing price.
+            for i in range(self._num_days - 1):
+                self._close.push(close)
+        self._close.push(close)
 
     def reset(self):
         """Reset the analysis process in order to perform a new analysis."""
-        self._num_days = None
-        self._close = None
-        self._sums = 0
+        self._close = RollingWindow(self._num_days)
 
     def result(self):
         """Return the average closing price over the last num_days for the
@@ -154,7 +342,8 @@ class MovingAverage(Analyser):
         Return:
             float: Average closing price of processed stock over the last
                    num_days. """
-        return self._sums / self._num_days
+        # Summed oldest first, in the order the days were processed.
+        return sum(self._close.get_values()) / self._num_days
 
 
 class GapUp(Analyser):
@@ -195,7 +384,7 @@ class GapUp(Analyser):
         """Reset the analysis process in order to perform a new analysis."""
         self._open = None
         self._close = None
-        self._delta = None
+        self._trading_data = None
 
     def result(self):
         """Return the TradingData object which is found by GapUp class.
@@ -0,0 +1,278 @@
+"""
+    Stock market data kept in an SQLite database.
+
+    A DatabaseStockCollection stores every day of trading in one table,
+    indexed by stock code and date, so data loaded once can be queried by
+    any number of later processes without parsing the data files again.
+    Analysers are given TradingDataView rows of the columns read back from
+    the database.
+"""
+import sqlite3
+from array import array
+from itertools import groupby, repeat
+from operator import itemgetter
+
+from stocks import Stock, StockCollection, TradingColumns, TradingData
+from stocks import decode_date, encode_date
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trading_days (
+    code TEXT NOT NULL,
+    date INTEGER NOT NULL,
+    open REAL NOT NULL,
+    high REAL NOT NULL,
+    low REAL NOT NULL,
+    close REAL NOT NULL,
+    volume INTEGER NOT NULL,
+    PRIMARY KEY (code, date)
+) WITHOUT ROWID;
+"""
+_FIELDS = "date, open, high, low, close, volume"
+# Later rows replace earlier rows with the same code and date, as they do
+# when Loaders add days to a Stock.
+_INSERT_DAY = ("INSERT OR REPLACE INTO trading_days (code, " + _FIELDS +
+               ") VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+
+def _date_range(start, end):
+    """Build the SQL condition selecting days between two yyyymmdd dates.
+
+    Return:
+        tuple: The condition (beginning with " AND", or empty) and a list of
+               its parameters.
+    """
+    condition = ""
+    parameters = []
+    if start is not None:
+        condition += " AND date >= ?"
+        parameters.append(encode_date(start))
+    if end is not None:
+        condition += " AND date <= ?"
+        parameters.append(encode_date(end))
+    return condition, parameters
+
+
+def _to_columns(rows):
+    """Convert rows of (date, open, high, low, close, volume) to columns."""
+    if not rows:
+        return TradingColumns()
+    return TradingColumns([array(typecode, values) for typecode, values
+                           in zip(TradingColumns.TYPECODES, zip(*rows))])
+
+
+class DatabaseStock(Stock):
+    """A stock whose trading data is read from and written to a database.
+
+    Days added one at a time are written in the collection's current
+    transaction; call 'DatabaseStockCollection.commit' to make them visible
+    to other connections.
+    """
+
+    def __init__(self, code, collection):
+        """
+        Parameters:
+            code (str): Stock market code (unique identifier).
+            collection (DatabaseStockCollection): Collection holding the
+                                                  database connection.
+        """
+        self._code = code
+        self._collection = collection
+        self._live_analysers = []
+
+    def _query(self, start=None, end=None):
+        """Read the stock's days between two yyyymmdd dates into columns."""
+        condition, parameters = _date_range(start, end)
+        rows = self._collection._connection.execute(
+            "SELECT " + _FIELDS + " FROM trading_days WHERE code = ?" +
+            condition + " ORDER BY date", [self._code] + parameters)
+        return _to_columns(rows.fetchall())
+
+    def add_day_data(self, day):
+        """Add one day of trading data to the stock's data.
+
+        Parameters:
+            day (TradingData): Trading data for one day.
+        """
+        date = encode_date(day.get_date())
+        connection = self._collection._connection
+        if self._live_analysers:
+            replaced, latest = connection.execute(
+                "SELECT EXISTS (SELECT 1 FROM trading_days"
+                " WHERE code = ? AND date = ?),"
+                " (SELECT MAX(date) FROM trading_days WHERE code = ?)",
+                (self._code, date, self._code)).fetchone()
+            appended = latest is None or date > latest
+        connection.execute(_INSERT_DAY, (
+            self._code, date, day.get_open(), day.get_high(), day.get_low(),
+            day.get_close(), day.get_volume()))
+        if self._live_analysers:
+            self._update_live_analysers(day, appended, bool(replaced))
+
+    def add_columns(self, columns):
+        """Add many days of trading data to the stock's data at once.
+
+        Parameters:
+            columns (TradingColumns): Trading data for any number of days.
+        """
+        self._collection.add_columns({self._code: columns})
+
+    def get_day_data(self, date):
+        """Return the trading data for 'date'.
+
+        Parameters:
+            date (str): Date in yyyymmdd format of the trading data to retrieve.
+
+        Return:
+            TradingData: Trading details for the specified date or None.
+        """
+        row = self._collection._connection.execute(
+            "SELECT " + _FIELDS + " FROM trading_days"
+            " WHERE code = ? AND date = ?",
+            (self._code, encode_date(date))).fetchone()
+        if row is None:
+            return None
+        return TradingData(decode_date(row[0]), *row[1:])
+
+    def analyse(self, analyser, start=None, end=None):
+        """Allow any type of analysis to be performed on this stock's
+            trading data.
+
+        Data is processed in date order, one query being made for the days
+        between 'start' and 'end'.
+
+        Parameters:
+            analyser (Analyser): The object that will perform the analysis.
+            start (str): If given, only days on or after this yyyymmdd date
+                         are processed.
+            end (str): If given, only days on or before this yyyymmdd date
+                       are processed.
+        """
+        for day in self._query(start, end):
+            analyser.process(day)
+
+    def analyse_columns(self, analyser, start=None, end=None):
+        """Give a column analyser all of this stock's trading data at once.
+
+        Parameters:
+            analyser (ColumnAnalyser): The object that will perform the
+                                       analysis.
+            start (str): If given, only days on or after this yyyymmdd date
+                         are included.
+            end (str): If given, only days on or before this yyyymmdd date
+                       are included.
+        """
+        analyser.process_columns(self._query(start, end))
+
+    def get_columns(self):
+        """Return the stock's trading data as columns in date order.
+
+        Return:
+            TradingColumns: A copy of the trading data.
+        """
+        return self._query()
+
+
+class DatabaseStockCollection(StockCollection):
+    """A StockCollection stored in an SQLite database file.
+
+    Several processes can open the same file; the database is used in
+    write-ahead log mode so that readers are not blocked by a writer. A
+    stock is only listed by 'get_stock_codes' once it has trading data.
+    """
+
+    def __init__(self, filename):
+        """
+        Parameters:
+            filename (str): Name of the database file, which is created if
+                            it does not exist.
+        """
+        super().__init__()
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(_SCHEMA)
+
+    def _new_stock(self, stock_code):
+        """Create the Stock object used to access data for 'stock_code'."""
+        return DatabaseStock(stock_code, self)
+
+    def add_columns(self, columns_by_code):
+        """Add trading data for many stocks in one transaction.
+
+        Parameters:
+            columns_by_code (dict<str, TradingColumns>): Trading data to add,
+                                                         keyed by stock code.
+        """
+        with self._connection:
+            for stock_code, columns in columns_by_code.items():
+                stock = self.get_stock(stock_code)
+                if stock._live_analysers:
+                    # Attached analysers are updated one day at a time.
+                    for day in columns:
+                        stock.add_day_data(day)
+                    continue
+                self._connection.executemany(_INSERT_DAY, zip(
+                    repeat(stock_code), *columns.get_columns()))
+
+    def analyse(self, make_analyser, start=None, end=None):
+        """Run a fresh analyser over every stock in the collection.
+
+        All stocks' days are read in a single query.
+
+        Parameters:
+            make_analyser (callable): Called with no arguments to create the
+                                      Analyser for each stock.
+            start (str): If given, only days on or after this date are used.
+            end (str): If given, only days on or before this date are used.
+
+        Return:
+            dict<str, *>: Result of the analysis, keyed by stock code.
+        """
+        condition, parameters = _date_range(start, end)
+        rows = self._connection.execute(
+            "SELECT code, " + _FIELDS + " FROM trading_days WHERE 1" +
+            condition + " ORDER BY code, date", parameters)
+        analysers = {}
+        for stock_code, group in groupby(rows, itemgetter(0)):
+            analyser = analysers[stock_code] = make_analyser()
+            for day in _to_columns([row[1:] for row in group]):
+                analyser.process(day)
+        results = {}
+        for stock_code in self.get_stock_codes():
+            analyser = analysers.get(stock_code)
+            if analyser is None:
+                analyser = make_analyser()
+            results[stock_code] = analyser.result()
+        return results
+
+    def add_stock(self, stock):
+        """Add a Stock's data, replacing any stock with the same code.
+
+        Parameters:
+            stock (Stock): The stock to add.
+        """
+        stock_code = str(stock)
+        columns = stock.get_columns()
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM trading_days WHERE code = ?", (stock_code,))
+            self._connection.executemany(_INSERT_DAY, zip(
+                repeat(stock_code), *columns.get_columns()))
+
+    def get_stock_codes(self):
+        """(list<str>) Codes of all stocks in the collection, in sorted order."""
+        return [code for code, in self._connection.execute(
+            "SELECT DISTINCT code FROM trading_days ORDER BY code")]
+
+    def list_stocks(self):
+        """Simple output of all stocks in the collection."""
+        for stock_code in self.get_stock_codes():
+            print("{0}".format(stock_code))
+
+    def commit(self):
+        """Commit days added one at a time, e.g. by LoadTriplet."""
+        self._connection.commit()
+
+    def close(self):
+        """Commit any added days and close the database."""
+        self._connection.commit()
+        self._connection.close()
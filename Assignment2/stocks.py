@@ -4,14 +4,110 @@
     StockCollection: All stock market data stored in application.
     Stock: Data for a single stock.
     TradingData: Data for a single day of trading in one stock.
+    TradingColumns: Many days of trading data held in typed arrays.
+    TradingDataView: TradingData compatible view of one row of TradingColumns.
+    ColumnarStock: Stock whose trading data is stored in TradingColumns.
     Loader: Abstract class defining the process of loading stock market data.
     Analyser: Abstract class defining the interface for analysing stock data.
     AverageVolume: Analyse a single stock's data to determine its average volume.
+    AnalysisPipeline: Run several analysers in a single pass over the data.
     
     __author__ = "Richard Thomas"
     __email__ = "richard.thomas@uq.edu.au"
 """
 
+import bz2
+import gzip
+import lzma
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Mapping
+from itertools import islice, repeat
+from operator import lt
+
+# Leading bytes identifying each supported compression format, and the
+# function that opens a file in that format.
+COMPRESSION_FORMATS = (
+    ("gzip", b"\x1f\x8b", gzip.open),
+    ("bz2", b"BZh", bz2.open),
+    ("xz", b"\xfd7zXZ\x00", lzma.open),
+)
+
+
+def is_date(value) :
+    """(bool) True if 'value' is a date in yyyymmdd format."""
+    return len(value) == 8 and value.isascii() and value.isdigit()
+
+
+def encode_date(date) :
+    """Convert a date in yyyymmdd format into its integer encoding.
+
+    The encoding preserves date order, so encoded dates can be compared and
+    binary searched directly.
+
+    Parameters:
+        date (str): Date in yyyymmdd format.
+
+    Return:
+        int: The date as a yyyymmdd integer.
+
+    Raises:
+        ValueError: If 'date' is not exactly eight ASCII digits.
+    """
+    if not is_date(date) :
+        raise ValueError("Invalid date: {0!r}".format(date))
+    return int(date)
+
+
+def decode_date(value) :
+    """Convert an integer encoded date back into yyyymmdd format.
+
+    Parameters:
+        value (int): Date encoded by 'encode_date'.
+
+    Return:
+        str: Date in yyyymmdd format.
+    """
+    return "{0:08d}".format(value)
+
+
+def detect_compression(filename) :
+    """Determine how a file is compressed from its first few bytes.
+
+    Parameters:
+        filename (str): Name of the file.
+
+    Return:
+        str: One of the names in COMPRESSION_FORMATS, or None if the file is
+             not compressed.
+    """
+    with open(filename, "rb") as file :
+        magic = file.read(max(len(prefix)
+                              for _, prefix, _ in COMPRESSION_FORMATS))
+    for name, prefix, _ in COMPRESSION_FORMATS :
+        if magic.startswith(prefix) :
+            return name
+    return None
+
+
+def open_data_file(filename) :
+    """Open a data file for reading as text, decompressing it if necessary.
+
+    Compressed files are decompressed as they are read, a block at a time,
+    so they are never decompressed in full on disk or in memory.
+
+    Parameters:
+        filename (str): Name of a plain, gzip, bz2 or xz compressed file.
+
+    Return:
+        file: The file, open in text mode.
+    """
+    compression = detect_compression(filename)
+    for name, _, open_compressed in COMPRESSION_FORMATS :
+        if name == compression :
+            return open_compressed(filename, "rt")
+    return open(filename, "r")
+
 
 class TradingData(object) :
     """Stock market data for a single day of trading for one stock.
@@ -23,7 +119,13 @@ class TradingData(object) :
             Value of lowest trade
             Value of closing (final) trade
             Volume of shares traded
+
+        Instances have no attribute dictionary, keeping the cost of a day
+        small when millions of days are loaded. The date string is held as
+        given, so a Stock keyed by date shares it rather than decoding a copy.
     """
+
+    __slots__ = ("_date", "_open", "_high", "_low", "_close", "_volume")
     
     def __init__(self, date, day_open, day_high, day_low, day_close, volume) :
         """
@@ -34,7 +136,12 @@ class TradingData(object) :
             day_low  (float): Dollar value of the lowest trade of the day.
             day_close (float): Dollar value of the last trade of the day.
             volume (int): The number of shares traded on this day.
+
+        Raises:
+            ValueError: If 'date' is not in yyyymmdd format.
         """
+        if not is_date(date) :
+            raise ValueError("Invalid date: {0!r}".format(date))
         self._date = date
         self._open = day_open
         self._high = day_high
@@ -47,6 +154,8 @@ class TradingData(object) :
         return self._date
 
     def set_date(self, date) :
+        if not is_date(date) :
+            raise ValueError("Invalid date: {0!r}".format(date))
         self._date = date
 
     def get_open(self) :
@@ -85,6 +194,268 @@ class TradingData(object) :
         self._volume = volume
 
 
+class TradingColumns(object) :
+    """Trading data for many days held in contiguous typed arrays.
+
+    Each field of a day of trading is a separate column. Dates are stored as
+    yyyymmdd integers (see 'encode_date'), prices as C doubles and volumes
+    as 64 bit integers, so a day costs 44 bytes rather than a TradingData
+    object and its boxed values.
+
+    Indexing or iterating over the columns gives TradingDataView objects,
+    so rows can be passed straight to 'Analyser.process'.
+    """
+
+    # Column names and the array typecode used to store each column.
+    COLUMNS = ("date", "open", "high", "low", "close", "volume")
+    TYPECODES = ("i", "d", "d", "d", "d", "q")
+
+    def __init__(self, columns=None) :
+        """
+        Parameters:
+            columns (tuple<array>): Optional six arrays, in 'COLUMNS' order,
+                                    to adopt as the column storage.
+        """
+        if columns is None :
+            columns = [array(typecode) for typecode in self.TYPECODES]
+        elif len(columns) != len(self.COLUMNS) :
+            raise ValueError("Expected {0} columns, got {1}"
+                             .format(len(self.COLUMNS), len(columns)))
+        (self._dates, self._opens, self._highs,
+         self._lows, self._closes, self._volumes) = columns
+
+    def __len__(self) :
+        return len(self._dates)
+
+    def __getitem__(self, index) :
+        """(TradingDataView) View of the day at row 'index'."""
+        if index < 0 :
+            index += len(self._dates)
+        if not 0 <= index < len(self._dates) :
+            raise IndexError("row index out of range")
+        return TradingDataView(self, index)
+
+    def __iter__(self) :
+        """Iterate over views of each day, in row order."""
+        return map(TradingDataView, repeat(self), range(len(self._dates)))
+
+    def append(self, date, day_open, day_high, day_low, day_close, volume) :
+        """Add one day of trading to the end of the columns.
+
+        Parameters:
+            date (int): Date encoded by 'encode_date'.
+            day_open (float): Dollar value of the first trade of the day.
+            day_high (float): Dollar value of the highest trade of the day.
+            day_low  (float): Dollar value of the lowest trade of the day.
+            day_close (float): Dollar value of the last trade of the day.
+            volume (int): The number of shares traded on this day.
+        """
+        self._dates.append(date)
+        self._opens.append(day_open)
+        self._highs.append(day_high)
+        self._lows.append(day_low)
+        self._closes.append(day_close)
+        self._volumes.append(volume)
+
+    def append_day(self, day) :
+        """Add the TradingData 'day' to the end of the columns."""
+        self.append(encode_date(day.get_date()), day.get_open(),
+                    day.get_high(), day.get_low(), day.get_close(),
+                    day.get_volume())
+
+    def extend(self, other) :
+        """Add all rows of the TradingColumns 'other' to the end."""
+        self._dates.extend(other._dates)
+        self._opens.extend(other._opens)
+        self._highs.extend(other._highs)
+        self._lows.extend(other._lows)
+        self._closes.extend(other._closes)
+        self._volumes.extend(other._volumes)
+
+    def insert(self, index, row) :
+        """Insert 'row', a tuple in 'COLUMNS' order, before 'index'."""
+        for column, value in zip(self.get_columns(), row) :
+            column.insert(index, value)
+
+    def set_row(self, index, row) :
+        """Replace the row at 'index' with 'row', a tuple in 'COLUMNS' order."""
+        for column, value in zip(self.get_columns(), row) :
+            column[index] = value
+
+    def get_row(self, index) :
+        """(tuple) The values of the row at 'index' in 'COLUMNS' order."""
+        return (self._dates[index], self._opens[index], self._highs[index],
+                self._lows[index], self._closes[index], self._volumes[index])
+
+    def get_column(self, name) :
+        """Return the array storing one column.
+
+        Parameters:
+            name (str): One of the names in 'COLUMNS'.
+
+        Return:
+            array: The column's storage (not a copy).
+        """
+        return self.get_columns()[self.COLUMNS.index(name)]
+
+    def get_columns(self) :
+        """(tuple<array>) All six column arrays in 'COLUMNS' order."""
+        return (self._dates, self._opens, self._highs,
+                self._lows, self._closes, self._volumes)
+
+    def copy(self) :
+        """Return a copy of the columns, held in new arrays.
+
+        Return:
+            TradingColumns: Independent copy of all rows.
+        """
+        copies = []
+        for typecode, column in zip(self.TYPECODES, self.get_columns()) :
+            values = array(typecode)
+            values.frombytes(bytes(column))
+            copies.append(values)
+        return TradingColumns(copies)
+
+    def clear(self) :
+        """Remove all rows."""
+        for column in self.get_columns() :
+            del column[:]
+
+    def find(self, date) :
+        """Binary search sorted columns for the row of 'date'.
+
+        Parameters:
+            date (int): Date encoded by 'encode_date'.
+
+        Return:
+            int: Index of the row for 'date', or -1 if there is no such row.
+        """
+        dates = self._dates
+        index = bisect_left(dates, date)
+        if index < len(dates) and dates[index] == date :
+            return index
+        return -1
+
+    def get_slice(self, first, last) :
+        """Return the rows from index 'first' up to (not including) 'last'.
+
+        Return:
+            TradingColumns: The rows, in new storage for array columns.
+        """
+        return TradingColumns([column[first:last]
+                               for column in self.get_columns()])
+
+    def find_range(self, start=None, end=None) :
+        """Binary search sorted columns for the rows between two dates.
+
+        Parameters:
+            start (int): Encoded date of the first day, or None for no limit.
+            end (int): Encoded date of the last day, or None for no limit.
+
+        Return:
+            tuple<int, int>: Index of the first row on or after 'start' and
+                             one past the last row on or before 'end'.
+        """
+        dates = self._dates
+        first = 0 if start is None else bisect_left(dates, start)
+        last = len(dates) if end is None else bisect_right(dates, end)
+        return first, max(first, last)
+
+    def is_sorted(self) :
+        """(bool) True if dates are strictly increasing (sorted and unique)."""
+        dates = self._dates
+        return all(map(lt, dates, islice(dates, 1, None)))
+
+    def nbytes(self) :
+        """(int) Number of bytes used by the column data."""
+        return sum(column.itemsize * len(column)
+                   for column in self.get_columns())
+
+
+class TradingDataView(object) :
+    """TradingData compatible view of one row of a TradingColumns object.
+
+    Views are handed to analysers in place of TradingData objects, so they
+    provide the same getters and setters. Setters write through to the
+    underlying columns. A view remembers its date, so it still refers to the
+    same day if earlier days are later inserted into the columns. Pickling
+    or copying a view gives a TradingData of the day's values.
+    """
+
+    __slots__ = ("_columns", "_row", "_date")
+
+    def __init__(self, columns, row) :
+        """
+        Parameters:
+            columns (TradingColumns): Sorted columns containing the day.
+            row (int): Index of the day in 'columns'.
+        """
+        self._columns = columns
+        self._row = row
+        self._date = columns._dates[row]
+
+    def _index(self) :
+        """Return the current row of this view's date, relocating if needed."""
+        dates = self._columns._dates
+        row = self._row
+        if row >= len(dates) or dates[row] != self._date :
+            row = bisect_left(dates, self._date)
+            if row == len(dates) or dates[row] != self._date :
+                raise LookupError("{0} is no longer in the trading data"
+                                  .format(decode_date(self._date)))
+            self._row = row
+        return row
+
+    def get_date(self) :
+        """(str) The date of this day of trading."""
+        return decode_date(self._date)
+
+    def set_date(self, date) :
+        raise AttributeError("The date of a TradingDataView is fixed")
+
+    def get_open(self) :
+        """(float) Value of the opening trade of the day."""
+        return self._columns._opens[self._index()]
+
+    def set_open(self, day_open) :
+        self._columns._opens[self._index()] = day_open
+
+    def get_high(self) :
+        """(float) Value of highest trade of the day."""
+        return self._columns._highs[self._index()]
+
+    def set_high(self, day_high) :
+        self._columns._highs[self._index()] = day_high
+
+    def get_low(self) :
+        """(float) Value of lowest trade of the day."""
+        return self._columns._lows[self._index()]
+
+    def set_low(self, day_low) :
+        self._columns._lows[self._index()] = day_low
+
+    def get_close(self) :
+        """(float) Value of final trade of the day."""
+        return self._columns._closes[self._index()]
+
+    def set_close(self, day_close) :
+        self._columns._closes[self._index()] = day_close
+
+    def get_volume(self) :
+        """(int) Number of shares traded on the day."""
+        return self._columns._volumes[self._index()]
+
+    def set_volume(self, volume) :
+        self._columns._volumes[self._index()] = volume
+
+    def __reduce__(self) :
+        # A view refers to all of its columns, which may be in shared or
+        # mapped memory, so it is pickled (and copied) as a TradingData.
+        return (TradingData, (self.get_date(), self.get_open(),
+                              self.get_high(), self.get_low(),
+                              self.get_close(), self.get_volume()))
+
+
 class Analyser(object) :
     """Abstract class representing any form of stock data analysis."""
     
@@ -108,6 +479,17 @@ class Analyser(object) :
         """
         raise NotImplementedError()
 
+    def is_order_independent(self) :
+        """Return whether the result is independent of the order of the days.
+
+        A live analyser (see Stock.attach) that is order independent can
+        process a late day directly instead of repeating the analysis.
+
+        Return:
+            bool: False, unless overridden by a subclass.
+        """
+        return False
+
 
 class AverageVolume(Analyser) :
     """Determine the average trading volume for a single stock."""
@@ -138,6 +520,48 @@ class AverageVolume(Analyser) :
         """
         return self._volume // self._num_days_analysed
 
+    def is_order_independent(self) :
+        """(bool) The average does not depend on the order of the days."""
+        return True
+
+
+class AnalysisPipeline(Analyser) :
+    """Feed each day of trading data to several analysers in one pass."""
+
+    def __init__(self, analysers) :
+        """
+        Parameters:
+            analysers (list<Analyser>): Analysers to run, in result order.
+        """
+        self._analysers = list(analysers)
+
+    def process(self, day) :
+        """Pass one day of trading data to every analyser in the pipeline.
+
+        Parameters:
+            day (TradingData): Trading data for one stock on one day.
+        """
+        for analyser in self._analysers :
+            analyser.process(day)
+
+    def reset(self) :
+        """Reset every analyser in the pipeline."""
+        for analyser in self._analysers :
+            analyser.reset()
+
+    def result(self) :
+        """Return the result of every analyser in the pipeline.
+
+        Return:
+            list: Each analyser's result, in the order given to the pipeline.
+        """
+        return [analyser.result() for analyser in self._analysers]
+
+    def is_order_independent(self) :
+        """(bool) True if every analyser in the pipeline is order independent."""
+        return all(analyser.is_order_independent()
+                   for analyser in self._analysers)
+
 
 class Stock(object) :
     """A single stock listed on the stock market and its trading data."""
@@ -149,16 +573,66 @@ class Stock(object) :
         """
         self._code = code
         self._trading_data = {}
+        # Keys of '_trading_data' kept in date order.
+        self._dates = []
+        self._live_analysers = []
 
     def add_day_data(self, day) :
         """Add one day of trading data to the stock's data.
 
+        Attached analysers are updated with the new day.
+
         Parameters:
             day (TradingData): Trading data for one day.
         """
         # Trading data key is the date stored in the TradingData object
         # and value is the TradingData object.
-        self._trading_data[day.get_date()] = day
+        date = day.get_date()
+        replaced = date in self._trading_data
+        appended = False
+        if not replaced :
+            # Days usually arrive in date order, so try appending first.
+            if not self._dates or date > self._dates[-1] :
+                self._dates.append(date)
+                appended = True
+            else :
+                insort(self._dates, date)
+        self._trading_data[date] = day
+        if self._live_analysers :
+            self._update_live_analysers(day, appended, replaced)
+
+    def attach(self, analyser) :
+        """Keep an analyser's result up to date as days are added.
+
+        The analyser processes the existing data immediately. After that,
+        each day added to the stock is processed by the analyser if it is
+        the latest day; otherwise the analysis is repeated, unless the
+        analyser is order independent and the day is new.
+
+        Parameters:
+            analyser (Analyser): The analyser to keep up to date.
+        """
+        self.analyse(analyser)
+        self._live_analysers.append(analyser)
+
+    def detach(self, analyser) :
+        """Stop updating an analyser previously passed to 'attach'."""
+        self._live_analysers.remove(analyser)
+
+    def _update_live_analysers(self, day, appended, replaced) :
+        """Bring attached analysers up to date after 'day' has been added.
+
+        Parameters:
+            day (TradingData): The day that was added.
+            appended (bool): True if 'day' is later than all other days.
+            replaced (bool): True if 'day' replaced a day with the same date.
+        """
+        for analyser in self._live_analysers :
+            if appended or (not replaced and analyser.is_order_independent()) :
+                analyser.process(day)
+            else :
+                analyser.reset()
+                self.analyse(analyser)
 
     def get_day_data(self, date) :
         """Return the trading data for 'date'.
@@ -171,7 +645,7 @@ class Stock(object) :
         """
         return self._trading_data.get(date)
 
-    def analyse(self, analyser) :
+    def analyse(self, analyser, start=None, end=None) :
         """Allow any type of analysis to be performed on this stock's
             trading data.
 
@@ -179,21 +653,261 @@ class Stock(object) :
 
         Parameters:
             analyser (Analyser): The object that will perform the analysis.
+            start (str): If given, only days on or after this yyyymmdd date
+                         are processed.
+            end (str): If given, only days on or before this yyyymmdd date
+                       are processed.
         """
-        sorted_dates = sorted(self._trading_data.keys())
-        for date in sorted_dates :
+        first = 0 if start is None else bisect_left(self._dates, start)
+        last = (len(self._dates) if end is None
+                else bisect_right(self._dates, end))
+        for date in self._dates[first:last] :
             analyser.process(self._trading_data[date])
 
+    def analyse_columns(self, analyser, start=None, end=None) :
+        """Give a column analyser all of this stock's trading data at once.
+
+        Parameters:
+            analyser (ColumnAnalyser): The object that will perform the
+                                       analysis.
+            start (str): If given, only days on or after this yyyymmdd date
+                         are included.
+            end (str): If given, only days on or before this yyyymmdd date
+                       are included.
+        """
+        columns = self.get_columns()
+        first, last = columns.find_range(
+            None if start is None else encode_date(start),
+            None if end is None else encode_date(end))
+        if first != 0 or last != len(columns) :
+            columns = columns.get_slice(first, last)
+        analyser.process_columns(columns)
+
+    def add_columns(self, columns) :
+        """Add many days of trading data to the stock's data at once.
+
+        Days are added in row order, so a later row replaces an earlier row
+        (or existing day) with the same date.
+
+        Parameters:
+            columns (TradingColumns): Trading data for any number of days.
+        """
+        dates, opens, highs, lows, closes, volumes = columns.get_columns()
+        date_strings = list(map(decode_date, dates))
+        days = map(TradingData, date_strings, opens, highs, lows, closes,
+                   volumes)
+        if self._live_analysers :
+            # Each day must be seen by the attached analysers.
+            for day in days :
+                self.add_day_data(day)
+            return
+        self._trading_data.update(zip(date_strings, days))
+        if columns.is_sorted() and (not self._dates or not date_strings
+                                    or date_strings[0] > self._dates[-1]) :
+            # Usually the new days are all later than the existing days.
+            self._dates.extend(date_strings)
+        else :
+            self._dates = sorted(self._trading_data)
+
+    def get_columns(self) :
+        """Return the stock's trading data as columns in date order.
+
+        Return:
+            TradingColumns: The trading data. Callers must not modify it.
+        """
+        columns = TradingColumns()
+        for date in self._dates :
+            columns.append_day(self._trading_data[date])
+        return columns
+
     def __str__(self) :
         return self._code
 
 
+class _ColumnarDays(Mapping) :
+    """Read-only mapping of date strings to views of sorted TradingColumns.
+
+    Stands in for the dictionary of TradingData objects used by Stock.
+    """
+
+    def __init__(self, columns) :
+        self._columns = columns
+
+    def __getitem__(self, date) :
+        try :
+            index = self._columns.find(encode_date(date))
+        except (TypeError, ValueError) :
+            index = -1
+        if index < 0 :
+            raise KeyError(date)
+        return TradingDataView(self._columns, index)
+
+    def __iter__(self) :
+        return map(decode_date, self._columns.get_column("date"))
+
+    def __len__(self) :
+        return len(self._columns)
+
+
+class ColumnarStock(Stock) :
+    """A stock whose trading data is stored in contiguous typed arrays.
+
+    Days are kept sorted by date, with a fast path for days that are later
+    than any already stored. Analysers are given TradingDataView objects in
+    place of TradingData objects.
+    """
+
+    def __init__(self, code, columns=None) :
+        """
+        Parameters:
+            code (str): Stock market code (unique identifier).
+            columns (TradingColumns): Optional initial trading data, which
+                                      must be sorted with unique dates. It
+                                      is used as the stock's storage.
+        """
+        self._code = code
+        self._columns = TradingColumns() if columns is None else columns
+        self._live_analysers = []
+
+    @property
+    def _trading_data(self) :
+        """(_ColumnarDays) Mapping standing in for Stock's TradingData dict."""
+        return _ColumnarDays(self._columns)
+
+    def add_day_data(self, day) :
+        """Add one day of trading data to the stock's data.
+
+        Parameters:
+            day (TradingData): Trading data for one day.
+        """
+        index, appended, replaced = self._add_row(
+            (encode_date(day.get_date()), day.get_open(), day.get_high(),
+             day.get_low(), day.get_close(), day.get_volume()))
+        if self._live_analysers :
+            self._update_live_analysers(TradingDataView(self._columns, index),
+                                        appended, replaced)
+
+    def _add_row(self, row) :
+        """Add or replace one row, keeping the columns sorted by date.
+
+        Return:
+            tuple: The row's index, whether it was appended after all other
+                   rows and whether it replaced a row with the same date.
+        """
+        columns = self._columns
+        dates = columns.get_column("date")
+        date = row[0]
+        if not dates or date > dates[-1] :
+            columns.append(*row)
+            return len(columns) - 1, True, False
+        index = bisect_left(dates, date)
+        if dates[index] == date :
+            columns.set_row(index, row)
+            return index, False, True
+        columns.insert(index, row)
+        return index, False, False
+
+    def add_columns(self, columns) :
+        """Add many days of trading data to the stock's data at once.
+
+        Sorted columns that start after the last stored day are appended
+        directly, or adopted as the stock's storage if it has no data yet;
+        anything else is merged, with rows from 'columns' replacing existing
+        days that have the same date.
+
+        Parameters:
+            columns (TradingColumns): Trading data for any number of days.
+                                      It must not be modified afterwards.
+        """
+        if not len(columns) :
+            return
+        dates = self._columns._dates
+        if ((not dates or columns._dates[0] > dates[-1])
+                and columns.is_sorted()) :
+            first = len(dates)
+            if dates :
+                self._columns.extend(columns)
+            else :
+                self._columns = columns
+            # Attached analysers only need to see the appended days.
+            for analyser in self._live_analysers :
+                for row in range(first, len(self._columns)) :
+                    analyser.process(TradingDataView(self._columns, row))
+            return
+        # Later sources win, so existing rows are overwritten by new rows.
+        rows = {}
+        for source in (self._columns, columns) :
+            for index in range(len(source)) :
+                row = source.get_row(index)
+                rows[row[0]] = row
+        merged = TradingColumns()
+        for date in sorted(rows) :
+            merged.append(*rows[date])
+        self._columns.clear()
+        self._columns.extend(merged)
+        for analyser in self._live_analysers :
+            analyser.reset()
+            self.analyse(analyser)
+
+    def get_day_data(self, date) :
+        """Return the trading data for 'date'.
+
+        Parameters:
+            date (str): Date in yyyymmdd format of the trading data to retrieve.
+
+        Return:
+            TradingDataView: Trading details for the specified date or None.
+        """
+        return self._trading_data.get(date)
+
+    def analyse(self, analyser, start=None, end=None) :
+        """Allow any type of analysis to be performed on this stock's
+            trading data.
+
+        Data is processed in date order.
+
+        Parameters:
+            analyser (Analyser): The object that will perform the analysis.
+            start (str): If given, only days on or after this yyyymmdd date
+                         are processed.
+            end (str): If given, only days on or before this yyyymmdd date
+                       are processed.
+        """
+        columns = self._columns
+        first, last = columns.find_range(
+            None if start is None else encode_date(start),
+            None if end is None else encode_date(end))
+        for row in range(first, last) :
+            analyser.process(TradingDataView(columns, row))
+
+    def get_columns(self) :
+        """Return the stock's trading data as columns in date order.
+
+        Return:
+            TradingColumns: The trading data. Callers must not modify it.
+        """
+        return self._columns
+
+
 class StockCollection(object) :
     """Provides access to all stock market data."""
 
-    def __init__(self) :
+    def __init__(self, columnar=False) :
+        """
+        Parameters:
+            columnar (bool): If True, stocks store their trading data in
+                             typed arrays (ColumnarStock) rather than as
+                             TradingData objects.
+        """
+        self._columnar = columnar
         self._all_stocks = {}
 
+    def _new_stock(self, stock_code) :
+        """Create the Stock object used to store data for 'stock_code'."""
+        if self._columnar :
+            return ColumnarStock(stock_code)
+        return Stock(stock_code)
+
     def get_stock(self, stock_code) :
         """Look up a stock object based on its stock market code.
 
@@ -210,9 +924,54 @@ class StockCollection(object) :
         # mapped to 'Stock' objects.
         # Either the stock is found in '_all_stocks' or a new 'Stock' object is
         # created if this is the first time this stock code has been loaded.
-        self._all_stocks[stock_code] = self._all_stocks.get(stock_code,
-                                                            Stock(stock_code))
-        return self._all_stocks[stock_code]
+        stock = self._all_stocks.get(stock_code)
+        if stock is None :
+            stock = self._new_stock(stock_code)
+            self._all_stocks[stock_code] = stock
+        return stock
+
+    def add_columns(self, columns_by_code) :
+        """Add trading data for many stocks in one batch.
+
+        Parameters:
+            columns_by_code (dict<str, TradingColumns>): Trading data to add,
+                                                         keyed by stock code.
+        """
+        for stock_code, columns in columns_by_code.items() :
+            self.get_stock(stock_code).add_columns(columns)
+
+    def analyse(self, make_analyser, start=None, end=None) :
+        """Run a fresh analyser over every stock in the collection.
+
+        Parameters:
+            make_analyser (callable): Called with no arguments to create the
+                                      Analyser for each stock, e.g. a class
+                                      or a function returning an
+                                      AnalysisPipeline.
+            start (str): If given, only days on or after this date are used.
+            end (str): If given, only days on or before this date are used.
+
+        Return:
+            dict<str, *>: Result of the analysis, keyed by stock code.
+        """
+        results = {}
+        for stock_code, stock in self._all_stocks.items() :
+            analyser = make_analyser()
+            stock.analyse(analyser, start, end)
+            results[stock_code] = analyser.result()
+        return results
+
+    def add_stock(self, stock) :
+        """Add a Stock object, replacing any stock with the same code.
+
+        Parameters:
+            stock (Stock): The stock to add.
+        """
+        self._all_stocks[str(stock)] = stock
+
+    def get_stock_codes(self) :
+        """(list<str>) Codes of all stocks in the collection, in sorted order."""
+        return sorted(self._all_stocks)
 
     def list_stocks(self) :
         """Simple output of all stocks in the collection."""
@@ -233,10 +992,21 @@ class Loader(object) :
         """
         # Maintain a reference to the stock colletion into which data is loaded.
         self._stocks = stocks
-        with open(filename, "r") as file :
+        with self._open(filename) as file :
             # Use format specific subclass to parse the data in the file.
             self._process(file)
 
+    def _open(self, filename) :
+        """Open 'filename' for '_process', in text mode unless overridden.
+
+        Compressed files are decompressed as they are read (see
+        'open_data_file').
+
+        Return:
+            A context manager giving the object passed to '_process'.
+        """
+        return open_data_file(filename)
+
     def _process(self, file) :
         """Load and parse the stock market data from 'file'."""
         raise NotImplementedError()
@@ -0,0 +1,143 @@
+"""
+    Sweeping analysers over a grid of parameter values.
+
+    A sweep analyser gives the results for many parameter values from one
+    pass over a stock's data, sharing the work between them where it can:
+    MovingAverageSweep finds every window length's average from one array
+    of running totals, and GapUpSweep finds the latest gap up day for every
+    delta from one array of gaps. ParameterSweep runs one analyser for each
+    value side by side, for analysers with no sweep of their own.
+
+    'sweep' runs a sweep analyser over a collection in worker processes
+    (see parallel.py) and arranges the results by parameter value.
+"""
+from bisect import bisect_right
+from itertools import accumulate, chain, repeat
+from operator import sub
+
+from column_analysis import ColumnAnalyser
+from parallel import iter_analyse
+from stocks import AnalysisPipeline, TradingDataView
+
+
+class ParameterSweep(AnalysisPipeline):
+    """Runs one analyser for each parameter value over the same days."""
+
+    def __init__(self, make_analyser, values):
+        """
+        Parameters:
+            make_analyser (callable): Called with one parameter value to
+                                      create its Analyser, e.g. GapUp.
+            values (list): The parameter values.
+        """
+        self._values = list(values)
+        super().__init__([make_analyser(value) for value in self._values])
+
+    def result(self):
+        """Return the result of each value's analyser.
+
+        Return:
+            dict: Result keyed by parameter value.
+        """
+        return dict(zip(self._values, super().result()))
+
+
+class MovingAverageSweep(ColumnAnalyser):
+    """Calculates the average closing price over several numbers of days."""
+
+    def __init__(self, windows):
+        """
+        Parameters:
+            windows (list<int>): The numbers of days over which to calculate
+                                 averages.
+        """
+        super().__init__()
+        self._windows = sorted(set(windows))
+
+    def analyse_columns(self, columns):
+        """Return the average closing price over the last days of each window.
+
+        As with MovingAverage, if there are fewer days than a window the
+        missing days are treated as having the first day's closing price.
+
+        Return:
+            dict<int, float>: Average keyed by number of days.
+        """
+        closes = columns.get_column("close")
+        if not len(closes):
+            return dict.fromkeys(self._windows, 0.0)
+        longest = self._windows[-1]
+        recent = closes[-longest:]
+        # Running totals of the last 'longest' closes, padded at the start.
+        totals = list(accumulate(chain(repeat(closes[0],
+                                              longest - len(recent)),
+                                       recent),
+                                 initial=0.0))
+        last = totals[-1]
+        return {num_days: (last - totals[-num_days - 1]) / num_days
+                for num_days in self._windows}
+
+
+class GapUpSweep(ColumnAnalyser):
+    """Finds the most recent gap up day for each of several deltas."""
+
+    def __init__(self, deltas):
+        """
+        Parameters:
+            deltas (list<float>): Smallest price differences considered
+                                  significant.
+        """
+        super().__init__()
+        self._deltas = list(deltas)
+
+    def analyse_columns(self, columns):
+        """Return the most recent day opening more than each delta above the
+        previous day's close.
+
+        The largest gap from each day to the last day only grows going back
+        in time, so the latest day for a delta is the first day, counting
+        back, at which that largest gap exceeds the delta.
+
+        Return:
+            dict<float, TradingDataView>: Day found keyed by delta, or None.
+        """
+        opens = columns.get_column("open")
+        closes = columns.get_column("close")
+        # Gaps from the last day back to the second day.
+        gaps = list(map(sub, reversed(opens[1:]), reversed(closes[:-1])))
+        largest = list(accumulate(gaps, max))
+        days = {}
+        for delta in self._deltas:
+            position = bisect_right(largest, delta)
+            days[delta] = (TradingDataView(columns, len(gaps) - position)
+                           if position < len(gaps) else None)
+        return days
+
+
+def sweep(stocks, make_sweep, processes=None, codes=None, start=None,
+          end=None):
+    """Run a sweep analyser over every stock in parallel.
+
+    Parameters:
+        stocks (StockCollection): The stocks to analyse.
+        make_sweep (callable): Called with no arguments to create the sweep
+                               analyser for each stock, e.g.
+                               functools.partial(GapUpSweep, deltas). It
+                               must be picklable to use worker processes.
+        processes (int): Number of worker processes. Defaults to the number
+                         of CPUs; 1 analyses the stocks in this process.
+        codes (list<str>): Codes of the stocks to analyse. Defaults to
+                           every stock in the collection.
+        start (str): If given, only days on or after this date are used.
+        end (str): If given, only days on or before this date are used.
+
+    Return:
+        dict<*, dict<str, *>>: For each parameter value, the result for
+                               each stock code.
+    """
+    results = {}
+    for code, by_value in iter_analyse(stocks, make_sweep, processes, codes,
+                                       start, end):
+        for value, result in by_value.items():
+            results.setdefault(value, {})[code] = result
+    return results
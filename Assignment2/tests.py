@@ -25,8 +25,38 @@ Don't take this as a perfect example of code for this course.
 
 __author__ = "Roy Portas"
 """
+import bz2
+import copy
+import functools
+import gc
+import gzip
+import io
+import lzma
+import math
+import os
+import pickle
+import shutil
+import sys
+import tempfile
 import unittest
 import stocks
+import backtest
+import column_analysis
+import correlation
+import gap_scanner
+import ingest
+import lazy_loading
+import mapped_loading
+import parallel
+import partitioned
+import ranking
+import resample
+import rolling
+import shared_stocks
+import snapshot
+import stock_database
+import sweep
+import ticks
 
 # The script to test
 import stock_analysis as sa
@@ -356,6 +386,1556 @@ class GapUpTest(unittest.TestCase):
         self.assertIsNotNone(res, 'GapUp should return a valid TradingData for stock "ADV" in "march1.csv"')
         self.assertEqual(res.get_date(), '20170228', 'GapUp should return correct result for stock "ADV" in "march1.csv"')
 
+class ColumnarStockCollectionTest(unittest.TestCase):
+    """ Test suite for stocks stored in typed arrays
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.all_stocks = stocks.StockCollection(columnar=True)
+        sa.LoadCSV(TEST_FILES['march1.csv'], self.all_stocks)
+        sa.LoadTriplet(TEST_FILES['feb1.trp'], self.all_stocks)
+
+    def test_columnar_stock(self):
+        """ Columnar collections create ColumnarStock objects
+        """
+        stock = self.all_stocks.get_stock("ADV")
+        self.assertIsInstance(stock, stocks.ColumnarStock)
+        self.assertEqual(len(stock._trading_data.keys()), 10)
+
+    def test_matches_dict_storage(self):
+        """ Analysers give the same results as with TradingData storage
+        """
+        dict_stocks = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1.csv'], dict_stocks)
+        sa.LoadTriplet(TEST_FILES['feb1.trp'], dict_stocks)
+        for code in ("ADV", "YOW", "BHP"):
+            for make in (stocks.AverageVolume, sa.HighLow,
+                         lambda: sa.MovingAverage(4)):
+                expected = make()
+                dict_stocks.get_stock(code).analyse(expected)
+                actual = make()
+                self.all_stocks.get_stock(code).analyse(actual)
+                self.assertEqual(actual.result(), expected.result())
+
+    def test_dates_sorted(self):
+        """ Days loaded out of order are analysed in date order
+        """
+        stock = self.all_stocks.get_stock("ADV")
+        dates = stock.get_columns().get_column("date")
+        self.assertEqual(list(dates), sorted(dates))
+        self.assertEqual(stock.get_day_data('20170130').get_date(), '20170130')
+        self.assertIsNone(stock.get_day_data('20170101'))
+
+    def test_view_follows_inserts(self):
+        """ A view keeps referring to its day when earlier days are added
+        """
+        stock = self.all_stocks.get_stock("ADV")
+        day = stock.get_day_data('20170303')
+        close = day.get_close()
+        stock.add_day_data(stocks.TradingData('20170101', 1.0, 1.0, 1.0,
+                                              1.0, 1))
+        self.assertEqual(day.get_date(), '20170303')
+        self.assertEqual(day.get_close(), close)
+
+
+class ParseCSVTest(unittest.TestCase):
+    """ Test suite for parsing whole comma-separated files into columns
+    """
+    @staticmethod
+    def add_parsed_csv(filename, all_stocks):
+        """ Add a comma-separated file to a collection through parse_csv
+        """
+        with open(filename) as file:
+            all_stocks.add_columns(sa.parse_csv(file.read()))
+
+    def test_matches_line_loading(self):
+        """ Parsed columns store the same data as line by line loading
+        """
+        line_stocks = stocks.StockCollection()
+        parsed_stocks = stocks.StockCollection(columnar=True)
+        for name in ('march1.csv', 'march4.csv'):
+            sa.LoadCSV(TEST_FILES[name], line_stocks)
+            self.add_parsed_csv(TEST_FILES[name], parsed_stocks)
+        self.assertEqual(sorted(line_stocks._all_stocks),
+                         sorted(parsed_stocks._all_stocks))
+        for code in line_stocks._all_stocks:
+            expected = line_stocks.get_stock(code).get_columns()
+            actual = parsed_stocks.get_stock(code).get_columns()
+            for name in stocks.TradingColumns.COLUMNS:
+                self.assertEqual(list(actual.get_column(name)),
+                                 list(expected.get_column(name)))
+
+    def test_small_file(self):
+        """ Parsed columns added to TradingData storage
+        """
+        all_stocks = stocks.StockCollection()
+        self.add_parsed_csv(TEST_FILES['march1_small.csv'], all_stocks)
+        volume = stocks.AverageVolume()
+        all_stocks.get_stock("1AD").analyse(volume)
+        self.assertEqual(volume.result(), 12665)
+
+    def test_stock_batches(self):
+        """ Batches added to TradingData storage in and out of date order
+        """
+        line_stocks = stocks.StockCollection()
+        parsed_stocks = stocks.StockCollection()
+        for name in ('march2.csv', 'march1.csv', 'march2.csv'):
+            sa.LoadCSV(TEST_FILES[name], line_stocks)
+            self.add_parsed_csv(TEST_FILES[name], parsed_stocks)
+        for code in line_stocks.get_stock_codes():
+            self.assertEqual(
+                parsed_stocks.get_stock(code).get_columns().get_columns(),
+                line_stocks.get_stock(code).get_columns().get_columns())
+
+    def test_invalid_file(self):
+        """ Test program raises appropriate exceptions
+        """
+        with open('stocks.py') as file:
+            with self.assertRaises(ValueError):
+                sa.parse_csv(file.read())
+
+    def test_empty_file(self):
+        """ An empty file has no data, parsed or loaded line by line
+        """
+        self.assertEqual(sa.parse_csv(""), {})
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'empty.csv')
+            open(filename, 'w').close()
+            all_stocks = stocks.StockCollection()
+            sa.LoadCSV(filename, all_stocks)
+            self.add_parsed_csv(filename, all_stocks)
+            self.assertEqual(all_stocks.get_stock_codes(), [])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_blank_line(self):
+        """ A blank line is rejected, parsed or loaded line by line
+        """
+        row = "ABC,20170301,1.0,1.2,0.9,1.1,100\n"
+        for text in (row + "\n" + row, row + "\n", "\n"):
+            with self.assertRaises(ValueError):
+                sa.parse_csv(text)
+            directory = tempfile.mkdtemp()
+            try:
+                filename = os.path.join(directory, 'blank.csv')
+                with open(filename, 'w') as file:
+                    file.write(text)
+                with self.assertRaises(RuntimeError):
+                    sa.LoadCSV(filename, stocks.StockCollection())
+            finally:
+                shutil.rmtree(directory)
+
+
+class ReadTripletsTest(unittest.TestCase):
+    """ Test suite for the streaming triplet parser
+    """
+    RECORD = ['ABC:DA:20170130', 'ABC:OP:1.5', 'ABC:HI:1.6', 'ABC:LO:1.4',
+              'ABC:CL:1.55', 'ABC:VO:1000']
+
+    def parse(self, lines):
+        return list(sa.read_triplets(io.StringIO("\n".join(lines) + "\n")))
+
+    def test_records(self):
+        """ Records are parsed whatever order their keys are in
+        """
+        expected = ('ABC', '20170130', 1.5, 1.6, 1.4, 1.55, 1000)
+        shuffled = self.RECORD[3:] + self.RECORD[:3]
+        self.assertEqual(self.parse(self.RECORD + shuffled),
+                         [expected, expected])
+
+    def test_code_changed(self):
+        """ A stock code changing mid-record is rejected with its line
+        """
+        lines = self.RECORD + self.RECORD[:2] + ['XYZ:HI:1.6']
+        with self.assertRaisesRegex(ValueError, '^line 9: stock code changed'):
+            self.parse(lines)
+
+    def test_missing_key(self):
+        """ A record with a repeated or missing key is rejected
+        """
+        lines = self.RECORD[:5] + self.RECORD[:1]
+        with self.assertRaisesRegex(ValueError, '^line 6: repeated key DA'):
+            self.parse(lines)
+        with self.assertRaisesRegex(ValueError, '^line 11: incomplete'):
+            self.parse(self.RECORD + self.RECORD[:5])
+
+    def test_invalid_value(self):
+        """ An unconvertible value is reported on its own line
+        """
+        lines = self.RECORD[:4] + ['ABC:CL:abc'] + self.RECORD[5:]
+        with self.assertRaisesRegex(ValueError, '^line 5: invalid CL'):
+            self.parse(lines)
+
+    def test_invalid_date(self):
+        """ A malformed date is reported on its own line
+        """
+        lines = self.RECORD + ['ABC:DA:2017O130'] + self.RECORD[1:]
+        with self.assertRaisesRegex(ValueError, '^line 7: invalid DA'):
+            self.parse(lines)
+        shuffled = self.RECORD[1:] + ['ABC:DA:201701301']
+        with self.assertRaisesRegex(ValueError, '^line 6: invalid DA'):
+            self.parse(shuffled)
+
+
+class LoadFilesTest(unittest.TestCase):
+    """ Test suite for loading many files into one collection
+    """
+    def test_detect_format(self):
+        """ File formats are detected from their contents
+        """
+        self.assertEqual(ingest.detect_format(TEST_FILES['march1.csv']), 'csv')
+        self.assertEqual(ingest.detect_format(TEST_FILES['feb1.trp']),
+                         'triplet')
+        with self.assertRaises(RuntimeError):
+            ingest.detect_format('stocks.py')
+
+    def test_matches_loaders(self):
+        """ Loading in worker processes gives the same data as the Loaders
+        """
+        names = ['march1.csv', 'feb1.trp', 'feb2.trp']
+        expected = stocks.StockCollection()
+        for name in names:
+            if name.endswith('.csv'):
+                sa.LoadCSV(TEST_FILES[name], expected)
+            else:
+                sa.LoadTriplet(TEST_FILES[name], expected)
+        actual = ingest.load_files([TEST_FILES[name] for name in names],
+                                   processes=2)
+        self.assertEqual(sorted(actual._all_stocks),
+                         sorted(expected._all_stocks))
+        for code in ('ADV', 'YOW', 'BHP'):
+            for name in stocks.TradingColumns.COLUMNS:
+                self.assertEqual(
+                    list(actual.get_stock(code).get_columns().get_column(name)),
+                    list(expected.get_stock(code).get_columns().get_column(name)))
+
+    def test_conflicts(self):
+        """ Duplicate days are resolved by the conflict policy
+        """
+        files = [TEST_FILES['march1.csv'], TEST_FILES['march1_small.csv']]
+        with self.assertRaises(RuntimeError):
+            ingest.load_files(files, processes=1, on_conflict=ingest.RAISE)
+        small = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1_small.csv'], small)
+        first = ingest.load_files(files[::-1], processes=1,
+                                  on_conflict=ingest.KEEP_FIRST)
+        last = ingest.load_files(files, processes=1)
+        for loaded in (first, last):
+            day = loaded.get_stock('BNR').get_day_data('20170228')
+            self.assertEqual(day.get_volume(), small.get_stock(
+                'BNR').get_day_data('20170228').get_volume())
+
+
+class SnapshotTest(unittest.TestCase):
+    """ Test suite for binary snapshots of loaded data
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.directory = tempfile.mkdtemp()
+        for name in ('march1_small.csv', 'feb1_small.trp'):
+            shutil.copy(TEST_FILES[name], self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_snapshot_reused(self):
+        """ A second load maps the snapshot written by the first
+        """
+        loaded = snapshot.load_cached(self.directory, processes=1)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, snapshot.SNAPSHOT_NAME)))
+        mapped = snapshot.load_cached(self.directory, processes=1)
+        self.assertIsInstance(mapped.get_stock('BNR').get_columns(),
+                              snapshot.MappedColumns)
+        self.assertEqual(mapped.get_stock_codes(), loaded.get_stock_codes())
+        for code in loaded.get_stock_codes():
+            volume = stocks.AverageVolume()
+            loaded.get_stock(code).analyse(volume)
+            mapped_volume = stocks.AverageVolume()
+            mapped.get_stock(code).analyse(mapped_volume)
+            self.assertEqual(mapped_volume.result(), volume.result())
+
+    def test_stale_snapshot(self):
+        """ Changing a source file invalidates the snapshot
+        """
+        snapshot.load_cached(self.directory, processes=1)
+        with open(os.path.join(self.directory, 'march1_small.csv'), 'a') as f:
+            f.write('NEW,20170306,1.0,1.0,1.0,1.0,100\n')
+        reloaded = snapshot.load_cached(self.directory, processes=1)
+        self.assertIn('NEW', reloaded.get_stock_codes())
+        self.assertNotIsInstance(reloaded.get_stock('NEW').get_columns(),
+                                 snapshot.MappedColumns)
+
+    def test_truncated_snapshot(self):
+        """ A snapshot shorter than its header describes is rebuilt
+        """
+        loaded = snapshot.load_cached(self.directory, processes=1)
+        name = os.path.join(self.directory, snapshot.SNAPSHOT_NAME)
+        sources = ingest.list_data_files(self.directory)
+        with open(name, 'rb') as file:
+            data = file.read()
+        for size in (len(data) - 16, 10):
+            with open(name, 'wb') as file:
+                file.write(data[:size])
+            self.assertIsNone(snapshot.read_snapshot(name, sources))
+        reloaded = snapshot.load_cached(self.directory, processes=1)
+        for code in loaded.get_stock_codes():
+            self.assertEqual(
+                reloaded.get_stock(code).get_columns().get_columns(),
+                loaded.get_stock(code).get_columns().get_columns())
+
+    def test_mapped_stock_can_grow(self):
+        """ Adding days to a mapped stock copies it out of the snapshot
+        """
+        snapshot.load_cached(self.directory, processes=1)
+        mapped = snapshot.load_cached(self.directory, processes=1)
+        stock = mapped.get_stock('MIL')
+        stock.add_day_data(stocks.TradingData('20170306', 1.6, 1.7, 1.5,
+                                              1.65, 1000))
+        self.assertEqual(len(stock._trading_data.keys()), 6)
+        self.assertEqual(stock.get_day_data('20170306').get_close(), 1.65)
+
+    def test_mapped_stock_copied(self):
+        """ Mapped columns are copied and pickled by value
+        """
+        snapshot.load_cached(self.directory, processes=1)
+        mapped = snapshot.load_cached(self.directory, processes=1)
+        columns = mapped.get_stock('MIL').get_columns()
+        for copied in (copy.deepcopy(columns),
+                       pickle.loads(pickle.dumps(columns)),
+                       copy.deepcopy(mapped.get_stock('MIL'))
+                       .get_columns()):
+            self.assertIs(type(copied), stocks.TradingColumns)
+            self.assertEqual(copied.get_columns(), columns.get_columns())
+
+
+class StockDateRangeTest(unittest.TestCase):
+    """ Test suite for date ordered and date range analysis
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.collections = [stocks.StockCollection(),
+                            stocks.StockCollection(columnar=True)]
+        for all_stocks in self.collections:
+            sa.LoadCSV(TEST_FILES['march2.csv'], all_stocks)
+            sa.LoadCSV(TEST_FILES['march1.csv'], all_stocks)
+
+    def test_date_order(self):
+        """ Days added out of order are kept in date order
+        """
+        for all_stocks in self.collections:
+            stock = all_stocks.get_stock("ADV")
+            dates = list(stock.get_columns().get_column("date"))
+            self.assertEqual(len(dates), 10)
+            self.assertEqual(dates, sorted(dates))
+
+    def test_date_range(self):
+        """ Only days between start and end (inclusive) are analysed
+        """
+        for all_stocks in self.collections:
+            stock = all_stocks.get_stock("ADV")
+            hl = sa.HighLow()
+            stock.analyse(hl, start='20170227', end='20170303')
+            self.assertEqual(hl.result(), (0.025, 0.023))
+            volume = stocks.AverageVolume()
+            stock.analyse(volume, start='20170302', end='20170302')
+            self.assertEqual(volume.result(),
+                             stock.get_day_data('20170302').get_volume())
+            ma = sa.MovingAverage(4)
+            stock.analyse(ma, end='20170303')
+            self.assertEqual(ma.result(), 0.02375)
+
+
+class AnalysisPipelineTest(unittest.TestCase):
+    """ Test suite for running several analysers in one pass
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.all_stocks = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1.csv'], self.all_stocks)
+
+    def make_analysers(self):
+        return [stocks.AverageVolume(), sa.HighLow(), sa.MovingAverage(4),
+                sa.GapUp(0.0009)]
+
+    def test_one_pass(self):
+        """ A pipeline gives each analyser's result in order
+        """
+        stock = self.all_stocks.get_stock("ADV")
+        pipeline = stocks.AnalysisPipeline(self.make_analysers())
+        stock.analyse(pipeline)
+        expected = []
+        for analyser in self.make_analysers():
+            stock.analyse(analyser)
+            expected.append(analyser.result())
+        results = pipeline.result()
+        self.assertEqual(results[:3], expected[:3])
+        self.assertEqual(results[3].get_date(), '20170228')
+
+    def test_collection(self):
+        """ Analysing the collection gives a result for every stock
+        """
+        results = self.all_stocks.analyse(
+            lambda: stocks.AnalysisPipeline([stocks.AverageVolume(),
+                                             sa.HighLow()]))
+        self.assertEqual(len(results), 1910)
+        self.assertEqual(results["ADV"][1], (0.025, 0.023))
+
+
+class RollingAnalysersTest(unittest.TestCase):
+    """ Test suite for the rolling window analysers
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.all_stocks = stocks.StockCollection()
+        for name in ('feb1.trp', 'feb2.trp', 'march1.csv', 'march2.csv'):
+            if name.endswith('.csv'):
+                sa.LoadCSV(TEST_FILES[name], self.all_stocks)
+            else:
+                sa.LoadTriplet(TEST_FILES[name], self.all_stocks)
+        self.stock = self.all_stocks.get_stock("BHP")
+        self.days = [self.stock.get_day_data(date)
+                     for date in self.stock._dates]
+
+    def analyse(self, analyser):
+        self.stock.analyse(analyser)
+        return analyser.result()
+
+    def test_window(self):
+        """ Running aggregates match values recalculated from scratch
+        """
+        window = rolling.RollingWindow(3)
+        values = [5014.4, 4963.1, 4932.4, 4945.5, 1.0, 7.5, 7.5]
+        for count, value in enumerate(values, start=1):
+            window.push(value)
+            last = values[max(0, count - 3):count]
+            mean = sum(last) / len(last)
+            variance = sum((x - mean) ** 2 for x in last) / len(last)
+            self.assertEqual(window.get_values(), last)
+            self.assertAlmostEqual(window.mean(), mean, places=9)
+            self.assertAlmostEqual(window.variance(), variance, places=6)
+
+    def test_averages(self):
+        """ SMA, EMA and standard deviation over the last num_days
+        """
+        closes = [day.get_close() for day in self.days]
+        for num_days in (1, 4, 10):
+            last = closes[-num_days:]
+            mean = sum(last) / num_days
+            self.assertAlmostEqual(
+                self.analyse(rolling.SimpleMovingAverage(num_days)), mean)
+            self.assertAlmostEqual(
+                self.analyse(rolling.RollingStdDev(num_days)),
+                (sum((x - mean) ** 2 for x in last) / num_days) ** 0.5)
+            lower, middle, upper = self.analyse(
+                rolling.BollingerBands(num_days))
+            self.assertAlmostEqual(middle, mean)
+            self.assertAlmostEqual(upper - middle, middle - lower)
+        ema = closes[0]
+        for close in closes[1:]:
+            ema += 0.2 * (close - ema)
+        self.assertAlmostEqual(
+            self.analyse(rolling.ExponentialMovingAverage(9)), ema)
+
+    def test_high_low(self):
+        """ Rolling extremes over the last num_days
+        """
+        for num_days in (1, 3, 7, 100):
+            last = self.days[-num_days:]
+            self.assertEqual(self.analyse(rolling.RollingHighLow(num_days)),
+                             (max(day.get_high() for day in last),
+                              min(day.get_low() for day in last)))
+
+    def test_moving_average_reset(self):
+        """ MovingAverage can be reused after reset
+        """
+        ma = sa.MovingAverage(4)
+        first = self.analyse(ma)
+        ma.reset()
+        self.assertEqual(self.analyse(ma), first)
+
+
+class ParallelAnalysisTest(unittest.TestCase):
+    """ Test suite for analysing a whole collection in worker processes
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.all_stocks = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1.csv'], self.all_stocks)
+
+    def test_matches_serial(self):
+        """ Parallel results are the same as analysing each stock in turn
+        """
+        for make_analyser in (stocks.AverageVolume, sa.HighLow):
+            self.assertEqual(
+                parallel.analyse(self.all_stocks, make_analyser, processes=2),
+                self.all_stocks.analyse(make_analyser))
+
+    def test_streaming(self):
+        """ Results are streamed for the requested codes
+        """
+        codes = ['ADV', 'BHP', 'YOW']
+        results = list(parallel.iter_analyse(
+            self.all_stocks, functools.partial(sa.GapUp, 0.0009),
+            processes=2, codes=codes))
+        self.assertEqual(sorted(code for code, _ in results), codes)
+        self.assertEqual(dict(results)['ADV'].get_date(), '20170228')
+
+
+class LiveAnalysisTest(unittest.TestCase):
+    """ Test suite for analysers attached to a stock
+    """
+    class CountingVolume(stocks.AverageVolume):
+        """ AverageVolume that counts how often it is reset
+        """
+        resets = 0
+
+        def reset(self):
+            self.resets += 1
+            super().reset()
+
+    def make_analysers(self):
+        return [self.CountingVolume(), sa.HighLow(), sa.MovingAverage(4),
+                sa.GapUp(0.0009)]
+
+    def results(self, analysers):
+        results = [analyser.result() for analyser in analysers]
+        results[3] = results[3] and results[3].get_date()
+        return results
+
+    def test_live_results(self):
+        """ Attached analysers match a fresh analysis after each load
+        """
+        for columnar in (False, True):
+            all_stocks = stocks.StockCollection(columnar=columnar)
+            stock = all_stocks.get_stock("ADV")
+            live = self.make_analysers()
+            for analyser in live:
+                stock.attach(analyser)
+            for name in ('march2.csv', 'march1.csv', 'march3.csv'):
+                sa.LoadCSV(TEST_FILES[name], all_stocks)
+                fresh = self.make_analysers()
+                for analyser in fresh:
+                    stock.analyse(analyser)
+                self.assertEqual(self.results(live), self.results(fresh))
+            # march1 arrived late, but only in new days
+            self.assertEqual(live[0].resets, 0)
+
+    def test_replaced_day(self):
+        """ Replacing a day repeats the analysis
+        """
+        all_stocks = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1_small.csv'], all_stocks)
+        stock = all_stocks.get_stock("1AD")
+        volume = self.CountingVolume()
+        stock.attach(volume)
+        stock.add_day_data(stocks.TradingData('20170228', 0.21, 0.21, 0.21,
+                                              0.21, 1000000))
+        self.assertEqual(volume.resets, 1)
+        self.assertEqual(volume.result(), (19478 + 1000000 + 10000 + 30026
+                                           + 2300) // 5)
+        stock.detach(volume)
+        stock.add_day_data(stocks.TradingData('20170306', 0.21, 0.21, 0.21,
+                                              0.21, 0))
+        self.assertEqual(volume.resets, 1)
+
+
+class ColumnAnalysisTest(unittest.TestCase):
+    """ Test suite for analysers working on whole columns
+    """
+    PAIRS = [(stocks.AverageVolume, column_analysis.ColumnAverageVolume),
+             (sa.HighLow, column_analysis.ColumnHighLow),
+             (lambda: sa.MovingAverage(4),
+              lambda: column_analysis.ColumnMovingAverage(4)),
+             (lambda: sa.MovingAverage(30),
+              lambda: column_analysis.ColumnMovingAverage(30))]
+
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.collections = [stocks.StockCollection(),
+                            stocks.StockCollection(columnar=True)]
+        for all_stocks in self.collections:
+            sa.LoadCSV(TEST_FILES['march1.csv'], all_stocks)
+            sa.LoadTriplet(TEST_FILES['feb1.trp'], all_stocks)
+
+    def test_same_results(self):
+        """ Column analysers match the per day analysers
+        """
+        for all_stocks in self.collections:
+            for code in ('ADV', 'YOW', 'BHP', 'XNJ'):
+                stock = all_stocks.get_stock(code)
+                for make_day, make_column in self.PAIRS:
+                    day_analyser = make_day()
+                    stock.analyse(day_analyser)
+                    column_analyser = make_column()
+                    stock.analyse_columns(column_analyser)
+                    self.assertEqual(column_analyser.result(),
+                                     day_analyser.result())
+                gu = sa.GapUp(0.0009)
+                stock.analyse(gu)
+                column_gu = column_analysis.ColumnGapUp(0.0009)
+                stock.analyse_columns(column_gu)
+                self.assertEqual(column_gu.result() and
+                                 column_gu.result().get_date(),
+                                 gu.result() and gu.result().get_date())
+
+    def test_as_analyser(self):
+        """ Column analysers also work one day at a time and on date ranges
+        """
+        stock = self.collections[1].get_stock('ADV')
+        hl = column_analysis.ColumnHighLow()
+        stock.analyse(hl, start='20170227')
+        self.assertEqual(hl.result(), (0.025, 0.023))
+        hl.reset()
+        stock.analyse_columns(hl, start='20170227')
+        self.assertEqual(hl.result(), (0.025, 0.023))
+        # Adding days after taking the stock's columns must not change it
+        stock.analyse(hl, end='20170203')
+        self.assertEqual(len(stock.get_columns()), 10)
+        expected = sa.HighLow()
+        stock.analyse(expected)
+        self.assertEqual(hl.result(), expected.result())
+
+
+class GapScannerTest(unittest.TestCase):
+    """ Test suite for the market-wide gap scanner
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.all_stocks = stocks.StockCollection(columnar=True)
+        sa.LoadCSV(TEST_FILES['march1.csv'], self.all_stocks)
+        self.scanner = gap_scanner.GapScanner(self.all_stocks)
+
+    def test_matches_gap_up(self):
+        """ The latest gap of a stock is the day GapUp finds
+        """
+        dates = [date for date in self.scanner.get_dates()
+                 if 'ADV' in [gap.get_code()
+                              for gap in self.scanner.gaps_on(date, 0.0009)]]
+        self.assertEqual(dates[-1], '20170228')
+
+    def test_gaps_on(self):
+        """ Gaps on a date are larger than delta, largest first
+        """
+        gaps = self.scanner.gaps_on('20170302', 0.05)
+        self.assertTrue(gaps)
+        deltas = [gap.get_delta() for gap in gaps]
+        self.assertEqual(deltas, sorted(deltas, reverse=True))
+        for gap in gaps:
+            columns = self.all_stocks.get_stock(gap.get_code()).get_columns()
+            index = columns.find(20170302)
+            self.assertGreater(columns.get_column('open')[index]
+                               - columns.get_column('close')[index - 1],
+                               0.05)
+        for gap in self.scanner.gaps_on('20170302', 0.05, down=True):
+            self.assertLess(gap.get_delta(), -0.05)
+
+    def test_top_gaps(self):
+        """ Top gaps over a range match sorting every gap
+        """
+        every = [gap for date in self.scanner.get_dates()
+                 for gap in self.scanner.gaps_on(date, float('-inf'))
+                 if '20170228' <= date <= '20170302']
+        every.sort(key=lambda gap: gap.get_delta(), reverse=True)
+        top = self.scanner.top_gaps(20, '20170228', '20170302')
+        self.assertEqual([gap.get_delta() for gap in top],
+                         [gap.get_delta() for gap in every[:20]])
+        bottom = self.scanner.top_gaps(5, '20170228', '20170302', down=True)
+        self.assertEqual([gap.get_delta() for gap in bottom],
+                         sorted(gap.get_delta() for gap in every)[:5])
+
+    def test_top_gaps_direction(self):
+        """ Top gaps only include gaps in the direction asked for
+        """
+        all_stocks = stocks.StockCollection()
+        for code, open_price in (('UP', 1.5), ('DN', 0.5), ('FLAT', 1.0)):
+            stock = all_stocks.get_stock(code)
+            stock.add_day_data(stocks.TradingData('20170301', 1.0, 1.0, 1.0,
+                                                  1.0, 100))
+            stock.add_day_data(stocks.TradingData(
+                '20170302', open_price, open_price, open_price, open_price,
+                100))
+        scanner = gap_scanner.GapScanner(all_stocks)
+        self.assertEqual([(gap.get_code(), gap.get_delta())
+                          for gap in scanner.top_gaps(5)], [('UP', 0.5)])
+        self.assertEqual([(gap.get_code(), gap.get_delta())
+                          for gap in scanner.top_gaps(5, down=True)],
+                         [('DN', -0.5)])
+        self.assertEqual(scanner.top_gaps(5, delta=0.5), [])
+
+
+class MappedLoadingTest(unittest.TestCase):
+    """ Test suite for loading files through a memory map
+    """
+    def assertSameData(self, expected, actual):
+        self.assertEqual(actual.get_stock_codes(), expected.get_stock_codes())
+        for code in expected.get_stock_codes():
+            for name in stocks.TradingColumns.COLUMNS:
+                self.assertEqual(
+                    list(actual.get_stock(code).get_columns().get_column(name)),
+                    list(expected.get_stock(code).get_columns().get_column(name)))
+
+    def test_loaders(self):
+        """ Mapped loaders load the same data as the text mode loaders
+        """
+        expected = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march4.csv'], expected)
+        sa.LoadTriplet(TEST_FILES['feb1_small.trp'], expected)
+        actual = stocks.StockCollection(columnar=True)
+        mapped_loading.MappedLoadCSV(TEST_FILES['march4.csv'], actual)
+        mapped_loading.MappedLoadTriplet(TEST_FILES['feb1_small.trp'], actual)
+        self.assertSameData(expected, actual)
+
+    def test_small_chunks(self):
+        """ Lines and records split across chunks are parsed correctly
+        """
+        for name, parse, load in (
+                ('march1_small.csv', mapped_loading.parse_mapped_csv,
+                 sa.LoadCSV),
+                ('feb1_small.trp', mapped_loading.parse_mapped_triplet,
+                 sa.LoadTriplet)):
+            expected = stocks.StockCollection()
+            load(TEST_FILES[name], expected)
+            actual = stocks.StockCollection()
+            with mapped_loading.map_file(TEST_FILES[name]) as mapping:
+                actual.add_columns(parse(mapping, chunk_size=50))
+            self.assertSameData(expected, actual)
+
+    def test_invalid_and_empty_files(self):
+        """ Invalid files raise RuntimeError and empty files load nothing
+        """
+        for loader in (mapped_loading.MappedLoadCSV,
+                       mapped_loading.MappedLoadTriplet):
+            with self.assertRaises(RuntimeError):
+                loader('stocks.py', stocks.StockCollection())
+        with tempfile.NamedTemporaryFile(suffix='.csv') as empty:
+            all_stocks = stocks.StockCollection()
+            mapped_loading.MappedLoadCSV(empty.name, all_stocks)
+            self.assertEqual(all_stocks.get_stock_codes(), [])
+
+
+class LazyStockCollectionTest(unittest.TestCase):
+    """ Test suite for loading stocks from indexed files on demand
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.files = [TEST_FILES['march1.csv'], TEST_FILES['march2.csv'],
+                      TEST_FILES['feb1.trp']]
+        self.loaded = stocks.StockCollection()
+        sa.LoadCSV(self.files[0], self.loaded)
+        sa.LoadCSV(self.files[1], self.loaded)
+        sa.LoadTriplet(self.files[2], self.loaded)
+        self.lazy = lazy_loading.LazyStockCollection(self.files,
+                                                     max_resident=3)
+
+    def test_index(self):
+        """ Every line of a file is indexed under its stock code
+        """
+        line_starts, rows_by_code = lazy_loading.index_file(self.files[0])
+        with open(self.files[0]) as file:
+            lines = file.read().split()
+        self.assertEqual(sum(map(len, rows_by_code.values())), len(lines))
+        self.assertEqual(line_starts[-1], os.path.getsize(self.files[0]))
+        for row in rows_by_code['ADV']:
+            self.assertTrue(lines[row].startswith('ADV,'))
+
+    def test_get_stock(self):
+        """ Stocks are loaded on first use and match the loaders
+        """
+        self.assertEqual(self.lazy.get_stock_codes(),
+                         self.loaded.get_stock_codes())
+        self.assertFalse(self.lazy.is_resident('ADV'))
+        for code in ['ADV'] + self.loaded.get_stock_codes()[:2]:
+            analyser = sa.HighLow()
+            self.lazy.get_stock(code).analyse(analyser)
+            expected = sa.HighLow()
+            self.loaded.get_stock(code).analyse(expected)
+            self.assertEqual(analyser.result(), expected.result())
+        self.assertTrue(self.lazy.is_resident('ADV'))
+        self.assertEqual(self.lazy.analyse(lambda: sa.MovingAverage(3)),
+                         self.loaded.analyse(lambda: sa.MovingAverage(3)))
+
+    def test_resident_bound(self):
+        """ Least recently used stocks are dropped beyond the bound
+        """
+        codes = self.lazy.get_stock_codes()[:4]
+        first = self.lazy.get_stock(codes[0])
+        for code in codes[1:]:
+            self.lazy.get_stock(code)
+        self.assertFalse(self.lazy.is_resident(codes[0]))
+        self.assertTrue(self.lazy.is_resident(codes[3]))
+        self.assertIsNot(self.lazy.get_stock(codes[0]), first)
+
+    def test_kept_stocks(self):
+        """ Added and unknown stocks are kept and see later files
+        """
+        self.lazy.add_stock(self.lazy.get_stock('ADV'))
+        new_stock = self.lazy.get_stock('NEWCODE')
+        for code in self.lazy.get_stock_codes()[:4]:
+            self.lazy.get_stock(code)
+        self.assertTrue(self.lazy.is_resident('ADV'))
+        self.assertIs(self.lazy.get_stock('NEWCODE'), new_stock)
+        self.lazy.add_file(TEST_FILES['march3.csv'])
+        sa.LoadCSV(TEST_FILES['march3.csv'], self.loaded)
+        self.assertEqual(
+            len(self.lazy.get_stock('ADV').get_columns()),
+            len(self.loaded.get_stock('ADV').get_columns()))
+
+    def test_loaders(self):
+        """ Stocks changed by Loaders are kept after other stocks are used
+        """
+        for columnar in (True, False):
+            lazy = lazy_loading.LazyStockCollection(self.files[:1],
+                                                    max_resident=3,
+                                                    columnar=columnar)
+            sa.LoadCSV(self.files[1], lazy)
+            sa.LoadTriplet(self.files[2], lazy)
+            for code in self.loaded.get_stock_codes()[:4]:
+                lazy.get_stock(code)
+            for code in self.loaded.get_stock_codes():
+                self.assertEqual(
+                    lazy.get_stock(code).get_columns().get_columns(),
+                    self.loaded.get_stock(code).get_columns().get_columns())
+
+
+class CompactTradingDataTest(unittest.TestCase):
+    """ Test suite for compact trading data records and batches
+    """
+    def test_trading_data(self):
+        """ TradingData has no attribute dictionary and round-trips dates
+        """
+        day = stocks.TradingData('20170301', 1.0, 2.0, 0.5, 1.5, 100)
+        self.assertFalse(hasattr(day, '__dict__'))
+        self.assertEqual(day.get_date(), '20170301')
+        day.set_date('20170302')
+        self.assertEqual(day.get_date(), '20170302')
+        with self.assertRaises(ValueError):
+            stocks.TradingData('March', 1.0, 2.0, 0.5, 1.5, 100)
+        for date in ('201703', '2017_03_01', ' 20170301', '+20170301',
+                     '2017030\uff11'):
+            with self.assertRaises(ValueError):
+                stocks.TradingData(date, 1.0, 2.0, 0.5, 1.5, 100)
+            with self.assertRaises(ValueError):
+                day.set_date(date)
+            with self.assertRaises(ValueError):
+                stocks.encode_date(date)
+        self.assertEqual(day.get_date(), '20170302')
+        self.assertEqual(stocks.encode_date('20170301'), 20170301)
+
+    def test_columns_as_days(self):
+        """ Rows of TradingColumns can be processed like TradingData
+        """
+        columns = stocks.TradingColumns()
+        columns.append(20170301, 1.0, 2.0, 0.5, 1.5, 100)
+        columns.append(20170302, 1.5, 3.0, 1.0, 2.5, 300)
+        self.assertEqual(columns[-1].get_date(), '20170302')
+        self.assertEqual(columns[0].get_high(), 2.0)
+        with self.assertRaises(IndexError):
+            columns[2]
+        analyser = sa.HighLow()
+        for day in columns:
+            analyser.process(day)
+        self.assertEqual(analyser.result(), (3.0, 0.5))
+
+
+class CompressedLoadingTest(unittest.TestCase):
+    """ Test suite for loading gzip, bz2 and xz compressed files
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.directory = tempfile.mkdtemp()
+        self.files = {}
+        for name in ('march1.csv', 'feb1_small.trp'):
+            with open(TEST_FILES[name], 'rb') as file:
+                data = file.read()
+            for extension, module in (('gz', gzip), ('bz2', bz2),
+                                      ('xz', lzma)):
+                filename = os.path.join(self.directory,
+                                        name + '.' + extension)
+                with open(filename, 'wb') as file:
+                    file.write(module.compress(data))
+                self.files[filename] = name
+
+    def tearDown(self):
+        """ Clean up after each test
+        """
+        shutil.rmtree(self.directory)
+
+    def test_detect_compression(self):
+        """ Compression is detected from the file contents
+        """
+        self.assertIsNone(stocks.detect_compression(TEST_FILES['march1.csv']))
+        names = {'gz': 'gzip', 'bz2': 'bz2', 'xz': 'xz'}
+        for filename in self.files:
+            self.assertEqual(stocks.detect_compression(filename),
+                             names[filename.rsplit('.', 1)[1]])
+
+    def test_loaders(self):
+        """ Compressed files load the same data as plain files
+        """
+        for filename, name in self.files.items():
+            loader = sa.LoadCSV if name.endswith('.csv') else sa.LoadTriplet
+            expected = stocks.StockCollection()
+            loader(TEST_FILES[name], expected)
+            actual = stocks.StockCollection()
+            loader(filename, actual)
+            self.assertEqual(actual.analyse(stocks.AverageVolume),
+                             expected.analyse(stocks.AverageVolume))
+            loaded = ingest.load_files([filename], processes=1)
+            self.assertEqual(loaded.analyse(stocks.AverageVolume),
+                             expected.analyse(stocks.AverageVolume))
+
+    def test_lazy_loading(self):
+        """ Compressed files cannot be indexed for lazy loading
+        """
+        with self.assertRaises(RuntimeError):
+            lazy_loading.LazyStockCollection(list(self.files))
+
+
+class DatabaseStockCollectionTest(unittest.TestCase):
+    """ Test suite for stock market data stored in an SQLite database
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'stocks.db')
+        self.expected = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1.csv'], self.expected)
+        sa.LoadTriplet(TEST_FILES['feb1_small.trp'], self.expected)
+        database = stock_database.DatabaseStockCollection(self.filename)
+        ParseCSVTest.add_parsed_csv(TEST_FILES['march1.csv'], database)
+        sa.LoadTriplet(TEST_FILES['feb1_small.trp'], database)
+        database.close()
+        self.database = stock_database.DatabaseStockCollection(self.filename)
+
+    def tearDown(self):
+        """ Clean up after each test
+        """
+        self.database.close()
+        shutil.rmtree(self.directory)
+
+    def test_persisted(self):
+        """ Data added in one connection can be analysed in another
+        """
+        self.assertEqual(self.database.get_stock_codes(),
+                         self.expected.get_stock_codes())
+        for make_analyser in (stocks.AverageVolume, sa.HighLow,
+                              lambda: sa.MovingAverage(3)):
+            self.assertEqual(self.database.analyse(make_analyser),
+                             self.expected.analyse(make_analyser))
+        self.assertEqual(
+            self.database.analyse(sa.HighLow, '20170301', '20170301'),
+            self.expected.analyse(sa.HighLow, '20170301', '20170301'))
+
+    def test_stock(self):
+        """ Database stocks support the Stock interface
+        """
+        stock = self.database.get_stock('ADV')
+        expected = self.expected.get_stock('ADV')
+        analyser = sa.HighLow()
+        stock.analyse(analyser)
+        expected_analyser = sa.HighLow()
+        expected.analyse(expected_analyser)
+        self.assertEqual(analyser.result(), expected_analyser.result())
+        self.assertEqual(stock.get_day_data('20170301').get_close(),
+                         expected.get_day_data('20170301').get_close())
+        self.assertIsNone(stock.get_day_data('19990101'))
+        volume = stocks.AverageVolume()
+        stock.attach(volume)
+        stock.add_day_data(stocks.TradingData('20170401', 1.0, 1.0, 1.0,
+                                              1.0, 0))
+        expected.add_day_data(stocks.TradingData('20170401', 1.0, 1.0, 1.0,
+                                                 1.0, 0))
+        expected_volume = stocks.AverageVolume()
+        expected.analyse(expected_volume)
+        self.assertEqual(volume.result(), expected_volume.result())
+
+    def test_add_stock(self):
+        """ Adding a stock replaces the stored data for its code
+        """
+        stock = stocks.Stock('ADV')
+        stock.add_day_data(stocks.TradingData('20170401', 1.0, 2.0, 0.5,
+                                              1.5, 10))
+        self.database.add_stock(stock)
+        self.assertEqual(len(self.database.get_stock('ADV').get_columns()), 1)
+        self.assertEqual(self.database.analyse(sa.HighLow)['ADV'], (2.0, 0.5))
+
+
+class SharedStockCollectionTest(unittest.TestCase):
+    """ Test suite for stock market data in shared memory
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.all_stocks = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1.csv'], self.all_stocks)
+        sa.LoadTriplet(TEST_FILES['feb1_small.trp'], self.all_stocks)
+        self.shared = shared_stocks.SharedStockCollection.share(
+            self.all_stocks)
+
+    def tearDown(self):
+        """ Clean up after each test
+        """
+        self.shared.close()
+
+    def test_attach(self):
+        """ Attached collections see the same data, read-only
+        """
+        attached = shared_stocks.SharedStockCollection(
+            self.shared.get_handle())
+        self.assertEqual(attached.get_stock_codes(),
+                         self.all_stocks.get_stock_codes())
+        for make_analyser in (stocks.AverageVolume, sa.HighLow,
+                              lambda: sa.MovingAverage(3)):
+            self.assertEqual(attached.analyse(make_analyser),
+                             self.all_stocks.analyse(make_analyser))
+        day = attached.get_stock('ADV').get_day_data('20170301')
+        with self.assertRaises(TypeError):
+            day.set_close(1.0)
+        del day
+        attached.close()
+
+    def test_add_day_copies(self):
+        """ Adding a day to a shared stock does not change the shared data
+        """
+        stock = self.shared.get_stock('ADV')
+        days = len(stock.get_columns())
+        stock.add_day_data(stocks.TradingData('20170401', 1.0, 1.0, 1.0,
+                                              1.0, 10))
+        self.assertEqual(len(stock.get_columns()), days + 1)
+        attached = shared_stocks.SharedStockCollection(
+            self.shared.get_handle())
+        self.assertEqual(len(attached.get_stock('ADV').get_columns()), days)
+        attached.close()
+        del stock
+
+    def test_parallel_analysis(self):
+        """ Worker processes analyse the shared data
+        """
+        handle = self.shared.get_handle()
+        self.assertEqual(shared_stocks.analyse(handle, sa.HighLow,
+                                               processes=2),
+                         self.all_stocks.analyse(sa.HighLow))
+        codes = handle.get_codes()[:3]
+        self.assertEqual(
+            shared_stocks.analyse(handle, stocks.AverageVolume, processes=2,
+                                  codes=codes),
+            {code: result for code, result in
+             self.all_stocks.analyse(stocks.AverageVolume).items()
+             if code in codes})
+
+    def test_parallel_gap_up(self):
+        """ Results referring to shared days are returned by worker processes
+        """
+        handle = self.shared.get_handle()
+        expected = {code: None if day is None else day.get_date()
+                    for code, day in self.all_stocks.analyse(
+                        functools.partial(sa.GapUp, 0.01)).items()}
+        for make_analyser in (functools.partial(sa.GapUp, 0.01),
+                              functools.partial(column_analysis.ColumnGapUp,
+                                                0.01)):
+            results = shared_stocks.analyse(handle, make_analyser,
+                                            processes=2)
+            self.assertEqual({code: None if day is None else day.get_date()
+                              for code, day in results.items()}, expected)
+        results = shared_stocks.analyse(
+            handle, functools.partial(sweep.GapUpSweep, [0.01]), processes=2)
+        self.assertEqual({code: None if days[0.01] is None
+                          else days[0.01].get_date()
+                          for code, days in results.items()}, expected)
+
+    def test_close_in_use(self):
+        """ A failed close leaves the collection attached and unchanged
+        """
+        unraisable = []
+        hook, sys.unraisablehook = sys.unraisablehook, unraisable.append
+        try:
+            stock = self.shared.get_stock('ADV')
+            closes = self.shared.get_stock('BNR').get_columns().get_column(
+                'close')
+            copied = self.shared.get_stock('BHP')
+            copied.add_day_data(stocks.TradingData('20170401', 1.0, 1.0, 1.0,
+                                                   1.0, 10))
+            with self.assertRaises(BufferError):
+                self.shared.close()
+            self.assertEqual(self.shared.get_stock_codes(),
+                             self.all_stocks.get_stock_codes())
+            self.assertIs(self.shared.get_stock('ADV'), stock)
+            self.assertIs(self.shared.get_stock('BHP'), copied)
+            results = self.shared.analyse(sa.HighLow)
+            expected = self.all_stocks.analyse(sa.HighLow)
+            del results['BHP'], expected['BHP']
+            self.assertEqual(results, expected)
+            del stock, closes
+            gc.collect()
+            self.shared.close()
+            gc.collect()
+        finally:
+            sys.unraisablehook = hook
+        self.assertEqual(unraisable, [])
+
+
+class ResampleTest(unittest.TestCase):
+    """ Test suite for resampling daily data into bars
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.columns = stocks.TradingColumns()
+        # Wednesday 1 March 2017 to Tuesday 7 March, without the weekend.
+        for date, high, low, volume in ((20170301, 2.0, 1.0, 10),
+                                         (20170302, 3.0, 1.5, 20),
+                                         (20170303, 2.5, 0.5, 30),
+                                         (20170306, 4.0, 2.0, 40),
+                                         (20170307, 3.5, 3.0, 50)):
+            self.columns.append(date, low + 0.25, high, low, high - 0.25,
+                                volume)
+
+    def test_weekly(self):
+        """ Weekly bars split on Mondays
+        """
+        bars = resample.resample_columns(self.columns, resample.WEEKLY)
+        self.assertEqual(list(bars.get_row(0)),
+                         [20170303, 1.25, 3.0, 0.5, 2.25, 60])
+        self.assertEqual(list(bars.get_row(1)),
+                         [20170307, 2.25, 4.0, 2.0, 3.25, 90])
+
+    def test_monthly_and_days(self):
+        """ Monthly and N-day bars cover the right days
+        """
+        bars = resample.resample_columns(self.columns, resample.MONTHLY)
+        self.assertEqual(list(bars.get_row(0)),
+                         [20170307, 1.25, 4.0, 0.5, 3.25, 150])
+        bars = resample.resample_columns(self.columns, 2)
+        self.assertEqual(list(bars.get_column('date')),
+                         [20170302, 20170306, 20170307])
+        self.assertEqual(list(bars.get_column('volume')), [30, 70, 50])
+        with self.assertRaises(ValueError):
+            resample.resample_columns(self.columns, 0)
+
+    def test_incremental(self):
+        """ A Resampler attached to a stock matches resampling in one go
+        """
+        all_stocks = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1.csv'], all_stocks)
+        bars = resample.resample_collection(all_stocks, resample.WEEKLY)
+        self.assertEqual(bars.get_stock_codes(),
+                         all_stocks.get_stock_codes())
+        stock = all_stocks.get_stock('ADV')
+        resampler = resample.Resampler(resample.WEEKLY)
+        stock.attach(resampler)
+        sa.LoadCSV(TEST_FILES['march2.csv'], all_stocks)
+        self.assertEqual(
+            resampler.result().get_columns(),
+            resample.resample_stock(stock, resample.WEEKLY)
+            .get_columns().get_columns())
+
+
+class LoadTicksTest(unittest.TestCase):
+    """ Test suite for aggregating trade ticks into days
+    """
+    TICKS = ("AAA,20170301100000,1.00,100\n"
+             "BBB,20170301100001,5.00,10\n"
+             "AAA,20170301110000,1.20,200\n"
+             "\n"
+             "AAA,20170301120000,0.90,300\n"
+             "BBB,20170302100000,5.50,20\n"
+             "AAA,20170302100000,1.10,50\n"
+             "BBB,20170302150000,5.25,30\n")
+
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'ticks.txt')
+
+    def tearDown(self):
+        """ Clean up after each test
+        """
+        shutil.rmtree(self.directory)
+
+    def load(self, text):
+        with open(self.filename, 'w') as file:
+            file.write(text)
+        all_stocks = stocks.StockCollection()
+        ticks.LoadTicks(self.filename, all_stocks)
+        return all_stocks
+
+    def test_days(self):
+        """ Ticks are summarised into one day per stock and date
+        """
+        all_stocks = self.load(self.TICKS)
+        self.assertEqual(all_stocks.get_stock_codes(), ['AAA', 'BBB'])
+        day = all_stocks.get_stock('AAA').get_day_data('20170301')
+        self.assertEqual((day.get_open(), day.get_high(), day.get_low(),
+                          day.get_close(), day.get_volume()),
+                         (1.0, 1.2, 0.9, 0.9, 600))
+        day = all_stocks.get_stock('BBB').get_day_data('20170302')
+        self.assertEqual((day.get_open(), day.get_high(), day.get_low(),
+                          day.get_close(), day.get_volume()),
+                         (5.5, 5.5, 5.25, 5.25, 50))
+
+    def test_blocks(self):
+        """ Days are the same however the ticks are split into blocks
+        """
+        expected = self.load(self.TICKS)
+        lines = self.TICKS.splitlines(True)
+        for size in (1, 2, 3):
+            all_stocks = stocks.StockCollection()
+            aggregator = ticks.TickAggregator(all_stocks)
+            for first in range(0, len(lines), size):
+                aggregator.process_lines(lines[first:first + size])
+            aggregator.close_day()
+            for make_analyser in (sa.HighLow, stocks.AverageVolume):
+                self.assertEqual(all_stocks.analyse(make_analyser),
+                                 expected.analyse(make_analyser))
+
+    def test_invalid(self):
+        """ Invalid and out of order ticks raise RuntimeError
+        """
+        for text, line in (("AAA,20170301100000,1.0\n", 1),
+                           (self.TICKS + "AAA,2017,1.0,1\n", 9),
+                           (self.TICKS + "AAA,20170302100000,x,1\n", 9),
+                           (self.TICKS + "AAA,20170301100000,1.0,1\n", 9)):
+            with self.assertRaises(RuntimeError) as context:
+                self.load(text)
+            self.assertTrue(str(context.exception)
+                            .startswith('line {0}:'.format(line)))
+
+
+class RankingTest(unittest.TestCase):
+    """ Test suite for ranking stocks by analyser results
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.all_stocks = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1.csv'], self.all_stocks)
+        sa.LoadCSV(TEST_FILES['march2.csv'], self.all_stocks)
+
+    def expected(self, make_analyser, score, count, largest=True):
+        scores = [(score(result), code) for code, result in
+                  self.all_stocks.analyse(make_analyser).items()
+                  if score(result) is not None]
+        scores.sort(key=lambda item: (-item[0] if largest else item[0],
+                                      item[1]))
+        return [(code, value) for value, code in scores[:count]]
+
+    def test_rank(self):
+        """ Several rankings found in one pass match full sorts
+        """
+        keys = [ranking.RankingKey('volume', stocks.AverageVolume),
+                ranking.RankingKey('range', sa.HighLow,
+                                   score=lambda result: result[0] - result[1],
+                                   largest=False),
+                ranking.RankingKey('movers', functools.partial(
+                    ranking.PriceChange, 1))]
+        results = ranking.rank(self.all_stocks, keys, 10)
+        self.assertEqual(
+            [(str(stock), score) for stock, score in results['volume']],
+            self.expected(stocks.AverageVolume, lambda result: result, 10))
+        self.assertEqual(
+            [(str(stock), score) for stock, score in results['range']],
+            self.expected(sa.HighLow, lambda result: result[0] - result[1],
+                          10, largest=False))
+        self.assertEqual(
+            [(str(stock), score) for stock, score in results['movers']],
+            self.expected(functools.partial(ranking.PriceChange, 1),
+                          lambda result: result, 10))
+        self.assertIsInstance(results['volume'][0][0], stocks.Stock)
+
+    def test_price_change(self):
+        """ PriceChange covers the latest days only
+        """
+        change = ranking.PriceChange(1)
+        for close in (1.0, 2.0, 4.0):
+            change.process(stocks.TradingData('20170301', close, close,
+                                              close, close, 1))
+        self.assertEqual(change.result(), 1.0)
+        change.reset()
+        self.assertIsNone(change.result())
+
+    def test_date_range(self):
+        """ Stocks without days in the range are not ranked
+        """
+        keys = [ranking.RankingKey('volume', stocks.AverageVolume)]
+        results = ranking.rank(self.all_stocks, keys, 5,
+                               start='20990101')
+        self.assertEqual(results, {'volume': []})
+
+
+class CorrelationTest(unittest.TestCase):
+    """ Test suite for covariance and correlation of returns
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.all_stocks = stocks.StockCollection()
+        # Returns: AAA +10%, -10%; BBB +20%, -20%; CCC misses the second day.
+        for code, closes in (('AAA', (1.0, 1.1, 0.99)),
+                             ('BBB', (2.0, 2.4, 1.92)),
+                             ('CCC', (1.0, None, 1.2))):
+            stock = self.all_stocks.get_stock(code)
+            for date, close in zip(('20170301', '20170302', '20170303'),
+                                   closes):
+                if close is not None:
+                    stock.add_day_data(stocks.TradingData(
+                        date, close, close, close, close, 1))
+
+    def test_complete_series(self):
+        """ Perfectly correlated complete series
+        """
+        codes, matrix = correlation.correlation_matrix(
+            self.all_stocks, ['AAA', 'BBB'])
+        self.assertEqual(codes, ['AAA', 'BBB'])
+        self.assertAlmostEqual(matrix[0][1], 1.0)
+        self.assertAlmostEqual(matrix[1][0], 1.0)
+        codes, matrix = correlation.covariance_matrix(
+            self.all_stocks, ['AAA', 'BBB'])
+        self.assertAlmostEqual(matrix[0][0], 0.02)
+        self.assertAlmostEqual(matrix[0][1], 0.04)
+
+    def test_missing_days(self):
+        """ Each missing day policy uses the right dates
+        """
+        returns = correlation.ReturnMatrix(self.all_stocks,
+                                           missing=correlation.FILL)
+        # CCC's filled returns are 0% then +20%.
+        self.assertAlmostEqual(returns.correlation(0, 2), -1.0)
+        returns = correlation.ReturnMatrix(self.all_stocks,
+                                           missing=correlation.DROP)
+        self.assertEqual(returns.get_dates(), [])
+        self.assertTrue(math.isnan(returns.covariance(0, 1)))
+        returns = correlation.ReturnMatrix(self.all_stocks,
+                                           missing=correlation.PAIRWISE)
+        self.assertEqual(returns.get_dates(), ['20170302', '20170303'])
+        self.assertTrue(math.isnan(returns.correlation(0, 2)))
+        self.assertAlmostEqual(returns.correlation(0, 1), 1.0)
+
+    def test_blocks(self):
+        """ Blocks of any size give the same matrix
+        """
+        all_stocks = stocks.StockCollection()
+        sa.LoadCSV(TEST_FILES['march1.csv'], all_stocks)
+        sa.LoadCSV(TEST_FILES['march2.csv'], all_stocks)
+        returns = correlation.ReturnMatrix(
+            all_stocks, all_stocks.get_stock_codes()[:20])
+        expected = returns.matrix(correlation.COVARIANCE, block_size=20)
+        actual = returns.matrix(correlation.COVARIANCE, block_size=3)
+        self.assertEqual(
+            [[value for value in row if not math.isnan(value)]
+             for row in actual],
+            [[value for value in row if not math.isnan(value)]
+             for row in expected])
+
+
+class BacktestTest(unittest.TestCase):
+    """ Test suite for backtesting trading rules
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.columns = stocks.TradingColumns()
+        for date, open_price, close in (('20170301', 1.0, 1.0),
+                                        ('20170302', 1.5, 2.0),
+                                        ('20170303', 2.5, 3.0),
+                                        ('20170306', 3.0, 2.0)):
+            self.columns.append(stocks.encode_date(date), open_price,
+                                max(open_price, close),
+                                min(open_price, close), close, 100)
+
+    def test_next_open(self):
+        """ Signals are filled at the next day's open
+        """
+        signals = backtest.gap_up_signals(self.columns, 0.25)
+        self.assertEqual(list(signals), [0.0, 1.0, 1.0, 0.0])
+        result = backtest.backtest(self.columns, signals, 'AAA',
+                                   fee=0.01, quantity=10)
+        self.assertEqual(list(result.get_positions()), [0, 0, 10, 10])
+        trades = result.get_trades()
+        self.assertEqual(len(trades), 1)
+        self.assertEqual(trades[0].get_date(), '20170303')
+        self.assertEqual(trades[0].get_price(), 2.5)
+        self.assertAlmostEqual(trades[0].get_fee(), 0.25)
+        self.assertAlmostEqual(result.get_profit(), -5.25)
+
+    def test_close(self):
+        """ Signals are filled at the same day's close
+        """
+        signals = backtest.gap_up_signals(self.columns, 0.25)
+        result = backtest.backtest(self.columns, signals,
+                                   fill=backtest.CLOSE)
+        self.assertEqual(list(result.get_equity()), [0.0, 0.0, 1.0, 0.0])
+        self.assertEqual([trade.get_quantity()
+                          for trade in result.get_trades()], [1.0, -1.0])
+        with self.assertRaises(ValueError):
+            backtest.backtest(self.columns, signals[:2])
+
+    def test_crossover_matches_analyser(self):
+        """ Crossover signals agree with MovingAverage
+        """
+        all_stocks = stocks.StockCollection(columnar=True)
+        sa.LoadCSV(TEST_FILES['march1.csv'], all_stocks)
+        sa.LoadCSV(TEST_FILES['march2.csv'], all_stocks)
+        sa.LoadCSV(TEST_FILES['march3.csv'], all_stocks)
+        columns = all_stocks.get_stock('ADV').get_columns()
+        signals = backtest.crossover_signals(columns, 2, 5)
+        fast = backtest.analyser_signals(
+            columns, lambda: sa.MovingAverage(2), lambda result, day: result)
+        slow = backtest.analyser_signals(
+            columns, lambda: sa.MovingAverage(5), lambda result, day: result)
+        self.assertEqual(list(signals),
+                         [1.0 if index >= 4 and fast[index] > slow[index]
+                          else 0.0 for index in range(len(columns))])
+
+    def test_collection(self):
+        """ Portfolio equity is the sum of each stock's equity
+        """
+        all_stocks = stocks.StockCollection(columnar=True)
+        sa.LoadCSV(TEST_FILES['march1.csv'], all_stocks)
+        sa.LoadCSV(TEST_FILES['march2.csv'], all_stocks)
+        results = backtest.backtest_collection(
+            all_stocks, functools.partial(backtest.gap_up_signals,
+                                          delta=0.01),
+            fill=backtest.CLOSE)
+        self.assertEqual(set(results), set(all_stocks.get_stock_codes()))
+        dates, equity = backtest.portfolio_equity(results.values())
+        self.assertEqual(len(dates), len(equity))
+        self.assertAlmostEqual(equity[-1], sum(
+            result.get_profit() for result in results.values()))
+
+
+class SweepTest(unittest.TestCase):
+    """ Test suite for parameter sweeps
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.all_stocks = stocks.StockCollection(columnar=True)
+        sa.LoadCSV(TEST_FILES['march1.csv'], self.all_stocks)
+        sa.LoadCSV(TEST_FILES['march2.csv'], self.all_stocks)
+        self.codes = self.all_stocks.get_stock_codes()[:50]
+
+    def test_gap_up_sweep(self):
+        """ GapUpSweep finds the same days as a GapUp for each delta
+        """
+        deltas = [0.0, 0.001, 0.01, 0.05, 1.0, 100.0]
+        expected = sweep.sweep(
+            self.all_stocks, functools.partial(sweep.ParameterSweep,
+                                               sa.GapUp, deltas),
+            processes=1, codes=self.codes)
+        actual = sweep.sweep(
+            self.all_stocks, functools.partial(sweep.GapUpSweep, deltas),
+            processes=1, codes=self.codes)
+        self.assertEqual(set(actual), set(deltas))
+        for delta in deltas:
+            for code in self.codes:
+                day = expected[delta][code]
+                self.assertEqual(
+                    None if day is None else day.get_date(),
+                    None if actual[delta][code] is None
+                    else actual[delta][code].get_date())
+
+    def test_moving_average_sweep(self):
+        """ MovingAverageSweep matches a MovingAverage for each window
+        """
+        windows = [1, 3, 10, 50]
+        actual = sweep.sweep(
+            self.all_stocks, functools.partial(sweep.MovingAverageSweep,
+                                               windows),
+            processes=1, codes=self.codes, end='20170305')
+        for num_days in windows:
+            for code in self.codes:
+                analyser = sa.MovingAverage(num_days)
+                self.all_stocks.get_stock(code).analyse(analyser,
+                                                        end='20170305')
+                self.assertAlmostEqual(actual[num_days][code],
+                                       analyser.result())
+
+    def test_processes(self):
+        """ Worker processes give the same results
+        """
+        make_sweep = functools.partial(sweep.MovingAverageSweep, [2, 5])
+        self.assertEqual(
+            sweep.sweep(self.all_stocks, make_sweep, processes=2,
+                        codes=self.codes),
+            sweep.sweep(self.all_stocks, make_sweep, processes=1,
+                        codes=self.codes))
+
+
+class PartitionedStocksTest(unittest.TestCase):
+    """ Test suite for analysing stocks one partition at a time
+    """
+    def setUp(self):
+        """ Setup work before each test
+        """
+        self.directory = tempfile.mkdtemp()
+        self.files = [TEST_FILES['march1.csv'], TEST_FILES['feb1.trp'],
+                      TEST_FILES['march2.csv']]
+        self.expected = ingest.load_files(self.files, processes=1)
+
+    def tearDown(self):
+        """ Cleanup work after each test
+        """
+        shutil.rmtree(self.directory)
+
+    def test_analyse(self):
+        """ Partitioned analysis matches analysing the whole collection
+        """
+        stocks_on_disk = partitioned.PartitionedStocks(self.directory, 8)
+        stocks_on_disk.add_files(self.files)
+        self.assertEqual(stocks_on_disk.get_stock_codes(),
+                         self.expected.get_stock_codes())
+        partitions = stocks_on_disk.get_partitions(300000)
+        self.assertGreater(len(partitions), 1)
+        self.assertEqual(sorted(bucket for buckets in partitions
+                                for bucket in buckets), list(range(8)))
+        self.assertEqual(stocks_on_disk.analyse(sa.HighLow, 300000),
+                         self.expected.analyse(sa.HighLow))
+        make_analyser = functools.partial(sa.MovingAverage, 3)
+        self.assertEqual(
+            stocks_on_disk.analyse(make_analyser, start='20170301'),
+            self.expected.analyse(make_analyser, start='20170301'))
+
+    def test_partitions_by_code(self):
+        """ Each stock's rows are all in its own bucket
+        """
+        stocks_on_disk = partitioned.PartitionedStocks(self.directory, 4)
+        stocks_on_disk.add_files(self.files)
+        for buckets in stocks_on_disk.get_partitions(0):
+            self.assertEqual(len(buckets), 1)
+            partition = stocks_on_disk.load_partition(buckets)
+            for code in partition.get_stock_codes():
+                self.assertEqual(partitioned.bucket_of(code, 4), buckets[0])
+                self.assertEqual(
+                    len(partition.get_stock(code).get_columns()),
+                    len(self.expected.get_stock(code).get_columns()))
+
+    def test_reopen(self):
+        """ Buckets are kept between uses of a directory
+        """
+        partitioned.PartitionedStocks(self.directory, 4).add_files(
+            self.files[:2])
+        stocks_on_disk = partitioned.PartitionedStocks(self.directory, 4)
+        stocks_on_disk.add_files(self.files[2:])
+        self.assertEqual(stocks_on_disk.analyse(sa.AverageVolume),
+                         self.expected.analyse(sa.AverageVolume))
+        with self.assertRaises(RuntimeError):
+            partitioned.PartitionedStocks(self.directory, 8)
+
+
 if __name__ == '__main__':
     print("Tests version:", VERSION)
     unittest.main()